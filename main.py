@@ -1,38 +1,179 @@
 # file: python main.py -i 'example.jpeg' -n '99pay'
 # directory: python main.py -i 'z'
-# optional: -o 'output/' --ollama
+# optional: -o 'output/' --ollama --workers 8 | --pipeline --match-workers 8
 import argparse
 import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-from src.usecases.load_templates import load_bank_templates
-from src.usecases.matcher import match_template
-from src.usecases.masking import mask_file
-from src.usecases.guardrails import execute_guardrails
+from src.usecases.guardrail_batch import GuardrailBatcher
+from src.usecases.journal import Journal, get_journal_key
+from src.usecases.guardrail_policy import SAMPLE_AFTER_PASSES, SAMPLE_EVERY
+from src.usecases.local_guardrails import (
+    PRECHECK_AMBIGUOUS,
+    PRECHECK_LEAK,
+    PRECHECK_PASS,
+)
+from src.usecases.match_cache import MATCH_CACHE_PATH
+from src.usecases.load_templates import get_template_set_version
+from src.usecases.pipeline import (
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_STAGE_WORKERS,
+    STATUS_PASSED,
+    STATUS_SKIPPED,
+    create_job,
+    print_stage_report,
+    run_pipeline,
+    run_stages,
+)
+from src.utils.hashing import sha256_file
 
+SUPPORTED_EXTENSIONS = [".png", ".jpg", ".jpeg", ".pdf"]
 
-def execute(input_path, bank_name, extension, output_path, use_ollama=False):
-    templates = load_bank_templates(bank_name, extension)
-    match = match_template(input_path, templates=templates, use_ollama=use_ollama)
-    if not match:
-        print("no matching template found")
-        return None
 
-    print(f"matched template: {match['name']}{match['file_extension']}")
+def execute(
+    input_path, bank_name, extension, output_path, use_ollama=False, options=None
+):
+    job = create_job(input_path, bank_name, extension, output_path)
+    run_stages(job, {**(options or {}), "use_ollama": use_ollama})
+    return job["status"]
 
-    if not mask_file(input_path, match["coordinates"], output_path):
-        print("error masking file")
-        return None
 
-    guardrails = execute_guardrails(output_path, use_ollama)
-    if guardrails["has_sensitive_data"]:
-        print("guardrails check failed")
-        # TODO: decide if we want to keep or delete the output file by argument
-        # os.remove(output_path)
-        return None
+def collect_directory_jobs(input_path, output_dir):
+    jobs = []
+    for root, dirs, files in os.walk(input_path):
+        dirs.sort()
+        for file in sorted(files):
+            _, ext = os.path.splitext(file)
+            if ext.lower() not in SUPPORTED_EXTENSIONS:
+                print(f"skipping unsupported file type: {file}")
+                continue
 
-    print("guardrails check passed")
-    # TODO: decide if we want to keep or delete the output file by argument
-    # os.remove(input_path)
+            file_path = os.path.join(root, file)
+
+            # Extract bank name from path structure: /user/bank/files
+            rel_path = os.path.relpath(file_path, input_path)
+            parts = rel_path.split(os.sep)
+
+            if len(parts) < 2:
+                print(f"invalid path structure: {file_path}")
+                continue
+            bank_name = parts[1]
+            user_name = parts[0]
+
+            output_path = f"{output_dir}/{user_name}/{bank_name}/{file}"
+            jobs.append(
+                create_job(file_path, bank_name, ext, os.path.realpath(output_path))
+            )
+    return jobs
+
+
+def prepare_resume(jobs, journal, resume=True):
+    template_versions = {}
+    pending_jobs = []
+    for job in jobs:
+        bank_name = job["bank_name"]
+        if bank_name not in template_versions:
+            template_versions[bank_name] = get_template_set_version(bank_name)
+
+        job["journal_key"] = get_journal_key(
+            sha256_file(job["input_path"]), template_versions[bank_name]
+        )
+        if (
+            resume
+            and journal.is_completed(job["journal_key"])
+            and os.path.exists(job["output_path"])
+        ):
+            job["status"] = STATUS_SKIPPED
+            continue
+        pending_jobs.append(job)
+
+    skipped = len(jobs) - len(pending_jobs)
+    if skipped:
+        print(f"⏭️  skipping {skipped} file(s) already completed in {journal.path}")
+    return pending_jobs
+
+
+def run_jobs(jobs, options, workers=1):
+    if workers <= 1:
+        for job in jobs:
+            run_stages(job, options)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda job: run_stages(job, options), jobs))
+    return jobs
+
+
+def print_summary(results, input_path, batch_stats=None):
+    counts = Counter(result["status"] for result in results)
+
+    print(f"\n{'=' * 60}")
+    print("📋 SUMMARY")
+    print(f"{'=' * 60}")
+    for status in sorted(counts.keys()):
+        print(f"{status:<20} : {counts[status]:>5} file(s)")
+    print(f"{'-' * 60}")
+    print(f"📊 Total files: {len(results)}")
+
+    prechecks = Counter(
+        result["guardrails"]["precheck"]
+        for result in results
+        if result["guardrails"] and "precheck" in result["guardrails"]
+    )
+    if prechecks:
+        print(f"{'-' * 60}")
+        print("🛡️  Local guardrails:")
+        for precheck in (PRECHECK_LEAK, PRECHECK_PASS, PRECHECK_AMBIGUOUS):
+            print(f"   {precheck:<17} : {prechecks[precheck]:>5} file(s)")
+        saved = prechecks[PRECHECK_LEAK] + prechecks[PRECHECK_PASS]
+        print(f"   LLM calls saved   : {saved:>5}")
+
+    sampled_out = sum(
+        1 for result in results if result["guardrails"] and result["guardrails"].get("sampled_out")
+    )
+    if sampled_out:
+        print(f"{'-' * 60}")
+        print(f"🎲 Guardrail sampling: {sampled_out} file(s) of proven templates not checked")
+
+    payloads = [
+        result["guardrails"]["payload"]
+        for result in results
+        if result["guardrails"] and "payload" in result["guardrails"]
+    ]
+    if payloads:
+        totals = Counter()
+        for payload in payloads:
+            totals.update(payload)
+        print(f"{'-' * 60}")
+        print(f"🧩 Guardrail mosaics: {len(payloads)} file(s)")
+        for unit, key in (("bytes", "bytes"), ("vision tokens", "tokens")):
+            original = totals[f"original_{key}"]
+            sent = totals[f"sent_{key}"]
+            print(
+                f"   {unit:<17} : {sent:>9} of {original:>9} sent ({1 - sent / original:.0%} saved)"
+            )
+
+    if batch_stats and batch_stats["files"]:
+        print(f"{'-' * 60}")
+        print(
+            f"📦 Guardrail batches: {batch_stats['files']} file(s) in {batch_stats['requests']} request(s)"
+            f" ({batch_stats['files'] / batch_stats['requests']:.1f} files/request, {batch_stats['splits']} split(s))"
+        )
+
+    failed = sorted(
+        (
+            result
+            for result in results
+            if result["status"] not in (STATUS_PASSED, STATUS_SKIPPED)
+        ),
+        key=lambda result: result["input_path"],
+    )
+    if failed:
+        print("\n❌ Not passed:")
+        for result in failed:
+            rel_path = os.path.relpath(result["input_path"], input_path)
+            print(f"   {result['status']:<20} {rel_path}")
+    print(f"{'=' * 60}\n")
 
 
 def main():
@@ -50,13 +191,127 @@ def main():
         help="Output directory (default: output)",
     )
     parser.add_argument(
-        "-n", "--name", required=False, help="bank name, use only your input is a file"
+        "-n",
+        "--name",
+        required=False,
+        help="bank name, use only your input is a file (detected with the local template index when omitted)",
     )
     parser.add_argument(
         "--ollama",
         action="store_true",
         help="use local model via Ollama instead of Gemini (better privacy)",
     )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=None,
+        help="send only the k templates most similar to the input (local pre-ranking) to the LLM",
+    )
+    parser.add_argument(
+        "--skip-llm-score",
+        type=float,
+        default=None,
+        help="accept the best pre-ranked template without LLM calls when its score (0-1) reaches this value",
+    )
+    parser.add_argument(
+        "--early-exit",
+        type=float,
+        default=None,
+        help="stop comparing templates (most frequently matched first) once one matches with at least this confidence",
+    )
+    parser.add_argument(
+        "--single-request-match",
+        action="store_true",
+        help="compare the input with all candidate templates in a single LLM request",
+    )
+    parser.add_argument(
+        "--no-match-cache",
+        action="store_true",
+        help=f"do not reuse or store template comparison results in {MATCH_CACHE_PATH}",
+    )
+    parser.add_argument(
+        "--ocr-match",
+        action="store_true",
+        help="match with local OCR label fingerprints of the templates, using the LLM only when none is confident",
+    )
+    parser.add_argument(
+        "--align",
+        action="store_true",
+        help="warp the template coordinates onto the input (feature matching) before masking",
+    )
+    parser.add_argument(
+        "--jpeg-dct",
+        action="store_true",
+        help="mask JPEGs by blacking out whole 8/16px blocks in the DCT domain, without re-encoding (requires jpeglib)",
+    )
+    parser.add_argument(
+        "--local-guardrails",
+        action="store_true",
+        help="OCR the masked files and check them for PII patterns first, only ambiguous files are sent to the LLM (requires tesseract)",
+    )
+    parser.add_argument(
+        "--verify-masks",
+        action="store_true",
+        help="check the masked pixels of every box before the guardrails LLM; failures are rejected without an LLM call",
+    )
+    parser.add_argument(
+        "--guardrail-sampling",
+        action="store_true",
+        help="after --sample-after consecutive passes of a template, check only 1 in --sample-every of its receipts (state in .cache/guardrail_policy.json)",
+    )
+    parser.add_argument(
+        "--sample-after",
+        type=int,
+        default=SAMPLE_AFTER_PASSES,
+        help=f"consecutive passes before a template is sampled (default: {SAMPLE_AFTER_PASSES})",
+    )
+    parser.add_argument(
+        "--sample-every",
+        type=int,
+        default=SAMPLE_EVERY,
+        help=f"sampled templates: check 1 in N receipts (default: {SAMPLE_EVERY})",
+    )
+    parser.add_argument(
+        "--guardrail-mosaic",
+        action="store_true",
+        help="send only bands around the masked boxes of images to the guardrails LLM, instead of the whole file",
+    )
+    parser.add_argument(
+        "--guardrail-batch-size",
+        type=int,
+        default=1,
+        help="directory mode: send the masked images of up to N files in one guardrails request (default: 1, no batching)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of files processed concurrently in directory mode (default: 1)",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="directory mode: run match, mask and guardrails as concurrent stages with bounded queues",
+    )
+    for stage_name, workers in DEFAULT_STAGE_WORKERS.items():
+        parser.add_argument(
+            f"--{stage_name}-workers",
+            type=int,
+            default=workers,
+            help=f"pipeline: concurrent {stage_name} workers (default: {workers})",
+        )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=f"pipeline: max files waiting in each stage queue (default: {DEFAULT_QUEUE_SIZE})",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="directory mode: reprocess files already completed in the output journal",
+    )
     args = parser.parse_args()
 
     input_path = os.path.realpath(args.input)
@@ -65,6 +320,24 @@ def main():
         print(f"❌ Input path does not exist: {input_path}")
         return
 
+    options = {
+        "use_ollama": args.ollama,
+        "top_k": args.top_k,
+        "skip_llm_score": args.skip_llm_score,
+        "early_exit_confidence": args.early_exit,
+        "single_request": args.single_request_match,
+        "match_cache_path": None if args.no_match_cache else MATCH_CACHE_PATH,
+        "use_fingerprints": args.ocr_match,
+        "align": args.align,
+        "jpeg_dct": args.jpeg_dct,
+        "local_guardrails": args.local_guardrails,
+        "guardrail_mosaic": args.guardrail_mosaic,
+        "verify_masks": args.verify_masks,
+        "guardrail_sampling": args.guardrail_sampling,
+        "sample_after": args.sample_after,
+        "sample_every": args.sample_every,
+    }
+
     if os.path.isfile(input_path):
         output_path = os.path.realpath(f"{args.output}/{os.path.basename(input_path)}")
         execute(
@@ -73,35 +346,37 @@ def main():
             os.path.splitext(input_path)[1],
             output_path,
             args.ollama,
+            options,
         )
     else:
-        for root, _, files in os.walk(input_path):
-            for file in files:
-                _, ext = os.path.splitext(file)
-                if ext.lower() not in [
-                    ".png",
-                    ".jpg",
-                    ".jpeg",
-                    ".pdf",
-                ]:
-                    print(f"skipping unsupported file type: {file}")
-                    continue
-
-                file_path = os.path.join(root, file)
-
-                # Extract bank name from path structure: /user/bank/files
-                rel_path = os.path.relpath(file_path, input_path)
-                parts = rel_path.split(os.sep)
-
-                if len(parts) < 2:
-                    print(f"invalid path structure: {file_path}")
-                    continue
-                bank_name = parts[1]
-                user_name = parts[0]
-
-                output_path = f"{args.output}/{user_name}/{bank_name}/{file}"
-                real_output_path = os.path.realpath(output_path)
-                execute(file_path, bank_name, ext, real_output_path, args.ollama)
+        jobs = collect_directory_jobs(input_path, args.output)
+        journal = Journal(os.path.realpath(args.output))
+        pending_jobs = prepare_resume(jobs, journal, resume=not args.no_resume)
+        options["journal"] = journal
+        batcher = None
+        if args.guardrail_batch_size > 1:
+            batcher = GuardrailBatcher(args.guardrail_batch_size, args.ollama)
+            options["guardrail_batcher"] = batcher
+        if args.pipeline:
+            stage_workers = {
+                stage_name: getattr(args, f"{stage_name}_workers")
+                for stage_name in DEFAULT_STAGE_WORKERS
+            }
+            if batcher is not None:
+                # a batch only fills up with as many files waiting in the stage
+                stage_workers["guardrails"] = max(
+                    stage_workers["guardrails"], args.guardrail_batch_size
+                )
+            stage_stats = run_pipeline(
+                pending_jobs, options, stage_workers, args.queue_size
+            )
+            print_stage_report(stage_stats)
+        else:
+            workers = args.workers
+            if batcher is not None:
+                workers = max(workers, args.guardrail_batch_size)
+            run_jobs(pending_jobs, options, workers)
+        print_summary(jobs, input_path, batcher.stats if batcher else None)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# the stand-in server accepts any key, a real one is never sent anywhere
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+import google.generativeai as genai
+from google.ai.generativelanguage_v1beta.types import content
+
+from src.clients import gemini
+from src.clients.gemini import check_sensitive_data_with_gemini, configure_gemini
+from src.config.prompts.guardrails_prompt import get_guardrails_prompt
+from src.utils.receipt import create_receipt
+
+PREVIOUS = "previous (configure + model per call)"
+REGISTRY = "registry (shared model and client)"
+
+STAND_IN_ANSWER = {
+    "analysis": "Todos os campos estão cobertos por tarjas.",
+    "has_sensitive_data": False,
+    "leaked_fields": [],
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # keep-alive, so a client that reuses its connection is visible in the count
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # headers and body are written separately: without this, a reused
+        # connection waits for the delayed ACK of the client on every answer
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+        # loopback has no TLS: the handshake of a real endpoint is simulated
+        if self.server.handshake:
+            time.sleep(self.server.handshake)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = json.dumps(
+            {
+                "candidates": [
+                    {
+                        "content": {
+                            "role": "model",
+                            "parts": [{"text": json.dumps(STAND_IN_ANSWER)}],
+                        },
+                        "finishReason": "STOP",
+                        "index": 0,
+                    }
+                ]
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in_server(latency, handshake):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.latency = latency
+    server.handshake = handshake
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def previous_check_sensitive_data(receipt_data, client_options):
+    # guardrails call before the client registry: configured, schema and model
+    # rebuilt on every call, which also drops the API client and its connection
+    response_schema = content.Schema(
+        type=content.Type.OBJECT,
+        enum=[],
+        required=["analysis", "has_sensitive_data", "leaked_fields"],
+        properties={
+            "analysis": content.Schema(type=content.Type.STRING),
+            "has_sensitive_data": content.Schema(type=content.Type.BOOLEAN),
+            "leaked_fields": content.Schema(
+                type=content.Type.ARRAY,
+                items=content.Schema(type=content.Type.STRING),
+            ),
+        },
+    )
+    generation_config = {
+        "temperature": 0.0,
+        "top_p": 1.0,
+        "top_k": 1,
+        "max_output_tokens": 2048,
+        "response_mime_type": "application/json",
+        "response_schema": response_schema,
+    }
+    genai.configure(api_key=gemini.gemini_api_key, **client_options)
+    gemini_client = genai.GenerativeModel(
+        model_name=gemini.GEMINI_MODEL, generation_config=generation_config
+    )
+    response = gemini_client.generate_content(
+        contents=[
+            get_guardrails_prompt(),
+            {"mime_type": "image/png", "data": receipt_data},
+        ]
+    )
+    return json.loads(response.text)
+
+
+def time_calls(function, calls, threads):
+    start = time.perf_counter()
+    if threads <= 1:
+        results = [function() for _ in range(calls)]
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(lambda _: function(), range(calls)))
+    elapsed = time.perf_counter() - start
+    failures = sum(
+        1 for result in results if result.get("has_sensitive_data") is not False
+    )
+    return elapsed / calls * 1000, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare per-call Gemini client overhead before and after the client registry, against a local stand-in server"
+    )
+    parser.add_argument("-n", "--calls", type=int, default=200, help="calls per run")
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=4,
+        help="concurrent callers of the threaded runs",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds the stand-in server waits before answering (default: 0, overhead only)",
+    )
+    parser.add_argument(
+        "--handshake",
+        type=float,
+        default=0.0,
+        help="seconds the stand-in server takes to accept a new connection, as a TLS handshake would (default: 0)",
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        default="src/config/coordinates/nu/coordinates_output_3.png",
+        help="image sent in every call",
+    )
+    args = parser.parse_args()
+
+    with open(args.input, "rb") as f:
+        receipt_data = f.read()
+    receipt = create_receipt(args.input, receipt_data)
+
+    server = start_stand_in_server(args.latency, args.handshake)
+    client_options = {
+        "transport": "rest",
+        "client_options": {"api_endpoint": f"http://127.0.0.1:{server.server_port}"},
+    }
+    # stdout of the guardrails client is one line per call
+    sys.stdout = open(os.devnull, "w")
+    try:
+        configure_gemini(**client_options)
+        results = {}
+        runs = {
+            PREVIOUS: lambda: previous_check_sensitive_data(receipt_data, client_options),
+            REGISTRY: lambda: check_sensitive_data_with_gemini(receipt),
+        }
+        for threads in (1, args.threads):
+            for name, function in runs.items():
+                if name == REGISTRY:
+                    # the previous path reconfigured the SDK, start from a clean registry
+                    configure_gemini(**client_options)
+                connections_before = server.connections
+                milliseconds, failures = time_calls(function, args.calls, threads)
+                results[(name, threads)] = (
+                    milliseconds,
+                    server.connections - connections_before,
+                    failures,
+                )
+    finally:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
+        server.shutdown()
+
+    print(
+        f"📊 {args.calls} guardrails call(s) per run, stand-in latency {args.latency * 1000:.0f} ms,"
+        f" handshake {args.handshake * 1000:.0f} ms"
+    )
+    for threads in (1, args.threads):
+        baseline = results[(PREVIOUS, threads)][0]
+        for name in runs:
+            milliseconds, connections, failures = results[(name, threads)]
+            print(
+                f"  {threads} thread(s)  {name:<38} {milliseconds:7.2f} ms/call  x{baseline / milliseconds:.2f}"
+                f"  {connections:>4} connection(s)  {failures} failed"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
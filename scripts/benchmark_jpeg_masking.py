@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.usecases.masking import jpeglib, mask_image, mask_jpeg_dct
+from scripts.benchmark_masking import list_template_images
+
+
+def time_runs(function, items, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            if not function(*item):
+                raise RuntimeError(f"masking failed: {item[0]}")
+    return (time.perf_counter() - start) / (repeat * len(items)) * 1000
+
+
+def get_unmasked_error(original_path, masked_path):
+    # mean absolute difference over the pixels that neither path blacked out
+    original = cv2.imread(original_path).astype(np.int16)
+    masked = cv2.imread(masked_path).astype(np.int16)
+    unmasked = masked.max(axis=2) > 0
+    return float(np.abs(original - masked)[unmasked].mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare decode/encode JPEG masking with DCT-domain masking"
+    )
+    parser.add_argument(
+        "-c",
+        "--coordinates",
+        default="src/config/coordinates",
+        help="Coordinates directory with the template PNGs",
+    )
+    parser.add_argument(
+        "-q", "--quality", type=int, default=90, help="Quality of the test JPEGs"
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="Runs over all templates"
+    )
+    args = parser.parse_args()
+
+    if jpeglib is None:
+        print("❌ jpeglib is not installed: pip install jpeglib")
+        return 1
+
+    pairs = list_template_images(args.coordinates)
+    if not pairs:
+        print(f"❌ No template PNGs found in {args.coordinates}")
+        return 1
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # the templates are PNGs, so the test inputs are JPEG screenshots made from them
+        inputs = []
+        for index, (image_path, coordinates) in enumerate(pairs):
+            jpeg_path = os.path.join(work_dir, f"input_{index}.jpeg")
+            cv2.imwrite(
+                jpeg_path, cv2.imread(image_path), [cv2.IMWRITE_JPEG_QUALITY, args.quality]
+            )
+            inputs.append((jpeg_path, coordinates))
+
+        paths = {
+            "pixels (decode/encode)": [
+                os.path.join(work_dir, "pixels", f"{index}.jpeg")
+                for index in range(len(inputs))
+            ],
+            "dct (coefficients)": [
+                os.path.join(work_dir, "dct", f"{index}.jpeg")
+                for index in range(len(inputs))
+            ],
+        }
+        functions = {
+            "pixels (decode/encode)": mask_image,
+            "dct (coefficients)": mask_jpeg_dct,
+        }
+
+        input_size = sum(os.path.getsize(path) for path, _ in inputs)
+        print(f"📊 {len(inputs)} JPEG(s) at quality {args.quality}, {args.repeat} run(s) each")
+        print(f"  {'':<24} {'ms/file':>8} {'output size':>12} {'unmasked error':>15}")
+        for name, function in functions.items():
+            items = [
+                (path, coordinates, output_path)
+                for (path, coordinates), output_path in zip(inputs, paths[name])
+            ]
+            milliseconds = time_runs(function, items, args.repeat)
+            output_size = sum(os.path.getsize(path) for path in paths[name])
+            error = np.mean(
+                [
+                    get_unmasked_error(path, output_path)
+                    for (path, _), output_path in zip(inputs, paths[name])
+                ]
+            )
+            print(
+                f"  {name:<24} {milliseconds:8.2f} {output_size / input_size:11.1%} {error:15.3f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
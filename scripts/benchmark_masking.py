@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.usecases.masking import mask_image, mask_image_array
+from src.utils.geometry import prepare_boxes
+from src.utils.image import decode_image
+
+
+def previous_mask_image(input_path, coordinates, output_path):
+    # masking path before the single-decode engine: decoded twice, drawn with PIL
+    if cv2.imread(input_path) is None:
+        raise ValueError(f"Could not load image: {input_path}")
+
+    img = Image.open(input_path)
+    draw = ImageDraw.Draw(img)
+    for x1, y1, x2, y2 in prepare_boxes(coordinates, img.width, img.height):
+        draw.rectangle([x1, y1, x2, y2], fill="black")
+    img.save(output_path)
+
+
+def list_template_images(coordinates_dir):
+    pairs = []
+    for bank_name in sorted(os.listdir(coordinates_dir)):
+        bank_dir = os.path.join(coordinates_dir, bank_name)
+        if not os.path.isdir(bank_dir):
+            continue
+        for file_name in sorted(os.listdir(bank_dir)):
+            if not file_name.endswith(".png"):
+                continue
+            json_path = os.path.join(bank_dir, file_name[: -len(".png")] + ".json")
+            if os.path.exists(json_path):
+                with open(json_path, "r", encoding="utf-8") as f:
+                    pairs.append((os.path.join(bank_dir, file_name), json.load(f)))
+    return pairs
+
+
+def time_runs(function, pairs, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for index, (image_path, coordinates) in enumerate(pairs):
+            function(index, image_path, coordinates)
+    return (time.perf_counter() - start) / (repeat * len(pairs)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the previous PIL masking path with the NumPy engine"
+    )
+    parser.add_argument(
+        "-c",
+        "--coordinates",
+        default="src/config/coordinates",
+        help="Coordinates directory with the template PNGs",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="Runs over all templates"
+    )
+    args = parser.parse_args()
+
+    pairs = list_template_images(args.coordinates)
+    if not pairs:
+        print(f"❌ No template PNGs found in {args.coordinates}")
+        return 1
+
+    with tempfile.TemporaryDirectory() as output_dir:
+
+        def output_path(prefix, index):
+            return os.path.join(output_dir, f"{prefix}_{index}.png")
+
+        def run_previous(index, image_path, coordinates):
+            previous_mask_image(image_path, coordinates, output_path("previous", index))
+
+        def run_numpy(index, image_path, coordinates):
+            mask_image(image_path, coordinates, output_path("numpy", index))
+
+        decoded = []
+        for image_path, _ in pairs:
+            with open(image_path, "rb") as f:
+                decoded.append(decode_image(f.read()))
+
+        def run_in_memory(index, image_path, coordinates):
+            # already decoded input, as a pipeline stage would hand it over
+            mask_image_array(decoded[index].copy(), coordinates)
+
+        results = {
+            "previous (cv2 check + PIL draw)": time_runs(run_previous, pairs, args.repeat),
+            "numpy (file to file)": time_runs(run_numpy, pairs, args.repeat),
+            "numpy (in memory, no encode)": time_runs(run_in_memory, pairs, args.repeat),
+        }
+
+        identical = sum(
+            np.array_equal(
+                np.asarray(Image.open(output_path("previous", index)).convert("RGBA")),
+                np.asarray(Image.open(output_path("numpy", index)).convert("RGBA")),
+            )
+            for index in range(len(pairs))
+        )
+
+    print(f"📊 {len(pairs)} template PNG(s), {args.repeat} run(s) each")
+    baseline = results["previous (cv2 check + PIL draw)"]
+    for name, milliseconds in results.items():
+        print(f"  {name:<34} {milliseconds:8.2f} ms/file  x{baseline / milliseconds:.2f}")
+    print(f"✅ identical output: {identical}/{len(pairs)}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
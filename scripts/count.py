@@ -9,23 +9,23 @@ def count_coordinate_templates(coordinates_dir="src/config/coordinates"):
         return
 
     total_files = 0
+    total_templates = 0
     bank_data = {}
 
     for bank_name in os.listdir(coordinates_dir):
         bank_path = os.path.join(coordinates_dir, bank_name)
         if os.path.isdir(bank_path):
-            file_count = len(
-                [
-                    f
-                    for f in os.listdir(bank_path)
-                    if os.path.isfile(os.path.join(bank_path, f))
-                ]
-            )
-            template_count = file_count // 2
+            files = [
+                f
+                for f in os.listdir(bank_path)
+                if os.path.isfile(os.path.join(bank_path, f))
+                and not f.endswith(".fingerprint.json")
+            ]
+            file_count = len(files)
+            template_count = len([f for f in files if f.endswith(".json")])
             bank_data[bank_name] = {"files": file_count, "templates": template_count}
             total_files += file_count
-
-    total_templates = total_files // 2
+            total_templates += template_count
 
     print(f"\n{'=' * 60}")
     print("📊 COORDINATE TEMPLATES COUNT")
@@ -1,33 +1,45 @@
 import cv2
 import json
 import argparse
+import os
+import sys
 import fitz
-import numpy as np
 from pathlib import Path
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.usecases.masking import mask_image_array, mask_pdf
+from src.utils.geometry import (
+    get_page_numbers,
+    is_normalized,
+    select_page,
+    to_absolute_coordinates,
+    to_normalized_coordinates,
+)
+from src.utils.pdf import get_render_size, render_pdf_page
+
 
 class CoordinateSelector:
-    def __init__(self, file_path, output_file="coordinates_output.json"):
+    def __init__(
+        self, file_path, output_file="coordinates_output.json", normalized=False
+    ):
         self.file_path = file_path
         self.output_file = output_file
+        self.normalized = normalized
         self.file_extension = Path(file_path).suffix.lower()
         self.is_pdf = self.file_extension == ".pdf"
 
+        self.page_number = 0
         if self.is_pdf:
-            self.pdf_doc = fitz.open(file_path)
-            self.pdf_page = self.pdf_doc[0]
-            pix = self.pdf_page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_data = np.frombuffer(pix.samples, dtype=np.uint8).reshape(
-                pix.height, pix.width, pix.n
-            )
-            if pix.n == 4:
-                self.image = cv2.cvtColor(img_data, cv2.COLOR_RGBA2BGR)
-            else:
-                self.image = cv2.cvtColor(img_data, cv2.COLOR_RGB2BGR)
+            with fitz.open(file_path) as doc:
+                self.page_sizes = [get_render_size(page) for page in doc]
+            self.image = render_pdf_page(file_path, self.page_number)
         else:
             self.image = cv2.imread(file_path)
             if self.image is None:
                 raise ValueError(f"Could not load image: {file_path}")
+            height, width = self.image.shape[:2]
+            self.page_sizes = [(width, height)]
 
         self.original_image = self.image.copy()
         self.rectangles = []
@@ -36,7 +48,7 @@ class CoordinateSelector:
         self.start_point = None
 
         file_type = "PDF" if self.is_pdf else "Image"
-        self.window_name = f"Coordinate Selector ({file_type}) - Draw rectangles, Press 'u' to undo, 'r' to reset, 'q' to quit"
+        self.window_name = f"Coordinate Selector ({file_type}) - Draw rectangles, Press 'u' to undo, 'r' to reset, 'n'/'p' next/previous page, 'q' to quit"
 
         self.load_coordinates()
 
@@ -49,7 +61,7 @@ class CoordinateSelector:
             if self.drawing:
                 self.image = self.original_image.copy()
 
-                for i, coord in enumerate(self.rectangles):
+                for i, coord in enumerate(self.get_page_rectangles()):
                     cv2.rectangle(
                         self.image,
                         (coord["x"], coord["y"]),
@@ -84,15 +96,28 @@ class CoordinateSelector:
 
                 if width > 5 and height > 5:
                     rect_data = {"x": x1, "y": y1, "width": width, "height": height}
+                    if self.page_number > 0:
+                        rect_data["page"] = self.page_number
                     self.rectangles.append(rect_data)
                     self.save_coordinates()
 
                 self.redraw()
 
+    def get_page_rectangles(self):
+        return select_page(self.rectangles, self.page_number)
+
+    def show_page(self, page_number):
+        if not 0 <= page_number < len(self.page_sizes):
+            return
+        self.page_number = page_number
+        self.original_image = render_pdf_page(self.file_path, page_number)
+        print(f"📄 page {page_number + 1}/{len(self.page_sizes)}")
+        self.redraw()
+
     def redraw(self):
         self.image = self.original_image.copy()
 
-        for i, coord in enumerate(self.rectangles):
+        for i, coord in enumerate(self.get_page_rectangles()):
             cv2.rectangle(
                 self.image,
                 (coord["x"], coord["y"]),
@@ -114,7 +139,17 @@ class CoordinateSelector:
         if Path(self.output_file).exists():
             try:
                 with open(self.output_file, "r", encoding="utf-8") as f:
-                    self.rectangles = json.load(f)
+                    coordinates = json.load(f)
+                # rectangles are edited in the pixel space of each displayed page
+                self.normalized = self.normalized or is_normalized(coordinates)
+                self.rectangles = []
+                for page_number in get_page_numbers(coordinates):
+                    width, height = self.page_sizes[min(page_number, len(self.page_sizes) - 1)]
+                    self.rectangles.extend(
+                        to_absolute_coordinates(
+                            select_page(coordinates, page_number), width, height
+                        )
+                    )
                 self.redraw()
             except Exception as e:
                 print(f"❌ Error loading coordinates: {e}")
@@ -123,9 +158,25 @@ class CoordinateSelector:
         if not self.rectangles:
             return False
 
+        coordinates = self.rectangles
+        if self.normalized:
+            # each page is normalized by its own size
+            rects = []
+            for page_number in get_page_numbers(self.rectangles):
+                width, height = self.page_sizes[min(page_number, len(self.page_sizes) - 1)]
+                normalized = to_normalized_coordinates(
+                    select_page(self.rectangles, page_number), width, height
+                )
+                rects.extend(normalized["rects"])
+            coordinates = {**normalized, "rects": rects}
+            coordinates["reference_size"] = {
+                "width": self.page_sizes[0][0],
+                "height": self.page_sizes[0][1],
+            }
+
         try:
             with open(self.output_file, "w", encoding="utf-8") as f:
-                json.dump(self.rectangles, f, indent=2, ensure_ascii=False)
+                json.dump(coordinates, f, indent=2, ensure_ascii=False)
             return True
         except Exception as e:
             print(f"❌ Error saving: {e}")
@@ -137,8 +188,9 @@ class CoordinateSelector:
         self.redraw()
 
     def undo(self):
-        if self.rectangles:
-            self.rectangles.pop()
+        page_rectangles = self.get_page_rectangles()
+        if page_rectangles:
+            self.rectangles.remove(page_rectangles[-1])
             self.save_coordinates()
             self.redraw()
 
@@ -149,41 +201,16 @@ class CoordinateSelector:
         try:
             if self.is_pdf:
                 output_path = "coordinates_output.pdf"
-                output_doc = fitz.open(self.file_path)
-                output_page = output_doc[0]
-
-                page_rect = output_page.rect
-                img_height, img_width = self.image.shape[:2]
-                scale_x = page_rect.width / img_width
-                scale_y = page_rect.height / img_height
-
-                for coord in self.rectangles:
-                    pdf_x = coord["x"] * scale_x
-                    pdf_y = coord["y"] * scale_y
-                    pdf_width = coord["width"] * scale_x
-                    pdf_height = coord["height"] * scale_y
-
-                    rect = fitz.Rect(
-                        pdf_x, pdf_y, pdf_x + pdf_width, pdf_y + pdf_height
-                    )
-                    output_page.draw_rect(rect, color=(0, 0, 0), fill=(0, 0, 0))
-
-                output_doc.save(output_path)
-                output_doc.close()
+                if not mask_pdf(
+                    self.file_path, self.rectangles, os.path.abspath(output_path)
+                ):
+                    return False
                 print(f"✅ {output_path}")
             else:
                 output_path = "coordinates_output.png"
-                masked_image = self.original_image.copy()
-
-                for coord in self.rectangles:
-                    cv2.rectangle(
-                        masked_image,
-                        (coord["x"], coord["y"]),
-                        (coord["x"] + coord["width"], coord["y"] + coord["height"]),
-                        (0, 0, 0),
-                        -1,
-                    )
-
+                masked_image = mask_image_array(
+                    self.original_image.copy(), self.rectangles
+                )
                 cv2.imwrite(output_path, masked_image)
                 print(f"✅ {output_path}")
 
@@ -208,12 +235,13 @@ class CoordinateSelector:
                 self.reset()
             elif key == ord("u"):
                 self.undo()
+            elif key == ord("n") and self.is_pdf:
+                self.show_page(self.page_number + 1)
+            elif key == ord("p") and self.is_pdf:
+                self.show_page(self.page_number - 1)
 
         cv2.destroyAllWindows()
 
-        if self.is_pdf:
-            self.pdf_doc.close()
-
 
 def main():
     parser = argparse.ArgumentParser(
@@ -228,11 +256,16 @@ def main():
         default="coordinates_output.json",
         help="Output JSON file path (default: coordinates_output.json)",
     )
+    parser.add_argument(
+        "--normalized",
+        action="store_true",
+        help="save coordinates relative to the image size, so they fit any resolution",
+    )
 
     args = parser.parse_args()
 
     try:
-        selector = CoordinateSelector(args.input, args.output)
+        selector = CoordinateSelector(args.input, args.output, args.normalized)
         selector.run()
     except Exception as e:
         print(f"❌ Error: {e}")
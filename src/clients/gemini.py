@@ -1,73 +1,226 @@
 import json
 import os
+import threading
 from dotenv import load_dotenv
 
 from google.generativeai import types
 import google.generativeai as genai
+from google.generativeai import client as genai_client
 from google.ai.generativelanguage_v1beta.types import content
 from pathlib import Path
 
 from src.config.prompts.identify_bank_of_payment_receipt_prompt import (
     get_identify_bank_of_payment_receipt_prompt,
 )
-from src.config.prompts.compare_templates_prompt import get_compare_templates_prompt
-from src.config.prompts.guardrails_prompt import get_guardrails_prompt
+from src.config.prompts.compare_templates_prompt import (
+    get_compare_multiple_templates_prompt,
+    get_compare_templates_prompt,
+)
+from src.config.prompts.guardrails_prompt import (
+    get_guardrails_batch_prompt,
+    get_guardrails_prompt,
+)
 from src.config.prompts.generate_payment_receipt_prompt import (
     get_generate_payment_receipt_prompt,
 )
 from src.utils.mime_type import get_mime_type
+from src.utils.receipt import read_file_data
 
 load_dotenv()
 gemini_api_key = os.getenv("GEMINI_API_KEY")
 
+GEMINI_MODEL = "gemini-2.5-flash"
+GEMINI_IMAGE_MODEL = "gemini-2.5-flash-image"
+
+COMPARE_TEMPLATES_SCHEMA = content.Schema(
+    type=content.Type.OBJECT,
+    enum=[],
+    required=["is_match", "confidence", "reason"],
+    properties={
+        "is_match": content.Schema(
+            type=content.Type.BOOLEAN,
+            description="True se as imagens compartilham exatamente o mesmo template/layout.",
+        ),
+        "confidence": content.Schema(
+            type=content.Type.NUMBER,
+            description="Grau de certeza entre 0.0 e 1.0",
+        ),
+        "reason": content.Schema(
+            type=content.Type.STRING,
+            description="Explicação técnica citando as chaves encontradas e a ordem visual.",
+        ),
+    },
+)
 
-def compare_templates_with_gemini(template_path, input_path):
-    try:
-        response_schema = content.Schema(
-            type=content.Type.OBJECT,
-            enum=[],
-            required=["is_match", "confidence", "reason"],
-            properties={
-                "is_match": content.Schema(
-                    type=content.Type.BOOLEAN,
-                    description="True se as imagens compartilham exatamente o mesmo template/layout.",
-                ),
-                "confidence": content.Schema(
-                    type=content.Type.NUMBER,
-                    description="Grau de certeza entre 0.0 e 1.0",
-                ),
-                "reason": content.Schema(
-                    type=content.Type.STRING,
-                    description="Explicação técnica citando as chaves encontradas e a ordem visual.",
-                ),
-            },
-        )
+COMPARE_MULTIPLE_TEMPLATES_SCHEMA = content.Schema(
+    type=content.Type.OBJECT,
+    enum=[],
+    required=["best_index", "is_match", "confidence", "reason"],
+    properties={
+        "best_index": content.Schema(
+            type=content.Type.INTEGER,
+            description="Índice do template mais parecido com a imagem de entrada.",
+        ),
+        "is_match": content.Schema(
+            type=content.Type.BOOLEAN,
+            description="True se o template escolhido compartilha exatamente o mesmo template/layout da entrada.",
+        ),
+        "confidence": content.Schema(
+            type=content.Type.NUMBER,
+            description="Grau de certeza entre 0.0 e 1.0",
+        ),
+        "reason": content.Schema(
+            type=content.Type.STRING,
+            description="Explicação técnica citando as chaves encontradas e a ordem visual.",
+        ),
+    },
+)
 
-        generation_config = {
-            "temperature": 0.0,
-            "top_p": 1.0,
-            "top_k": 1,
-            "max_output_tokens": 2048,
-            "response_mime_type": "application/json",
-            "response_schema": response_schema,
-        }
+GUARDRAILS_SCHEMA = content.Schema(
+    type=content.Type.OBJECT,
+    enum=[],
+    required=["analysis", "has_sensitive_data", "leaked_fields"],
+    properties={
+        "analysis": content.Schema(
+            type=content.Type.STRING,
+            description="Explicação passo a passo. Se houver vazamento, descreva onde e o que foi lido.",
+        ),
+        "has_sensitive_data": content.Schema(
+            type=content.Type.BOOLEAN,
+            description="TRUE se houver qualquer PII (nome, cpf, conta) legível. FALSE se tudo estiver censurado/mascarado.",
+        ),
+        "leaked_fields": content.Schema(
+            type=content.Type.ARRAY,
+            description="Lista dos tipos de dados que vazaram (ex: ['NOME_DO_PAGADOR', 'CPF_DESTINATARIO']). Retorne lista vazia [] se tudo estiver seguro.",
+            items=content.Schema(type=content.Type.STRING),
+        ),
+    },
+)
 
-        genai.configure(api_key=gemini_api_key)
-        gemini_client = genai.GenerativeModel(
-            model_name="gemini-2.5-flash", generation_config=generation_config
-        )
-        prompt = get_compare_templates_prompt()
+GUARDRAILS_BATCH_SCHEMA = content.Schema(
+    type=content.Type.OBJECT,
+    enum=[],
+    required=["results"],
+    properties={
+        "results": content.Schema(
+            type=content.Type.ARRAY,
+            description="Um item por imagem, na ordem das imagens.",
+            items=content.Schema(
+                type=content.Type.OBJECT,
+                required=["index", "analysis", "has_sensitive_data", "leaked_fields"],
+                properties={
+                    "index": content.Schema(
+                        type=content.Type.INTEGER,
+                        description="Índice da imagem analisada (Imagem 0, Imagem 1, ...).",
+                    ),
+                    "analysis": content.Schema(
+                        type=content.Type.STRING,
+                        description="Explicação passo a passo. Se houver vazamento, descreva onde e o que foi lido.",
+                    ),
+                    "has_sensitive_data": content.Schema(
+                        type=content.Type.BOOLEAN,
+                        description="TRUE se houver qualquer PII (nome, cpf, conta) legível nesta imagem.",
+                    ),
+                    "leaked_fields": content.Schema(
+                        type=content.Type.ARRAY,
+                        description="Lista dos tipos de dados que vazaram nesta imagem. Retorne lista vazia [] se tudo estiver seguro.",
+                        items=content.Schema(type=content.Type.STRING),
+                    ),
+                },
+            ),
+        ),
+    },
+)
 
-        with open(template_path, "rb") as f:
-            template_data = f.read()
-        with open(input_path, "rb") as f:
-            input_data = f.read()
 
-        template_ext = Path(template_path).suffix.lower()
-        input_ext = Path(input_path).suffix.lower()
+def get_json_generation_config(response_schema, max_output_tokens=2048):
+    return {
+        "temperature": 0.0,
+        "top_p": 1.0,
+        "top_k": 1,
+        "max_output_tokens": max_output_tokens,
+        "response_mime_type": "application/json",
+        "response_schema": response_schema,
+    }
+
+
+IMAGE_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+}
+
+# name -> (model name, generation config): each is turned into a model only once
+GEMINI_MODEL_CONFIGS = {
+    "compare_templates": (
+        GEMINI_MODEL,
+        get_json_generation_config(COMPARE_TEMPLATES_SCHEMA),
+    ),
+    "compare_multiple_templates": (
+        GEMINI_MODEL,
+        get_json_generation_config(COMPARE_MULTIPLE_TEMPLATES_SCHEMA),
+    ),
+    "guardrails": (GEMINI_MODEL, get_json_generation_config(GUARDRAILS_SCHEMA)),
+    # room for one analysis per image of the largest batches
+    "guardrails_batch": (
+        GEMINI_MODEL,
+        get_json_generation_config(GUARDRAILS_BATCH_SCHEMA, max_output_tokens=16384),
+    ),
+    "identify_bank": (
+        GEMINI_MODEL,
+        types.GenerationConfig(response_mime_type="text/plain"),
+    ),
+    "generate_payment_receipt": (GEMINI_IMAGE_MODEL, IMAGE_GENERATION_CONFIG),
+}
+
+# genai.configure drops the cached API clients, so it runs once per process and
+# every model below shares the same client and its open connection
+gemini_models = {}
+gemini_models_lock = threading.Lock()
+gemini_client_options = None
+
+
+def configure_gemini_clients(options):
+    global gemini_client_options
+    genai.configure(api_key=gemini_api_key, **options)
+    # created here, under the lock, and not by the first threads to call a model
+    genai_client.get_default_generative_client()
+    gemini_models.clear()
+    gemini_client_options = options
+
+
+def configure_gemini(**options):
+    # options of genai.configure, e.g. transport="rest" and an api_endpoint
+    with gemini_models_lock:
+        configure_gemini_clients(options)
+
+
+def get_gemini_model(config_name):
+    model = gemini_models.get(config_name)
+    if model is not None:
+        return model
+
+    with gemini_models_lock:
+        if gemini_client_options is None:
+            configure_gemini_clients({})
+        model = gemini_models.get(config_name)
+        if model is None:
+            model_name, generation_config = GEMINI_MODEL_CONFIGS[config_name]
+            model = genai.GenerativeModel(
+                model_name=model_name, generation_config=generation_config
+            )
+            gemini_models[config_name] = model
+    return model
 
-        template_mime = get_mime_type(template_ext)
-        input_mime = get_mime_type(input_ext)
+
+def compare_templates_with_gemini(template_path, input_path):
+    try:
+        gemini_client = get_gemini_model("compare_templates")
+        prompt = get_compare_templates_prompt()
+
+        template_data, template_mime = read_file_data(template_path)
+        input_data, input_mime = read_file_data(input_path)
 
         contents = [
             prompt,
@@ -83,51 +236,43 @@ def compare_templates_with_gemini(template_path, input_path):
         return {"is_match": False, "confidence": 0.0, "reason": f"Error: {str(e)}"}
 
 
-def check_sensitive_data_with_gemini(file_path):
-    print("guardrails ☁️: Using Gemini for validation")
+def compare_multiple_templates_with_gemini(template_paths, input_path):
     try:
-        response_schema = content.Schema(
-            type=content.Type.OBJECT,
-            enum=[],
-            required=["analysis", "has_sensitive_data", "leaked_fields"],
-            properties={
-                "analysis": content.Schema(
-                    type=content.Type.STRING,
-                    description="Explicação passo a passo. Se houver vazamento, descreva onde e o que foi lido.",
-                ),
-                "has_sensitive_data": content.Schema(
-                    type=content.Type.BOOLEAN,
-                    description="TRUE se houver qualquer PII (nome, cpf, conta) legível. FALSE se tudo estiver censurado/mascarado.",
-                ),
-                "leaked_fields": content.Schema(
-                    type=content.Type.ARRAY,
-                    description="Lista dos tipos de dados que vazaram (ex: ['NOME_DO_PAGADOR', 'CPF_DESTINATARIO']). Retorne lista vazia [] se tudo estiver seguro.",
-                    items=content.Schema(type=content.Type.STRING),
-                ),
-            },
-        )
+        gemini_client = get_gemini_model("compare_multiple_templates")
+
+        contents = [get_compare_multiple_templates_prompt(len(template_paths))]
+        for index, template_path in enumerate(template_paths):
+            with open(template_path, "rb") as f:
+                template_data = f.read()
+            template_mime = get_mime_type(Path(template_path).suffix.lower())
+            contents.append(f"Template {index}:")
+            contents.append({"mime_type": template_mime, "data": template_data})
+
+        input_data, input_mime = read_file_data(input_path)
+        contents.append("Imagem de entrada:")
+        contents.append({"mime_type": input_mime, "data": input_data})
+
+        response = gemini_client.generate_content(contents=contents)
+        result = json.loads(response.text)
+        return result
 
-        generation_config = {
-            "temperature": 0.0,
-            "top_p": 1.0,
-            "top_k": 1,
-            "max_output_tokens": 2048,
-            "response_mime_type": "application/json",
-            "response_schema": response_schema,
+    except Exception as e:
+        return {
+            "best_index": -1,
+            "is_match": False,
+            "confidence": 0.0,
+            "reason": f"Error: {str(e)}",
         }
 
-        genai.configure(api_key=gemini_api_key)
-        gemini_client = genai.GenerativeModel(
-            model_name="gemini-2.5-flash", generation_config=generation_config
-        )
-        with open(file_path, "rb") as f:
-            file_data = f.read()
 
-        file_ext = Path(file_path).suffix.lower()
-        mime_type = get_mime_type(file_ext)
+def check_sensitive_data_with_gemini(file_path, prompt=None):
+    print("guardrails ☁️: Using Gemini for validation")
+    try:
+        gemini_client = get_gemini_model("guardrails")
+        file_data, mime_type = read_file_data(file_path)
 
         contents = [
-            get_guardrails_prompt(),
+            prompt or get_guardrails_prompt(),
             {"mime_type": mime_type, "data": file_data},
         ]
 
@@ -166,6 +311,24 @@ def check_sensitive_data_with_gemini(file_path):
         }
 
 
+def check_sensitive_data_batch_with_gemini(file_paths, prompt=None):
+    print(f"guardrails ☁️: Using Gemini for validation of {len(file_paths)} files")
+    gemini_client = get_gemini_model("guardrails_batch")
+
+    contents = [prompt or get_guardrails_batch_prompt(len(file_paths))]
+    for index, file_path in enumerate(file_paths):
+        file_data, mime_type = read_file_data(file_path)
+        contents.append(f"Imagem {index}:")
+        contents.append({"mime_type": mime_type, "data": file_data})
+
+    response = gemini_client.generate_content(contents=contents)
+    try:
+        return json.loads(response.text)
+    except json.JSONDecodeError:
+        # a truncated or malformed answer: the caller splits the batch
+        raise ValueError(f"Failed to parse Gemini response: {response.text[:200]}")
+
+
 def get_bank_of_payment_receipt(file_path: str) -> str:
     try:
         contents = [get_identify_bank_of_payment_receipt_prompt()]
@@ -176,13 +339,7 @@ def get_bank_of_payment_receipt(file_path: str) -> str:
         mime_type = get_mime_type(file_ext)
         contents.append({"mime_type": mime_type, "data": file_data})
 
-        genai.configure(api_key=gemini_api_key)
-        gemini_client = genai.GenerativeModel(
-            model_name="gemini-2.5-flash",
-            generation_config=types.GenerationConfig(
-                response_mime_type="text/plain",
-            ),
-        )
+        gemini_client = get_gemini_model("identify_bank")
         response = gemini_client.generate_content(contents=contents)
 
         return {"classify": response.text, "path": file_path}
@@ -193,15 +350,6 @@ def get_bank_of_payment_receipt(file_path: str) -> str:
 
 def generate_payment_receipt_with_gemini(templates, output_path):
     try:
-        genai.configure(api_key=gemini_api_key)
-
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-        }
-
         contents = [get_generate_payment_receipt_prompt()]
 
         for template_path in templates:
@@ -213,9 +361,9 @@ def generate_payment_receipt_with_gemini(templates, output_path):
 
             contents.append({"mime_type": mime_type, "data": template_data})
 
-        response = genai.GenerativeModel(
-            model_name="gemini-2.5-flash-image", generation_config=generation_config
-        ).generate_content(contents=contents)
+        response = get_gemini_model("generate_payment_receipt").generate_content(
+            contents=contents
+        )
 
         output_dir = os.path.dirname(output_path)
         if output_dir:
@@ -242,15 +390,6 @@ def generate_payment_receipt_with_gemini(templates, output_path):
 
 def generate_payment_receipt_with_json_instructions(image_path, json_data, output_path):
     try:
-        genai.configure(api_key=gemini_api_key)
-
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-        }
-
         prompt = get_generate_payment_receipt_prompt()
 
         json_instructions = f"""
@@ -279,9 +418,9 @@ Generate a clean payment receipt image with the masked areas removed and replace
             {"mime_type": mime_type, "data": image_data},
         ]
 
-        response = genai.GenerativeModel(
-            model_name="gemini-2.5-flash-image", generation_config=generation_config
-        ).generate_content(contents=contents)
+        response = get_gemini_model("generate_payment_receipt").generate_content(
+            contents=contents
+        )
 
         output_dir = os.path.dirname(output_path)
         if output_dir:
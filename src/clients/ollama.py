@@ -1,39 +1,40 @@
 import json
-import os
-from pathlib import Path
 import ollama
 
 from src.config.prompts.compare_templates_prompt_ollama import (
+    get_compare_multiple_templates_prompt_ollama,
     get_compare_templates_prompt_ollama,
 )
-from src.config.prompts.guardrails_prompt import get_guardrails_prompt
-from src.utils.pdf import pdf_to_image
+from src.config.prompts.guardrails_prompt import (
+    get_guardrails_batch_prompt,
+    get_guardrails_prompt,
+)
+from src.utils.pdf import pdf_page_to_png, pdf_to_pngs
+from src.utils.receipt import read_file_data
+
+OLLAMA_MODEL = "qwen2.5vl:7b"
+
+
+def get_ollama_image(source):
+    # only images are accepted: PDFs are sent as their first page, rendered in memory
+    data, mime_type = read_file_data(source)
+    if mime_type == "application/pdf":
+        return pdf_page_to_png(data)
+    return data
 
 
 def compare_templates_with_ollama(template_path, input_path):
-    temp_template_path = None
-    temp_input_path = None
     try:
         prompt = get_compare_templates_prompt_ollama()
-        file_ext = Path(template_path).suffix.lower()
-
-        if file_ext == ".pdf":
-            temp_template_path = pdf_to_image(template_path)
-            temp_input_path = pdf_to_image(input_path)
-
-        image_paths = (
-            [temp_template_path, temp_input_path]
-            if temp_template_path and temp_input_path
-            else [template_path, input_path]
-        )
+        images = [get_ollama_image(template_path), get_ollama_image(input_path)]
 
         response = ollama.chat(
-            model="qwen2.5vl:7b",
+            model=OLLAMA_MODEL,
             messages=[
                 {
                     "role": "user",
                     "content": prompt,
-                    "images": image_paths,
+                    "images": images,
                 }
             ],
             options={"temperature": 0.0},
@@ -58,28 +59,60 @@ def compare_templates_with_ollama(template_path, input_path):
         return result
     except Exception as e:
         raise e
-    finally:
-        if temp_input_path and os.path.exists(temp_input_path):
-            os.remove(temp_input_path)
-            os.remove(temp_template_path)
 
 
-def check_sensitive_data_with_ollama(file_path):
+def compare_multiple_templates_with_ollama(template_paths, input_path):
+    prompt = get_compare_multiple_templates_prompt_ollama(len(template_paths))
+    images = [get_ollama_image(file_path) for file_path in [*template_paths, input_path]]
+
+    response = ollama.chat(
+        model=OLLAMA_MODEL,
+        messages=[
+            {
+                "role": "user",
+                "content": prompt,
+                "images": images,
+            }
+        ],
+        options={"temperature": 0.0},
+        format="json",
+    )
+
+    response_content = response["message"]["content"]
+
+    try:
+        result = json.loads(response_content)
+    except json.JSONDecodeError:
+        import re
+
+        json_match = re.search(
+            r"```json\s*(\{.*?\})\s*```", response_content, re.DOTALL
+        )
+        if json_match:
+            result = json.loads(json_match.group(1))
+        else:
+            raise ValueError("No valid JSON found in response")
+
+    return result
+
+
+def check_sensitive_data_with_ollama(file_path, prompt=None):
     print("guardrails 🔒: Using ollama (local) for validation")
-    temp_image = None
     try:
-        file_ext = Path(file_path).suffix.lower()
-        if file_ext == ".pdf":
-            temp_image = pdf_to_image(file_path)
-            file_path = temp_image
+        data, mime_type = read_file_data(file_path)
+        if mime_type == "application/pdf":
+            # every page is checked, not only the first one
+            images = pdf_to_pngs(data)
+        else:
+            images = [data]
 
         response = ollama.chat(
-            model="qwen2.5vl:7b",
+            model=OLLAMA_MODEL,
             messages=[
                 {
                     "role": "user",
-                    "content": get_guardrails_prompt(),
-                    "images": [file_path],
+                    "content": prompt or get_guardrails_prompt(),
+                    "images": images,
                 }
             ],
             options={"temperature": 0.0},
@@ -123,6 +156,36 @@ def check_sensitive_data_with_ollama(file_path):
             "analysis": f"Error during check: {str(e)}",
             "leaked_fields": [],
         }
-    finally:
-        if temp_image and os.path.exists(temp_image):
-            os.remove(temp_image)
+
+
+def check_sensitive_data_batch_with_ollama(file_paths, prompt=None):
+    print(f"guardrails 🔒: Using ollama (local) for validation of {len(file_paths)} files")
+    # one image per file, in order: the index in the answer is the file position
+    images = [get_ollama_image(file_path) for file_path in file_paths]
+
+    response = ollama.chat(
+        model=OLLAMA_MODEL,
+        messages=[
+            {
+                "role": "user",
+                "content": prompt or get_guardrails_batch_prompt(len(file_paths)),
+                "images": images,
+            }
+        ],
+        options={"temperature": 0.0},
+        format="json",
+    )
+
+    response_content = response["message"]["content"]
+
+    try:
+        return json.loads(response_content)
+    except json.JSONDecodeError:
+        import re
+
+        json_match = re.search(
+            r"```json\s*(\{.*?\})\s*```", response_content, re.DOTALL
+        )
+        if json_match:
+            return json.loads(json_match.group(1))
+        raise ValueError("No valid JSON found in response")
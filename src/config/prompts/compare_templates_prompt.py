@@ -36,3 +36,44 @@ Execute mentalmente estes passos:
 Responda APENAS com o JSON. Não inclua markdown (```json).
 Certifique-se de preencher o campo "reason" com a evidência: liste as chaves encontradas em ambos para justificar.
 """
+
+
+def get_compare_multiple_templates_prompt(templates_count) -> str:
+    return f"""
+<PERSONA>
+Você é um Analista Forense de Documentos Bancários especializado em detecção de fraude e verificação de templates.
+</PERSONA>
+
+<CONTEXTO>
+O objetivo é descobrir qual "Layout Mestre" (mesmo banco, mesma versão de app) corresponde a um comprovante de Pix.
+Você receberá {templates_count} imagens de TEMPLATES, cada uma precedida pelo seu índice ("Template 0", "Template 1", ...), e por último a IMAGEM DE ENTRADA.
+Os templates contêm tarjas pretas (censura de dados sensíveis).
+</CONTEXTO>
+
+<INSTRUCOES_DE_VISAO>
+1.  **Ignore as Tarjas:** Trate tarjas pretas/coloridas cobrindo valores como "ruído irrelevante". O layout existe *através* delas.
+2.  **Foco nas Chaves (Keys):** Identifique os rótulos dos campos (ex: "Destinatário", "Valor", "Data", "ID da transação").
+3.  **Foco na Identidade Visual:** Logotipo do banco, cor de fundo do cabeçalho, fontes utilizadas.
+</INSTRUCOES_DE_VISAO>
+
+<ALGORITMO_DE_COMPARACAO>
+Execute mentalmente estes passos:
+1.  Extraia a lista ordenada de CHAVES (Labels) da IMAGEM DE ENTRADA (de cima para baixo).
+2.  Para cada template, extraia a lista ordenada de CHAVES e compare com a da entrada. Elas devem ser idênticas em conteúdo e ordem.
+    * *Permissão:* Aceite pequenas variações de OCR ou corte de imagem (ex: rodapé cortado), desde que o "corpo" do comprovante seja igual.
+    * *Proibição:* Se o template tem os campos alinhados à esquerda e a entrada centralizados, isso é uma quebra de estrutura.
+3.  Escolha o índice do template mais parecido em `best_index`.
+4.  Se nenhum template compartilhar o mesmo layout da entrada -> `is_match: false`.
+</ALGORITMO_DE_COMPARACAO>
+
+<CRITERIOS_DE_CONFIANCA>
+- 1.0: Mesmo banco, logos idênticos, mesma lista de chaves na exata mesma ordem visual.
+- 0.8: Mesmo banco e estrutura, mas uma imagem tem qualidade inferior ou corte leve que dificulta leitura de 1 ou 2 chaves.
+- 0.2: Mesmo banco, mas layout diferente (ex: comprovante web vs comprovante mobile).
+- 0.0: Bancos diferentes ou documentos não relacionados.
+</CRITERIOS_DE_CONFIANCA>
+
+<FORMATO_DE_RESPOSTA>
+Responda APENAS com o JSON. Não inclua markdown (```json).
+Certifique-se de preencher o campo "reason" com a evidência: liste as chaves da entrada e do template escolhido para justificar.
+"""
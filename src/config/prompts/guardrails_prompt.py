@@ -45,3 +45,29 @@ Passo 3: O valor é legível?
 <FORMATO_RESPOSTA>
 Retorne apenas o JSON. Se encontrar vazamento, adicione o nome do campo em `leaked_fields`.
 """
+
+
+def get_guardrails_mosaic_prompt() -> str:
+    mosaic_context = """<CONTEXTO_MOSAICO>
+A imagem NÃO é o comprovante inteiro: é um mosaico de faixas recortadas do comprovante, empilhadas de cima para baixo e separadas por linhas cinzas.
+- Cada faixa contém um ou mais campos mascarados com as linhas vizinhas.
+- Textos cortados na borda de uma faixa fazem parte do comprovante; avalie a parte legível normalmente.
+- Não conclua nada sobre partes do comprovante que não aparecem no mosaico.
+</CONTEXTO_MOSAICO>
+
+<DEFINICAO_DE_DADO_SENSIVEL>"""
+    return get_guardrails_prompt().replace(
+        "<DEFINICAO_DE_DADO_SENSIVEL>", mosaic_context, 1
+    )
+
+
+def get_guardrails_batch_prompt(images_count, mosaic=False) -> str:
+    prompt = get_guardrails_mosaic_prompt() if mosaic else get_guardrails_prompt()
+    batch_context = f"""<CONTEXTO_LOTE>
+Você receberá {images_count} imagens de comprovantes DIFERENTES, numeradas de 0 a {images_count - 1} na ordem em que aparecem ("Imagem 0", "Imagem 1", ...).
+- Analise cada imagem de forma independente: um vazamento em uma imagem não afeta as outras.
+- Retorne em `results` exatamente {images_count} itens, um por imagem, com o `index` da imagem, `analysis`, `has_sensitive_data` e `leaked_fields`.
+</CONTEXTO_LOTE>
+
+<FORMATO_RESPOSTA>"""
+    return prompt.replace("<FORMATO_RESPOSTA>", batch_context, 1)
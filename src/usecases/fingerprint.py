@@ -0,0 +1,263 @@
+# build: python src/usecases/fingerprint.py [-n nu]
+# match: python src/usecases/fingerprint.py -n nu -i 1.jpeg
+import json
+import os
+import sys
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+
+import cv2
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.usecases.load_templates import (
+    FINGERPRINT_SUFFIX,
+    IMAGE_EXTENSIONS,
+    PDF_EXTENSION,
+    get_reference_image,
+)
+from src.usecases.prerank import load_image
+
+FINGERPRINT_VERSION = 1
+MIN_WORD_CONFIDENCE = 40
+MIN_TEXT_SIMILARITY = 0.8
+MAX_VERTICAL_DRIFT = 0.1
+MIN_FINGERPRINT_SCORE = 0.6
+
+# fingerprint path -> lock, so concurrent workers build each template only once
+fingerprint_locks = {}
+fingerprint_locks_lock = threading.Lock()
+
+
+# what OCR callers fall back on: pytesseract not installed, or the tesseract
+# binary or its "por" language data missing
+OCR_ERRORS = (
+    (ImportError,)
+    if pytesseract is None
+    else (pytesseract.TesseractNotFoundError, pytesseract.TesseractError)
+)
+
+
+def read_words(gray):
+    if pytesseract is None:
+        raise ImportError("pytesseract is not installed (pip install pytesseract)")
+    return pytesseract.image_to_data(
+        gray, lang="por", output_type=pytesseract.Output.DICT
+    )
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKD", text).encode("ASCII", "ignore").decode()
+    text = "".join(c if c.isalnum() else " " for c in text.lower())
+    return " ".join(text.split())
+
+
+def extract_text_lines(image):
+    height, width = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    data = read_words(gray)
+
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        if not word.strip() or float(data["conf"][i]) < MIN_WORD_CONFIDENCE:
+            continue
+        line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        line = lines.setdefault(line_key, {"words": [], "x": [], "y": []})
+        line["words"].append(word)
+        line["x"].append(data["left"][i] + data["width"][i] / 2)
+        line["y"].append(data["top"][i] + data["height"][i] / 2)
+
+    anchors = []
+    for line in lines.values():
+        text = normalize_text(" ".join(line["words"]))
+        # labels have letters; lines made only of digits are values
+        if not any(c.isalpha() for c in text):
+            continue
+        anchors.append(
+            {
+                "text": text,
+                "x": round(sum(line["x"]) / len(line["x"]) / width, 4),
+                "y": round(sum(line["y"]) / len(line["y"]) / height, 4),
+            }
+        )
+
+    anchors.sort(key=lambda anchor: (anchor["y"], anchor["x"]))
+    return anchors
+
+
+def get_fingerprint_path(template):
+    return os.path.splitext(template["reference_path"])[0] + FINGERPRINT_SUFFIX
+
+
+def get_fingerprint_lock(fingerprint_path):
+    with fingerprint_locks_lock:
+        return fingerprint_locks.setdefault(fingerprint_path, threading.Lock())
+
+
+def build_fingerprint(template):
+    # the reference images have the values blacked out, so what OCR reads are the labels
+    anchors = extract_text_lines(get_reference_image(template))
+    fingerprint = {"version": FINGERPRINT_VERSION, "anchors": anchors}
+
+    # replaced at once, readers never see a half-written file
+    fingerprint_path = get_fingerprint_path(template)
+    temp_path = f"{fingerprint_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(fingerprint, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, fingerprint_path)
+    return fingerprint
+
+
+def read_fingerprint(template):
+    fingerprint_path = get_fingerprint_path(template)
+    if not os.path.exists(fingerprint_path) or os.path.getmtime(
+        fingerprint_path
+    ) < os.path.getmtime(template["reference_path"]):
+        return None
+    try:
+        with open(fingerprint_path, "r", encoding="utf-8") as f:
+            fingerprint = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if fingerprint.get("version") != FINGERPRINT_VERSION:
+        return None
+    return fingerprint
+
+
+def get_template_fingerprint(template):
+    fingerprint = template.get("fingerprint")
+    if fingerprint is not None:
+        return fingerprint
+
+    fingerprint = read_fingerprint(template)
+    if fingerprint is None:
+        with get_fingerprint_lock(get_fingerprint_path(template)):
+            # another worker may have built it while this one was waiting
+            fingerprint = read_fingerprint(template)
+            if fingerprint is None:
+                print(f"fingerprint: extracting anchors of {template['name']}")
+                fingerprint = build_fingerprint(template)
+
+    template["fingerprint"] = fingerprint
+    return fingerprint
+
+
+def longest_increasing_subsequence(values):
+    lengths = []
+    for i, value in enumerate(values):
+        lengths.append(
+            1 + max((lengths[j] for j in range(i) if values[j] < value), default=0)
+        )
+    return max(lengths, default=0)
+
+
+def score_fingerprint(input_lines, fingerprint, vocabulary):
+    anchors = fingerprint["anchors"]
+    if not anchors:
+        return 0.0
+
+    matched_lines = set()
+    matched_positions = []
+    drifts = []
+    for anchor in anchors:
+        best_line, best_similarity = None, 0.0
+        for line_index, line in enumerate(input_lines):
+            if line_index in matched_lines:
+                continue
+            similarity = SequenceMatcher(None, anchor["text"], line["text"]).ratio()
+            if similarity > best_similarity:
+                best_line, best_similarity = line_index, similarity
+
+        if best_line is not None and best_similarity >= MIN_TEXT_SIMILARITY:
+            matched_lines.add(best_line)
+            matched_positions.append(best_line)
+            drifts.append(abs(input_lines[best_line]["y"] - anchor["y"]))
+
+    if not matched_positions:
+        return 0.0
+
+    # recall: labels of the template found in the input
+    recall = len(matched_positions) / len(anchors)
+    # precision: known labels of the bank found in the input that this template explains
+    known_lines = matched_lines.union(
+        i for i, line in enumerate(input_lines) if line["text"] in vocabulary
+    )
+    precision = len(matched_lines) / len(known_lines)
+    layout = 2 * precision * recall / (precision + recall) if precision + recall else 0
+
+    order = longest_increasing_subsequence(matched_positions) / len(matched_positions)
+    position = sum(1 - min(drift / MAX_VERTICAL_DRIFT, 1) for drift in drifts) / len(
+        drifts
+    )
+
+    return 0.6 * layout + 0.2 * order + 0.2 * position
+
+
+def rank_templates_by_fingerprint(source, templates):
+    input_lines = extract_text_lines(load_image(source, reduction=1))
+
+    fingerprints = [get_template_fingerprint(template) for template in templates]
+    vocabulary = {
+        anchor["text"] for fingerprint in fingerprints for anchor in fingerprint["anchors"]
+    }
+
+    ranking = [
+        {
+            "template": template,
+            "score": score_fingerprint(input_lines, fingerprint, vocabulary),
+        }
+        for template, fingerprint in zip(templates, fingerprints)
+    ]
+    ranking.sort(key=lambda item: item["score"], reverse=True)
+    return ranking
+
+
+def match_template_by_fingerprint(
+    source, templates, min_score=MIN_FINGERPRINT_SCORE
+):
+    ranking = rank_templates_by_fingerprint(source, templates)
+    if not ranking or ranking[0]["score"] < min_score:
+        return None
+
+    best = ranking[0]
+    print(f"fingerprint: {best['template']['name']} scored {best['score']:.3f}")
+    return best["template"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--name", required=False, help="Bank name")
+    parser.add_argument("-i", "--input", required=False, help="Input file path")
+    args = parser.parse_args()
+
+    if args.input and not args.name:
+        parser.error("-n/--name is required with -i/--input")
+
+    from src.usecases.template_bundle import load_bundle_templates
+
+    coordinates_dir = "src/config/coordinates"
+    bank_names = [args.name] if args.name else sorted(os.listdir(coordinates_dir))
+
+    if args.input:
+        extension = os.path.splitext(args.input)[1]
+        templates = load_bundle_templates(args.name, extension)
+        for item in rank_templates_by_fingerprint(args.input, templates):
+            template = item["template"]
+            print(f"{item['score']:.3f}  {template['name']}{template['file_extension']}")
+    else:
+        for bank_name in bank_names:
+            for extension in (sorted(IMAGE_EXTENSIONS)[0], PDF_EXTENSION):
+                for template in load_bundle_templates(bank_name, extension):
+                    anchors = build_fingerprint(template)["anchors"]
+                    print(f"{bank_name}/{template['name']}: {len(anchors)} anchor(s)")
@@ -0,0 +1,195 @@
+# python src/usecases/guardrail_batch.py -i output/1.jpeg output/2.png output/3.jpeg
+import os
+import sys
+import threading
+import time
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.clients.gemini import (
+    check_sensitive_data_batch_with_gemini,
+    check_sensitive_data_with_gemini,
+)
+from src.clients.ollama import (
+    check_sensitive_data_batch_with_ollama,
+    check_sensitive_data_with_ollama,
+)
+from src.config.prompts.guardrails_prompt import (
+    get_guardrails_batch_prompt,
+    get_guardrails_mosaic_prompt,
+)
+from src.utils.receipt import load_receipt
+
+DEFAULT_BATCH_SIZE = 4
+# a file waits this long for others to fill its batch before it is sent with
+# whatever is pending, so the last files of a run are not held forever
+BATCH_WAIT_SECONDS = 2.0
+
+
+def parse_batch_results(response, count):
+    results = response.get("results") if isinstance(response, dict) else None
+    if not isinstance(results, list) or len(results) != count:
+        raise ValueError(f"expected {count} results, got {response!r:.200}")
+
+    by_index = {}
+    for result in results:
+        if (
+            not isinstance(result, dict)
+            or not isinstance(result.get("index"), int)
+            or not isinstance(result.get("has_sensitive_data"), bool)
+        ):
+            raise ValueError(f"malformed result {result!r:.200}")
+        by_index[result["index"]] = {
+            "has_sensitive_data": result["has_sensitive_data"],
+            "analysis": result.get("analysis", "No analysis provided"),
+            "leaked_fields": result.get("leaked_fields", []),
+        }
+    if sorted(by_index) != list(range(count)):
+        raise ValueError(f"result indexes {sorted(by_index)} do not match {count} files")
+    return [by_index[index] for index in range(count)]
+
+
+def check_sensitive_data_in_batches(
+    receipts, use_ollama=False, mosaic=False, stats=None
+):
+    stats = stats if stats is not None else {}
+    stats["requests"] = stats.get("requests", 0) + 1
+
+    if len(receipts) == 1:
+        check_function = (
+            check_sensitive_data_with_ollama
+            if use_ollama
+            else check_sensitive_data_with_gemini
+        )
+        prompt = get_guardrails_mosaic_prompt() if mosaic else None
+        return [check_function(receipts[0], prompt=prompt)]
+
+    batch_function = (
+        check_sensitive_data_batch_with_ollama
+        if use_ollama
+        else check_sensitive_data_batch_with_gemini
+    )
+    try:
+        response = batch_function(
+            receipts, prompt=get_guardrails_batch_prompt(len(receipts), mosaic)
+        )
+        return parse_batch_results(response, len(receipts))
+    except ValueError as e:
+        # a malformed answer is retried as two smaller batches, down to single files
+        print(f"guardrails ⚠️: malformed answer for {len(receipts)} files, splitting: {e}")
+        stats["splits"] = stats.get("splits", 0) + 1
+        half = len(receipts) // 2
+        return check_sensitive_data_in_batches(
+            receipts[:half], use_ollama, mosaic, stats
+        ) + check_sensitive_data_in_batches(receipts[half:], use_ollama, mosaic, stats)
+    except Exception as e:
+        return [
+            {
+                "has_sensitive_data": True,
+                "analysis": f"Error during check: {str(e)}",
+                "leaked_fields": [],
+            }
+            for _ in receipts
+        ]
+
+
+class GuardrailBatcher:
+    def __init__(
+        self,
+        batch_size=DEFAULT_BATCH_SIZE,
+        use_ollama=False,
+        wait_seconds=BATCH_WAIT_SECONDS,
+    ):
+        self.batch_size = batch_size
+        self.use_ollama = use_ollama
+        self.wait_seconds = wait_seconds
+        self.condition = threading.Condition()
+        # full receipts and mosaics need different prompts, they are never mixed
+        self.pending = {False: [], True: []}
+        self.stats = {"files": 0, "requests": 0, "splits": 0}
+
+    def accepts(self, receipt):
+        # a PDF is one file but several pages, it would shift the image indexes
+        return isinstance(receipt, dict) and receipt["extension"] != ".pdf"
+
+    def submit(self, receipt, mosaic=False):
+        item = {"receipt": receipt, "batched": False, "result": None}
+        pending = self.pending[mosaic]
+        with self.condition:
+            pending.append(item)
+            self.condition.notify_all()
+            deadline = time.monotonic() + self.wait_seconds
+            while True:
+                if item["result"] is not None:
+                    return item["result"]
+                if not item["batched"]:
+                    remaining = deadline - time.monotonic()
+                    if len(pending) >= self.batch_size or remaining <= 0:
+                        # whoever fills the batch, or waited the longest, sends it
+                        batch = pending[: self.batch_size]
+                        del pending[: self.batch_size]
+                        for batch_item in batch:
+                            batch_item["batched"] = True
+                        break
+                    self.condition.wait(remaining)
+                else:
+                    self.condition.wait()
+
+        stats = {}
+        try:
+            results = check_sensitive_data_in_batches(
+                [batch_item["receipt"] for batch_item in batch],
+                self.use_ollama,
+                mosaic,
+                stats,
+            )
+        except Exception as e:
+            results = [
+                {
+                    "has_sensitive_data": True,
+                    "analysis": f"Error during check: {str(e)}",
+                    "leaked_fields": [],
+                }
+                for _ in batch
+            ]
+
+        with self.condition:
+            for batch_item, result in zip(batch, results):
+                batch_item["result"] = result
+            self.stats["files"] += len(batch)
+            self.stats["requests"] += stats.get("requests", 0)
+            self.stats["splits"] += stats.get("splits", 0)
+            self.condition.notify_all()
+        return item["result"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--input", nargs="+", required=True, help="Masked image files"
+    )
+    parser.add_argument(
+        "--ollama",
+        action="store_true",
+        help="use local model via Ollama instead of Gemini (better privacy)",
+    )
+    args = parser.parse_args()
+
+    stats = {}
+    receipts = [load_receipt(os.path.realpath(path)) for path in args.input]
+    results = check_sensitive_data_in_batches(receipts, args.ollama, stats=stats)
+    for path, result in zip(args.input, results):
+        status = (
+            "sensitive data found"
+            if result.get("has_sensitive_data", True)
+            else "all data masked"
+        )
+        print(f"{path}: {status} - {result.get('analysis', 'No details provided')}")
+    print(
+        f"{len(receipts)} file(s) in {stats['requests']} request(s), {stats.get('splits', 0)} split(s)"
+    )
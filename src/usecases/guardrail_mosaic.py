@@ -0,0 +1,168 @@
+# python src/usecases/guardrail_mosaic.py -i output/1.jpeg -n nu -t coordinates_output_3
+import math
+import os
+import sys
+
+import cv2
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.utils.geometry import prepare_boxes, select_page
+from src.utils.image import encode_image
+from src.utils.receipt import create_receipt, get_receipt_image, load_receipt
+
+# a leak can only be the value of a masked field or its neighbours: each band
+# keeps the full width of the rows around a box, so the labels beside it and the
+# lines above and below it are checked too
+BAND_PADDING = 1.0
+MIN_BAND_PADDING = 16
+BAND_GAP = 8
+BAND_GAP_COLOR = 128
+
+# Gemini counts 258 tokens for an image up to 384px, larger images are split
+# into 768px tiles of 258 tokens each
+VISION_TOKENS_PER_TILE = 258
+VISION_SMALL_IMAGE_SIDE = 384
+VISION_TILE_SIDE = 768
+MIN_TILE_FIT_SCALE = 0.9
+
+
+def estimate_vision_tokens(width, height):
+    if max(width, height) <= VISION_SMALL_IMAGE_SIDE:
+        return VISION_TOKENS_PER_TILE
+    tiles = math.ceil(width / VISION_TILE_SIDE) * math.ceil(height / VISION_TILE_SIDE)
+    return tiles * VISION_TOKENS_PER_TILE
+
+
+def get_bands(boxes, height):
+    if not len(boxes):
+        return []
+
+    padding = np.maximum((boxes[:, 3] - boxes[:, 1] + 1) * BAND_PADDING, MIN_BAND_PADDING)
+    starts = np.clip(boxes[:, 1] - padding, 0, height - 1).astype(int)
+    ends = np.clip(boxes[:, 3] + padding, 0, height - 1).astype(int)
+
+    # overlapping bands are joined, so no row is sent twice
+    bands = []
+    for start, end in sorted(zip(starts.tolist(), ends.tolist())):
+        if bands and start <= bands[-1][1] + 1:
+            bands[-1][1] = max(bands[-1][1], end)
+        else:
+            bands.append([start, end])
+    return bands
+
+
+def crop_bands(image, coordinates):
+    height, width = image.shape[:2]
+    boxes = prepare_boxes(coordinates, width, height)
+    return [image[start : end + 1] for start, end in get_bands(boxes, height)]
+
+
+def compose_mosaic(bands):
+    width = bands[0].shape[1]
+    height = sum(band.shape[0] for band in bands) + BAND_GAP * (len(bands) - 1)
+    mosaic = np.full((height, width, 3), BAND_GAP_COLOR, dtype=np.uint8)
+
+    y = 0
+    for band in bands:
+        mosaic[y : y + band.shape[0]] = band
+        y += band.shape[0] + BAND_GAP
+    return mosaic
+
+
+def fit_vision_tiles(mosaic):
+    # a mosaic slightly wider than a multiple of the vision tile is scaled down to
+    # it, which saves a whole column of tiles for a barely visible resize
+    height, width = mosaic.shape[:2]
+    columns = math.ceil(width / VISION_TILE_SIDE)
+    scale = (columns - 1) * VISION_TILE_SIDE / width
+    if columns == 1 or scale < MIN_TILE_FIT_SCALE:
+        return mosaic
+    return cv2.resize(
+        mosaic,
+        ((columns - 1) * VISION_TILE_SIDE, max(round(height * scale), 1)),
+        interpolation=cv2.INTER_AREA,
+    )
+
+
+def to_bgr8(image):
+    # bands are copied into an 8-bit BGR mosaic: 16-bit samples are scaled down
+    # and alpha is dropped, the masks are opaque as mask_image_array draws them.
+    # returns None for any other layout, the file is then checked whole
+    if image.dtype == np.uint16:
+        image = np.round(image / 257).astype(np.uint8)
+    elif image.dtype != np.uint8:
+        return None
+
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    if channels == 1:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if channels == 3:
+        return image
+    if channels == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    return None
+
+
+def build_guardrail_mosaic(receipt, coordinates):
+    # PDFs are billed per page, not per pixel, and their text layer is smaller
+    # than any raster of it: they are always checked whole
+    if receipt["extension"] == ".pdf":
+        return None
+
+    image = to_bgr8(get_receipt_image(receipt))
+    if image is None:
+        return None
+    bands = crop_bands(image, select_page(coordinates, 0))
+    if not bands:
+        return None
+
+    mosaic = fit_vision_tiles(compose_mosaic(bands))
+    mosaic_path = os.path.splitext(receipt["path"])[0] + ".guardrails.png"
+    mosaic_receipt = create_receipt(mosaic_path, encode_image(mosaic, ".png"), mosaic)
+
+    height, width = image.shape[:2]
+    return {
+        "receipt": mosaic_receipt,
+        "bands": len(bands),
+        "payload": {
+            "original_bytes": len(receipt["data"]),
+            "sent_bytes": len(mosaic_receipt["data"]),
+            "original_tokens": estimate_vision_tokens(width, height),
+            "sent_tokens": estimate_vision_tokens(mosaic.shape[1], mosaic.shape[0]),
+        },
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from src.usecases.template_bundle import load_bundle_templates
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", required=True, help="Masked file path")
+    parser.add_argument("-n", "--name", required=True, help="Bank name")
+    parser.add_argument("-t", "--template", required=True, help="Template name")
+    parser.add_argument("-o", "--output", help="Write the mosaic to this PNG")
+    args = parser.parse_args()
+
+    extension = os.path.splitext(args.input)[1]
+    templates = load_bundle_templates(args.name, extension)
+    template = next(t for t in templates if t["name"] == args.template)
+
+    mosaic = build_guardrail_mosaic(load_receipt(args.input), template["coordinates"])
+    if mosaic is None:
+        print("no mosaic for this file, it is checked whole")
+        exit(1)
+    payload = mosaic["payload"]
+    print(
+        f"{mosaic['bands']} band(s): {payload['original_bytes']} -> {payload['sent_bytes']} bytes, "
+        f"~{payload['original_tokens']} -> ~{payload['sent_tokens']} vision tokens"
+    )
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(mosaic["receipt"]["data"])
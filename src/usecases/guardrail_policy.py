@@ -0,0 +1,229 @@
+# python src/usecases/guardrail_policy.py [--reset]
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.usecases.mask_verification import TIGHTNESS_WARNING
+
+GUARDRAIL_POLICY_PATH = ".cache/guardrail_policy.json"
+GUARDRAIL_AUDIT_PATH = ".cache/guardrail_policy.jsonl"
+
+MODE_FULL = "full"
+MODE_SAMPLING = "sampling"
+
+# a template is sampled after this many consecutive passes, then 1 of every
+# SAMPLE_EVERY of its receipts is still checked
+SAMPLE_AFTER_PASSES = 20
+SAMPLE_EVERY = 10
+
+# path -> {bank_name: {template: state}}
+loaded_policies = {}
+policy_lock = threading.Lock()
+
+
+def read_policy(policy_path):
+    if policy_path not in loaded_policies:
+        policy = {}
+        if os.path.exists(policy_path):
+            try:
+                with open(policy_path, "r", encoding="utf-8") as f:
+                    policy = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"guardrail_policy ⚠️: ignoring unreadable policy {policy_path}: {e}")
+        loaded_policies[policy_path] = policy
+    return loaded_policies[policy_path]
+
+
+def write_policy(policy_path, policy):
+    policy_dir = os.path.dirname(policy_path)
+    if policy_dir:
+        os.makedirs(policy_dir, exist_ok=True)
+    temp_path = f"{policy_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(policy, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(temp_path, policy_path)
+
+
+def append_audit(audit_path, entry):
+    audit_dir = os.path.dirname(audit_path)
+    if audit_dir:
+        os.makedirs(audit_dir, exist_ok=True)
+    with open(audit_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def get_template_key(template):
+    return f"{template['name']}{template['file_extension']}"
+
+
+def get_template_state(policy, template):
+    return policy.setdefault(template["bank_name"], {}).setdefault(
+        get_template_key(template),
+        {"mode": MODE_FULL, "consecutive_passes": 0, "checked": 0, "skipped": 0},
+    )
+
+
+def is_sampled(receipt_sha256, sample_every):
+    # derived from the file content, not from a random draw or the run order,
+    # so the same receipt gets the same decision when the run is repeated
+    return int(receipt_sha256[:16], 16) % sample_every == 0
+
+
+def has_tight_margins(verification):
+    # text close above or below a box: the receipts that pass the pixel check
+    # with the least room are always checked
+    if not verification:
+        return False
+    return any(
+        max(box["margin_ink"]["top"], box["margin_ink"]["bottom"]) > TIGHTNESS_WARNING
+        for box in verification["boxes"]
+    )
+
+
+def decide_guardrails(
+    template,
+    receipt_sha256,
+    verification=None,
+    sample_after=SAMPLE_AFTER_PASSES,
+    sample_every=SAMPLE_EVERY,
+    policy_path=GUARDRAIL_POLICY_PATH,
+):
+    with policy_lock:
+        state = dict(get_template_state(read_policy(policy_path), template))
+
+    if state["mode"] != MODE_SAMPLING:
+        check, reason = True, f"{state['consecutive_passes']}/{sample_after} consecutive passes"
+    elif has_tight_margins(verification):
+        check, reason = True, "text close to a masked box"
+    elif is_sampled(receipt_sha256, sample_every):
+        check, reason = True, f"sampled 1 in {sample_every}"
+    else:
+        check, reason = False, f"not sampled (1 in {sample_every})"
+    return {
+        "check": check,
+        "reason": reason,
+        "mode": state["mode"],
+        "sample_after": sample_after,
+        "sample_every": sample_every,
+    }
+
+
+def reset_template_state(state):
+    # any failure puts the template back to checking every receipt
+    state["mode"] = MODE_FULL
+    state["consecutive_passes"] = 0
+
+
+def record_local_failure(
+    template,
+    receipt_sha256,
+    reason,
+    policy_path=GUARDRAIL_POLICY_PATH,
+    audit_path=GUARDRAIL_AUDIT_PATH,
+):
+    # rejected before the guardrails (e.g. by the mask verification): the masks of
+    # the template are known to be bad, so it is not trusted for sampling anymore
+    with policy_lock:
+        policy = read_policy(policy_path)
+        state = get_template_state(policy, template)
+        mode = state["mode"]
+        state["checked"] += 1
+        reset_template_state(state)
+        write_policy(policy_path, policy)
+
+        append_audit(
+            audit_path,
+            {
+                "at": datetime.now().isoformat(timespec="seconds"),
+                "template": f"{template['bank_name']}/{get_template_key(template)}",
+                "receipt_sha256": receipt_sha256,
+                "check": True,
+                "reason": reason,
+                "mode": mode,
+                "outcome": "failed",
+                "new_mode": state["mode"],
+            },
+        )
+
+
+def record_guardrails_outcome(
+    template,
+    receipt_sha256,
+    decision,
+    result,
+    policy_path=GUARDRAIL_POLICY_PATH,
+    audit_path=GUARDRAIL_AUDIT_PATH,
+):
+    checked = not result.get("sampled_out", False)
+    failed = result.get("has_sensitive_data", True)
+    with policy_lock:
+        policy = read_policy(policy_path)
+        state = get_template_state(policy, template)
+        if not checked:
+            state["skipped"] += 1
+        else:
+            state["checked"] += 1
+            if failed:
+                reset_template_state(state)
+            else:
+                state["consecutive_passes"] += 1
+                if state["consecutive_passes"] >= decision["sample_after"]:
+                    state["mode"] = MODE_SAMPLING
+        write_policy(policy_path, policy)
+
+        append_audit(
+            audit_path,
+            {
+                "at": datetime.now().isoformat(timespec="seconds"),
+                "template": f"{template['bank_name']}/{get_template_key(template)}",
+                "receipt_sha256": receipt_sha256,
+                **decision,
+                "outcome": ("failed" if failed else "passed") if checked else "skipped",
+                "new_mode": state["mode"],
+            },
+        )
+
+
+def print_policy(policy_path=GUARDRAIL_POLICY_PATH):
+    policy = read_policy(policy_path)
+    if not policy:
+        print(f"guardrail_policy: no history in {policy_path}")
+        return
+
+    print(f"{'template':<40}{'mode':>10}{'streak':>8}{'checked':>9}{'skipped':>9}")
+    for bank_name in sorted(policy):
+        for template_name, state in sorted(policy[bank_name].items()):
+            print(
+                f"{bank_name + '/' + template_name:<40}{state['mode']:>10}"
+                f"{state['consecutive_passes']:>8}{state['checked']:>9}{state['skipped']:>9}"
+            )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="check every receipt again: discard the pass history of all templates",
+    )
+    args = parser.parse_args()
+
+    if args.reset:
+        if os.path.exists(GUARDRAIL_POLICY_PATH):
+            os.remove(GUARDRAIL_POLICY_PATH)
+        append_audit(
+            GUARDRAIL_AUDIT_PATH,
+            {"at": datetime.now().isoformat(timespec="seconds"), "reset": True},
+        )
+        print(f"guardrail_policy: history reset, audit log kept in {GUARDRAIL_AUDIT_PATH}")
+    else:
+        print_policy()
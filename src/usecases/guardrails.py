@@ -1,4 +1,5 @@
 # python src/usecases/guardrails.py -i '1.jpeg'
+import json
 import os
 import sys
 
@@ -9,17 +10,69 @@ if __name__ == "__main__":
 
 from src.clients.gemini import check_sensitive_data_with_gemini
 from src.clients.ollama import check_sensitive_data_with_ollama
+from src.config.prompts.guardrails_prompt import get_guardrails_mosaic_prompt
+from src.usecases.guardrail_mosaic import build_guardrail_mosaic
+from src.usecases.local_guardrails import (
+    PRECHECK_AMBIGUOUS,
+    check_sensitive_data_locally,
+)
+from src.utils.receipt import load_receipt
 
 
-def execute_guardrails(input_path, use_ollama=False):
+def execute_guardrails(
+    input_path,
+    use_ollama=False,
+    local_precheck=False,
+    coordinates=None,
+    sampled_out=False,
+    batcher=None,
+):
     check_function = (
         check_sensitive_data_with_ollama
         if use_ollama
         else check_sensitive_data_with_gemini
     )
-    input_path = os.path.realpath(input_path)
+    # a path, or an in-memory receipt that was never written to disk
+    if isinstance(input_path, str):
+        input_path = os.path.realpath(input_path)
 
-    result = check_function(input_path)
+    precheck = None
+    if local_precheck:
+        receipt = input_path if isinstance(input_path, dict) else load_receipt(input_path)
+        local_result = check_sensitive_data_locally(receipt)
+        # clear leaks and clear passes are decided here, only the rest reach the LLM
+        if local_result["precheck"] != PRECHECK_AMBIGUOUS:
+            return local_result
+        precheck = local_result["precheck"]
+        input_path = receipt
+
+    # left out by the sampling policy: ambiguous local results are still checked
+    if sampled_out and precheck is None:
+        return {
+            "has_sensitive_data": False,
+            "analysis": "Not checked: left out by the guardrail sampling policy",
+            "leaked_fields": [],
+            "sampled_out": True,
+        }
+
+    # with the template coordinates only bands around the masked boxes are sent
+    mosaic = None
+    if coordinates is not None:
+        receipt = input_path if isinstance(input_path, dict) else load_receipt(input_path)
+        mosaic = build_guardrail_mosaic(receipt, coordinates)
+
+    sent = mosaic["receipt"] if mosaic else input_path
+    if batcher is not None and batcher.accepts(sent):
+        # packed with the masked files of other jobs into a single request
+        result = batcher.submit(sent, mosaic=bool(mosaic))
+    elif mosaic:
+        result = check_function(sent, prompt=get_guardrails_mosaic_prompt())
+    else:
+        result = check_function(sent)
+    if mosaic:
+        result["payload"] = mosaic["payload"]
+    if precheck:
+        result["precheck"] = precheck
 
     return result
 
@@ -39,9 +92,29 @@ if __name__ == "__main__":
         action="store_true",
         help="use local model via Ollama instead of Gemini (better privacy)",
     )
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="OCR and PII regexes first, only ambiguous files are sent to the LLM",
+    )
+    parser.add_argument(
+        "-c",
+        "--coordinates",
+        help="coordinates JSON of the template: only bands around the masked boxes are checked",
+    )
     args = parser.parse_args()
 
-    response = execute_guardrails(args.input, args.ollama)
+    coordinates = None
+    if args.coordinates:
+        with open(args.coordinates, "r", encoding="utf-8") as f:
+            coordinates = json.load(f)
+
+    response = execute_guardrails(args.input, args.ollama, args.local, coordinates)
+    if "payload" in response:
+        payload = response["payload"]
+        print(
+            f"sent {payload['sent_bytes']} of {payload['original_bytes']} bytes, ~{payload['sent_tokens']} of ~{payload['original_tokens']} vision tokens"
+        )
 
     if response.get("has_sensitive_data", True):
         analysis = response.get("analysis", "No details provided")
@@ -0,0 +1,68 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+JOURNAL_FILE_NAME = ".journal.jsonl"
+COMPLETED_STATUSES = {"passed"}
+
+
+def get_journal_key(input_sha256, template_version):
+    return f"{input_sha256}:{template_version}"
+
+
+class Journal:
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, JOURNAL_FILE_NAME)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a run killed mid-write leaves a truncated last line
+                    print(f"journal ⚠️: ignoring corrupted line {line_number}")
+                    continue
+                self.entries[entry["key"]] = entry
+
+    def is_completed(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry["status"] in COMPLETED_STATUSES
+
+    def append(self, key, job):
+        match = job.get("match")
+        guardrails = job.get("guardrails")
+        entry = {
+            "key": key,
+            "input_path": job["input_path"],
+            "output_path": job["output_path"],
+            "status": job["status"],
+            "template": f"{match['name']}{match['file_extension']}" if match else None,
+            "guardrails": (
+                {
+                    "has_sensitive_data": guardrails.get("has_sensitive_data"),
+                    "leaked_fields": guardrails.get("leaked_fields", []),
+                }
+                if guardrails
+                else None
+            ),
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[key] = entry
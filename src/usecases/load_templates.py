@@ -1,67 +1,75 @@
 # python src/usecases/load_templates.py -n nu -e .pdf
-import json
 import os
+import sys
+
 import cv2
 
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.utils.hashing import sha256_bytes, sha256_file
+from src.utils.pdf import RENDER_ZOOM, render_pdf_page
+
 IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
 PDF_EXTENSION = ".pdf"
+FINGERPRINT_SUFFIX = ".fingerprint.json"
+
+REDUCED_READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def get_reference_image(template, reduction=1):
+    if reduction not in REDUCED_READ_FLAGS:
+        raise ValueError(f"reduction must be one of {sorted(REDUCED_READ_FLAGS)}")
+
+    cached = template["reference_images"].get(reduction)
+    if cached is not None:
+        return cached
+
+    ref_path = template["reference_path"]
+    if ref_path.lower().endswith(PDF_EXTENSION):
+        image = render_pdf_page(ref_path, zoom=RENDER_ZOOM / reduction)
+    else:
+        image = cv2.imread(ref_path, REDUCED_READ_FLAGS[reduction])
+        if image is None:
+            raise ValueError(f"Could not load reference image: {ref_path}")
+
+    template["reference_images"][reduction] = image
+    return image
+
+
+def get_bank_signature(bank_dir):
+    # any added, removed or edited json/reference file changes the signature
+    return tuple(
+        sorted(
+            (entry.name, entry.stat().st_mtime_ns)
+            for entry in os.scandir(bank_dir)
+            if entry.is_file()
+            # fingerprints are derived from the references, not part of the template set
+            and not entry.name.endswith(FINGERPRINT_SUFFIX)
+        )
+    )
 
 
-def load_bank_templates(
-    bank_name, file_extension, coordinates_dir="src/config/coordinates"
-):
-    templates = []
+def get_template_set_version(bank_name, coordinates_dir="src/config/coordinates"):
     bank_dir = os.path.join(coordinates_dir, bank_name)
-
     if not os.path.exists(bank_dir):
-        raise FileNotFoundError(
-            f"sensitive_data_masker ⚠️: bank directory not found: {bank_dir}"
-        )
+        return None
 
-    is_pdf = file_extension.lower() == PDF_EXTENSION
-    valid_extensions = {PDF_EXTENSION} if is_pdf else IMAGE_EXTENSIONS
-
-    json_files = [f for f in os.listdir(bank_dir) if f.endswith(".json")]
-
-    for json_file in json_files:
-        base_name = json_file.replace(".json", "")
-        json_path = os.path.join(bank_dir, json_file)
-
-        ref_path = None
-        for ext in valid_extensions:
-            potential_ref = os.path.join(bank_dir, f"{base_name}{ext}")
-            if os.path.exists(potential_ref):
-                ref_path = potential_ref
-                break
-
-        if not ref_path:
-            continue
-
-        try:
-            with open(json_path, "r", encoding="utf-8") as f:
-                coordinates = json.load(f)
-
-            if ref_path.lower().endswith(".pdf"):
-                reference_image = None
-            else:
-                reference_image = cv2.imread(ref_path)
-                if reference_image is None:
-                    continue
-
-            templates.append(
-                {
-                    "name": base_name,
-                    "reference_path": ref_path,
-                    "coordinates": coordinates,
-                    "reference_image": reference_image,
-                    "bank_name": bank_name,
-                    "file_extension": file_extension,
-                }
-            )
-        except Exception as e:
-            print(f"sensitive_data_masker ❌: error loading template {json_file}: {e}")
-            continue
-    return templates
+    file_hashes = [
+        f"{file_name}:{sha256_file(os.path.join(bank_dir, file_name))}"
+        for file_name in sorted(os.listdir(bank_dir))
+        if os.path.isfile(os.path.join(bank_dir, file_name))
+        # fingerprints are derived from the references, not part of the template set
+        and not file_name.endswith(FINGERPRINT_SUFFIX)
+    ]
+    return sha256_bytes("\n".join(file_hashes).encode("utf-8"))
 
 
 if __name__ == "__main__":
@@ -72,7 +80,9 @@ if __name__ == "__main__":
     parser.add_argument("-e", "--extension", required=True, help="File extension")
     args = parser.parse_args()
 
-    templates = load_bank_templates(args.name, args.extension)
+    from src.usecases.template_bundle import load_bundle_templates
+
+    templates = load_bundle_templates(args.name, args.extension)
 
     print(f"loaded {len(templates)} template(s) for '{args.name}':")
     for template in templates:
@@ -0,0 +1,220 @@
+# python src/usecases/local_guardrails.py -i output/1.jpeg
+import os
+import re
+import sys
+import unicodedata
+
+import cv2
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.usecases.fingerprint import MIN_WORD_CONFIDENCE, OCR_ERRORS, read_words
+from src.utils.pdf import open_pdf, render_pdf_page
+from src.utils.receipt import get_receipt_image, load_receipt
+
+PRECHECK_LEAK = "leak"
+PRECHECK_PASS = "pass"
+PRECHECK_AMBIGUOUS = "ambiguous"
+
+# fewer readable words than this and the OCR result is not trusted for a pass
+MIN_OCR_WORDS = 8
+# a text layer with fewer words is a scanned PDF, its pages are OCR'd instead
+MIN_TEXT_LAYER_WORDS = 8
+
+CPF_PATTERN = re.compile(r"(?<![\d*•])(\d{3})\.?(\d{3})\.?(\d{3})-?(\d{2})(?![\d*•])")
+PARTIAL_CPF_PATTERN = re.compile(r"[*•]{3}\.?\d{3}\.?\d{3}-?[*•]{2}")
+CNPJ_PATTERN = re.compile(
+    r"(?<!\d)(\d{2})\.?(\d{3})\.?(\d{3})/?(\d{4})-?(\d{2})(?!\d)"
+)
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+PHONE_PATTERN = re.compile(r"(?<!\d)(?:\+?55\s?)?\(?\d{2}\)?\s?9\d{4}[-\s]?\d{4}(?!\d)")
+BANK_ACCOUNT_PATTERN = re.compile(
+    r"\b(agencia|ag|conta|cc)\b[^\d\n]{0,12}\d[\d.\-]{2,}\d", re.IGNORECASE
+)
+RANDOM_KEY_PATTERN = re.compile(
+    r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE
+)
+NAME_LABELS = {
+    "destinatario",
+    "pagador",
+    "favorecido",
+    "recebedor",
+    "remetente",
+    "nome",
+    "origem",
+    "destino",
+    "de",
+    "para",
+}
+# a CNPJ next to one of these is the one of the bank printing the receipt
+INSTITUTION_PATTERN = re.compile(
+    r"\b(s\.?a\.?|ltda|banco|bco|pagamentos|instituicao|cooperativa)\b", re.IGNORECASE
+)
+NAME_PATTERN = re.compile(r"^[A-ZÀ-Ý][a-zà-ÿ]+(?:\s+(?:d[aeo]s?\s+)?[A-ZÀ-Ý][a-zà-ÿ]+)+$")
+
+
+def strip_accents(text):
+    return unicodedata.normalize("NFKD", text).encode("ASCII", "ignore").decode()
+
+
+def is_valid_cpf(digits):
+    if len(digits) != 11 or len(set(digits)) == 1:
+        return False
+    numbers = [int(d) for d in digits]
+    for position in (9, 10):
+        total = sum(n * (position + 1 - i) for i, n in enumerate(numbers[:position]))
+        if (total * 10 % 11) % 10 != numbers[position]:
+            return False
+    return True
+
+
+def is_valid_cnpj(digits):
+    if len(digits) != 14 or len(set(digits)) == 1:
+        return False
+    numbers = [int(d) for d in digits]
+    weights = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    for position in (12, 13):
+        total = sum(n * w for n, w in zip(numbers[:position], weights[13 - position :]))
+        remainder = total % 11
+        if (0 if remainder < 2 else 11 - remainder) != numbers[position]:
+            return False
+    return True
+
+
+def ocr_lines(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    data = read_words(gray)
+
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        if not word.strip() or float(data["conf"][i]) < MIN_WORD_CONFIDENCE:
+            continue
+        line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(line_key, []).append(word)
+    return [" ".join(words) for words in lines.values()]
+
+
+def extract_receipt_lines(receipt):
+    if receipt["extension"] != ".pdf":
+        image = get_receipt_image(receipt)
+        if image.ndim == 3 and image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        return ocr_lines(image)
+
+    # redacted text is gone from the text layer, so it can be read directly
+    with open_pdf(receipt["data"]) as doc:
+        page_count = doc.page_count
+        text = "\n".join(page.get_text() for page in doc)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if sum(len(line.split()) for line in lines) >= MIN_TEXT_LAYER_WORDS:
+        return lines
+
+    lines = []
+    for page_number in range(page_count):
+        lines.extend(ocr_lines(render_pdf_page(receipt["data"], page_number)))
+    return lines
+
+
+def find_name_candidates(lines):
+    candidates = []
+    for index, line in enumerate(lines):
+        words = strip_accents(line).lower().replace(":", " ").split()
+        if not words or words[0] not in NAME_LABELS:
+            continue
+        # the value is on the same line after the label, or on the next line
+        rest = line.split(None, 1)[1].lstrip(": ") if len(line.split()) > 1 else ""
+        for value in (rest, lines[index + 1] if index + 1 < len(lines) else ""):
+            if value and NAME_PATTERN.match(value.strip()):
+                candidates.append(value.strip())
+                break
+    return candidates
+
+
+def scan_lines(lines):
+    text = "\n".join(lines)
+    plain_text = strip_accents(text)
+    leaks = set()
+    suspects = set()
+
+    for match in CPF_PATTERN.finditer(text):
+        if is_valid_cpf("".join(match.groups())):
+            leaks.add("CPF")
+    if PARTIAL_CPF_PATTERN.search(text):
+        leaks.add("CPF_PARCIAL")
+    for index, line in enumerate(lines):
+        context = strip_accents(" ".join(lines[max(index - 1, 0) : index + 1]))
+        for match in CNPJ_PATTERN.finditer(line):
+            if is_valid_cnpj("".join(match.groups())) and not INSTITUTION_PATTERN.search(
+                context
+            ):
+                # a company can also be the payer or the receiver
+                suspects.add("CNPJ")
+    if EMAIL_PATTERN.search(text):
+        leaks.add("EMAIL")
+    if PHONE_PATTERN.search(text):
+        leaks.add("TELEFONE")
+    if BANK_ACCOUNT_PATTERN.search(plain_text):
+        leaks.add("AGENCIA_CONTA")
+    if RANDOM_KEY_PATTERN.search(text):
+        suspects.add("CHAVE_ALEATORIA")
+    if find_name_candidates(lines):
+        # could also be a bank name, only the LLM can tell
+        suspects.add("NOME")
+
+    return leaks, suspects
+
+
+def check_sensitive_data_locally(receipt):
+    try:
+        lines = extract_receipt_lines(receipt)
+    except OCR_ERRORS as e:
+        # without OCR nothing can be decided locally
+        return {
+            "precheck": PRECHECK_AMBIGUOUS,
+            "has_sensitive_data": None,
+            "analysis": f"Local OCR unavailable: {e}",
+            "leaked_fields": [],
+        }
+
+    leaks, suspects = scan_lines(lines)
+    word_count = sum(len(line.split()) for line in lines)
+
+    if leaks:
+        return {
+            "precheck": PRECHECK_LEAK,
+            "has_sensitive_data": True,
+            "analysis": f"Local check found readable {', '.join(sorted(leaks))}",
+            "leaked_fields": sorted(leaks),
+        }
+    if suspects or word_count < MIN_OCR_WORDS:
+        reason = (
+            f"possible {', '.join(sorted(suspects))}"
+            if suspects
+            else f"only {word_count} readable word(s)"
+        )
+        return {
+            "precheck": PRECHECK_AMBIGUOUS,
+            "has_sensitive_data": None,
+            "analysis": f"Local check inconclusive: {reason}",
+            "leaked_fields": sorted(suspects),
+        }
+    return {
+        "precheck": PRECHECK_PASS,
+        "has_sensitive_data": False,
+        "analysis": f"Local check found no PII patterns in {word_count} readable word(s)",
+        "leaked_fields": [],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", required=True, help="Masked file path")
+    args = parser.parse_args()
+
+    result = check_sensitive_data_locally(load_receipt(args.input))
+    print(f"{result['precheck']}: {result['analysis']}")
@@ -0,0 +1,247 @@
+# python src/usecases/mask_verification.py -i output/1.jpeg -n nu -t coordinates_output_3
+# python src/usecases/mask_verification.py --report
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.utils.geometry import get_page_numbers, prepare_boxes, select_page
+from src.utils.pdf import render_pdf_page
+from src.utils.receipt import get_receipt_image, load_receipt
+
+MASK_TIGHTNESS_PATH = ".cache/mask_tightness.json"
+
+# JPEG re-encoding rings around the boxes, so "black" allows some noise
+BLACK_LEVEL = 48
+MIN_BLACK_FRACTION = 0.99
+
+# the margin of a box is a thin strip along each of its sides, a few pixels out
+# so antialiasing and ringing of the box edge are not counted. Ink in it is text
+# that touches the box: a box too short for its line of text leaves ink above
+# and below it. Ink beside a box is only reported, labels are often printed
+# right next to their value ("Ag [box] Cc [box]")
+MARGIN_GAP = 2
+MARGIN_WIDTH = 2
+INK_CONTRAST = 40
+MAX_VERTICAL_SIDES_INK = 0.03
+MAX_SIDE_INK = 0.5
+# boxes above this in the tightness report are drawn close to their neighbours
+TIGHTNESS_WARNING = 0.15
+
+# path -> {bank_name: {template: tightness}}
+loaded_tightness = {}
+tightness_lock = threading.Lock()
+
+
+def get_page_images(receipt, coordinates):
+    # a PDF is checked on its pages rendered at RENDER_ZOOM, where coordinates live
+    if receipt["extension"] != ".pdf":
+        yield 0, get_receipt_image(receipt)
+        return
+    for page_number in get_page_numbers(coordinates):
+        try:
+            yield page_number, render_pdf_page(receipt["data"], page_number)
+        except (IndexError, ValueError):
+            # pages that do not exist were already reported while masking
+            continue
+
+
+def get_box_luminance(image):
+    # transparent pixels are not masked, whatever their color
+    if image.ndim == 2:
+        return image, None
+    luminance = image[:, :, :3].max(axis=2)
+    alpha = image[:, :, 3] if image.shape[2] == 4 else None
+    return luminance, alpha
+
+
+def get_side_ink(luminance, covered, box):
+    x1, y1, x2, y2 = box
+    outer = MARGIN_GAP + MARGIN_WIDTH
+    sides = {
+        "top": (slice(max(y1 - outer, 0), max(y1 - MARGIN_GAP, 0)), slice(x1, x2 + 1)),
+        "bottom": (slice(y2 + 1 + MARGIN_GAP, y2 + 1 + outer), slice(x1, x2 + 1)),
+        "left": (slice(y1, y2 + 1), slice(max(x1 - outer, 0), max(x1 - MARGIN_GAP, 0))),
+        "right": (slice(y1, y2 + 1), slice(x2 + 1 + MARGIN_GAP, x2 + 1 + outer)),
+    }
+
+    ink = {}
+    for side, (rows, columns) in sides.items():
+        # parts of the strip inside other boxes are masked, not background
+        values = luminance[rows, columns][~covered[rows, columns]].astype(np.int16)
+        if not values.size:
+            ink[side] = 0.0
+            continue
+        background = np.median(values)
+        ink[side] = round(float((np.abs(values - background) > INK_CONTRAST).mean()), 4)
+    return ink
+
+
+def measure_boxes(image, boxes):
+    luminance, alpha = get_box_luminance(image)
+    covered = np.zeros(luminance.shape, dtype=bool)
+    for x1, y1, x2, y2 in boxes:
+        covered[y1 : y2 + 1, x1 : x2 + 1] = True
+
+    measurements = []
+    for x1, y1, x2, y2 in boxes:
+        inside = luminance[y1 : y2 + 1, x1 : x2 + 1] <= BLACK_LEVEL
+        if alpha is not None:
+            inside &= alpha[y1 : y2 + 1, x1 : x2 + 1] == 255
+        measurements.append(
+            {
+                "box": [int(x1), int(y1), int(x2), int(y2)],
+                "black_fraction": round(float(inside.mean()), 4),
+                "margin_ink": get_side_ink(luminance, covered, (x1, y1, x2, y2)),
+            }
+        )
+    return measurements
+
+
+def is_undersized(margin_ink):
+    return (
+        min(margin_ink["top"], margin_ink["bottom"]) > MAX_VERTICAL_SIDES_INK
+        or max(margin_ink["top"], margin_ink["bottom"]) > MAX_SIDE_INK
+    )
+
+
+def verify_mask(receipt, coordinates, check_margins=True):
+    measurements = []
+    for page_number, image in get_page_images(receipt, coordinates):
+        height, width = image.shape[:2]
+        boxes = prepare_boxes(select_page(coordinates, page_number), width, height)
+        for measurement in measure_boxes(image, boxes):
+            measurements.append({"page": page_number, **measurement})
+
+    failures = []
+    for index, measurement in enumerate(measurements):
+        if measurement["black_fraction"] < MIN_BLACK_FRACTION:
+            failures.append(
+                f"box {index} is only {measurement['black_fraction']:.1%} black"
+            )
+        elif check_margins and is_undersized(measurement["margin_ink"]):
+            failures.append(f"box {index} cuts through text around it")
+
+    return {
+        "passed": not failures,
+        "failures": failures,
+        "boxes": measurements,
+    }
+
+
+def read_tightness(tightness_path):
+    if tightness_path not in loaded_tightness:
+        tightness = {}
+        if os.path.exists(tightness_path):
+            try:
+                with open(tightness_path, "r", encoding="utf-8") as f:
+                    tightness = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(
+                    f"mask_verification ⚠️: ignoring unreadable report {tightness_path}: {e}"
+                )
+        loaded_tightness[tightness_path] = tightness
+    return loaded_tightness[tightness_path]
+
+
+def write_tightness(tightness_path, tightness):
+    tightness_dir = os.path.dirname(tightness_path)
+    if tightness_dir:
+        os.makedirs(tightness_dir, exist_ok=True)
+    temp_path = f"{tightness_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(tightness, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(temp_path, tightness_path)
+
+
+def record_mask_tightness(template, verification, tightness_path=MASK_TIGHTNESS_PATH):
+    with tightness_lock:
+        tightness = read_tightness(tightness_path)
+        bank_tightness = tightness.setdefault(template["bank_name"], {})
+        entry = bank_tightness.setdefault(
+            f"{template['name']}{template['file_extension']}",
+            {"checks": 0, "failures": 0, "boxes": []},
+        )
+        entry["checks"] += 1
+        entry["failures"] += 0 if verification["passed"] else 1
+
+        # the most ink seen next to each box: the higher, the tighter that box
+        # is drawn around the text of real receipts
+        boxes = entry["boxes"]
+        for index, measurement in enumerate(verification["boxes"]):
+            if index >= len(boxes):
+                boxes.append({"max_margin_ink": 0.0, "min_black_fraction": 1.0})
+            boxes[index]["max_margin_ink"] = max(
+                boxes[index]["max_margin_ink"], max(measurement["margin_ink"].values())
+            )
+            boxes[index]["min_black_fraction"] = min(
+                boxes[index]["min_black_fraction"], measurement["black_fraction"]
+            )
+        write_tightness(tightness_path, tightness)
+
+
+def print_tightness_report(tightness_path=MASK_TIGHTNESS_PATH):
+    tightness = read_tightness(tightness_path)
+    if not tightness:
+        print(f"mask_verification: no measurements in {tightness_path}")
+        return
+
+    print(f"{'template':<40}{'checks':>7}{'failed':>7}{'tightest box':>14}{'ink':>7}")
+    for bank_name in sorted(tightness):
+        for template_name, entry in sorted(tightness[bank_name].items()):
+            boxes = entry["boxes"]
+            tightest = max(
+                range(len(boxes)),
+                key=lambda index: boxes[index]["max_margin_ink"],
+                default=None,
+            )
+            ink = boxes[tightest]["max_margin_ink"] if boxes else 0.0
+            warning = " ⚠️" if ink > TIGHTNESS_WARNING else ""
+            print(
+                f"{bank_name + '/' + template_name:<40}{entry['checks']:>7}{entry['failures']:>7}"
+                f"{'-' if tightest is None else tightest:>14}{ink:>7.0%}{warning}"
+            )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="Masked file path")
+    parser.add_argument("-n", "--name", help="Bank name")
+    parser.add_argument("-t", "--template", help="Template name")
+    parser.add_argument(
+        "--report", action="store_true", help="print the mask tightness report"
+    )
+    args = parser.parse_args()
+
+    if args.report:
+        print_tightness_report()
+        exit(0)
+    if not (args.input and args.name and args.template):
+        parser.error("-i, -n and -t are required without --report")
+
+    from src.usecases.template_bundle import load_bundle_templates
+
+    extension = os.path.splitext(args.input)[1]
+    templates = load_bundle_templates(args.name, extension)
+    template = next(t for t in templates if t["name"] == args.template)
+
+    verification = verify_mask(load_receipt(args.input), template["coordinates"])
+    for index, measurement in enumerate(verification["boxes"]):
+        print(
+            f"box {index} (page {measurement['page'] + 1}): {measurement['black_fraction']:.1%} black, "
+            f"ink around it {measurement['margin_ink']}"
+        )
+    if verification["passed"]:
+        print("✅ every box is masked")
+    else:
+        for failure in verification["failures"]:
+            print(f"❌ {failure}")
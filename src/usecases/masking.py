@@ -1,29 +1,50 @@
 # python src/usecases/masking.py -i 1.jpeg -o output.jpeg -c src/config/coordinates/nu/coordinates_output_1.json
 import json
 import os
-import cv2
+import tempfile
 import fitz
-from PIL import Image, ImageDraw
+import numpy as np
 
+try:
+    import jpeglib
+except ImportError:
+    jpeglib = None
+
+from src.utils.geometry import get_page_numbers, prepare_boxes, scale_boxes, select_page
+from src.utils.image import decode_image, encode_image
+from src.utils.pdf import RENDER_ZOOM, get_render_size, open_pdf
+from src.utils.receipt import create_receipt, get_receipt_image
+
+JPEG_EXTENSIONS = {".jpg", ".jpeg"}
+DCT_BLOCK_SIZE = 8
+# quantized DC of a black block is -1024 / q: pixel 0 is -128 after the level
+# shift, and the DC coefficient is 8 times the block mean
+BLACK_DC = -1024
 
-def mask_image(input_path, coordinates, output_path):
-    try:
-        input_image = cv2.imread(input_path)
-        if input_image is None:
-            raise ValueError(f"Could not load image: {input_path}")
 
-        img = Image.open(input_path)
-        draw = ImageDraw.Draw(img)
+def mask_image_array(image, coordinates):
+    # masks in place; boxes are inclusive of their right and bottom edges
+    height, width = image.shape[:2]
+    for x1, y1, x2, y2 in prepare_boxes(select_page(coordinates, 0), width, height):
+        image[y1 : y2 + 1, x1 : x2 + 1] = 0
+        if image.ndim == 3 and image.shape[2] == 4:
+            # black, not transparent
+            image[y1 : y2 + 1, x1 : x2 + 1, 3] = np.iinfo(image.dtype).max
+    return image
+
+
+def mask_image(input_path, coordinates, output_path, image=None):
+    try:
+        if image is None:
+            with open(input_path, "rb") as f:
+                image = decode_image(f.read())
 
-        for coord in coordinates:
-            x = coord["x"]
-            y = coord["y"]
-            width = coord["width"]
-            height = coord["height"]
-            draw.rectangle([x, y, x + width, y + height], fill="black")
+        mask_image_array(image, coordinates)
+        data = encode_image(image, os.path.splitext(output_path)[1])
 
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        img.save(output_path)
+        with open(output_path, "wb") as f:
+            f.write(data)
         return True
 
     except Exception as e:
@@ -31,28 +52,133 @@ def mask_image(input_path, coordinates, output_path):
         return False
 
 
-def mask_pdf(input_path, coordinates, output_path):
+def can_mask_jpeg_dct(input_path, output_path):
+    return (
+        jpeglib is not None
+        and os.path.splitext(input_path)[1].lower() in JPEG_EXTENSIONS
+        and os.path.splitext(output_path)[1].lower() in JPEG_EXTENSIONS
+    )
+
+
+def get_mcu_ranges(boxes, mcu_width, mcu_height):
+    # inclusive pixel boxes -> half-open ranges of the MCUs that cover them
+    mcu_boxes = boxes.copy()
+    mcu_boxes[:, [0, 2]] //= mcu_width
+    mcu_boxes[:, [1, 3]] //= mcu_height
+    mcu_boxes[:, 2:] += 1
+    return mcu_boxes
+
+
+def mask_jpeg_coefficients(jpeg, coordinates):
+    # blacks out whole MCUs in the compressed domain: the boxes grow to MCU
+    # boundaries, and the coefficients of every other block are kept as they are
+    if jpeg.jpeg_color_space not in (
+        jpeglib.Colorspace.JCS_YCbCr,
+        jpeglib.Colorspace.JCS_GRAYSCALE,
+    ):
+        print("⚠️ JPEG is not YCbCr/grayscale, masking decoded pixels instead")
+        return False
+
+    # rows of samp_factor are (vertical, horizontal) per component
+    samp_factor = np.asarray(jpeg.samp_factor)
+    max_vertical, max_horizontal = samp_factor.max(axis=0)
+    boxes = prepare_boxes(select_page(coordinates, 0), jpeg.width, jpeg.height)
+    mcu_boxes = get_mcu_ranges(
+        boxes, DCT_BLOCK_SIZE * max_horizontal, DCT_BLOCK_SIZE * max_vertical
+    )
+
+    components = [jpeg.Y, jpeg.Cb, jpeg.Cr] if jpeg.has_chrominance else [jpeg.Y]
+    for index, coefficients in enumerate(components):
+        vertical, horizontal = samp_factor[index]
+        if index == 0:
+            quantization = jpeg.qt[jpeg.quant_tbl_no[0]][0, 0]
+            dc = int(round(BLACK_DC / quantization))
+        else:
+            # neutral chroma: every coefficient is 0
+            dc = 0
+        for x1, y1, x2, y2 in mcu_boxes:
+            blocks = coefficients[
+                y1 * vertical : y2 * vertical, x1 * horizontal : x2 * horizontal
+            ]
+            blocks[:] = 0
+            blocks[:, :, 0, 0] = dc
+    return True
+
+
+def mask_jpeg_dct_data(data, coordinates):
+    # returns the masked JPEG, or None when its color space cannot be masked here.
+    # jpeglib only reads and writes files: the in-memory receipt goes through a
+    # scratch file, so the input is not read again and the output path stays
+    # untouched until the masked receipt is saved
+    fd, scratch_path = tempfile.mkstemp(suffix=".jpeg")
     try:
-        doc = fitz.open(input_path)
-        page = doc[0]
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        jpeg = jpeglib.read_dct(scratch_path)
+        if not mask_jpeg_coefficients(jpeg, coordinates):
+            return None
+        jpeg.write_dct(scratch_path)
+        with open(scratch_path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(scratch_path)
+
+
+def mask_jpeg_dct(input_path, coordinates, output_path):
+    try:
+        with open(input_path, "rb") as f:
+            data = mask_jpeg_dct_data(f.read(), coordinates)
+        if data is None:
+            return mask_image(input_path, coordinates, output_path)
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "wb") as f:
+            f.write(data)
+        return True
+
+    except Exception as e:
+        print(f"error masking JPEG coefficients: {e}")
+        return False
 
-        page_rect = page.rect
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
 
-        scale_x = page_rect.width / pix.width
-        scale_y = page_rect.height / pix.height
+def redact_pdf(doc, coordinates, file_name):
+    page_numbers = get_page_numbers(coordinates)
+    for page_number in page_numbers:
+        if page_number >= doc.page_count:
+            print(
+                f"⚠️ coordinates for page {page_number + 1} ignored, the PDF has {doc.page_count} page(s)"
+            )
+    unmasked_pages = set(range(doc.page_count)) - set(page_numbers)
+    if unmasked_pages:
+        print(
+            f"⚠️ no coordinates for page(s) {', '.join(str(n + 1) for n in sorted(unmasked_pages))} of {file_name}"
+        )
 
-        for coord in coordinates:
-            pdf_x = coord["x"] * scale_x
-            pdf_y = coord["y"] * scale_y
-            pdf_width = coord["width"] * scale_x
-            pdf_height = coord["height"] * scale_y
+    for page_number in page_numbers:
+        if page_number >= doc.page_count:
+            continue
+        page = doc[page_number]
 
-            rect = fitz.Rect(pdf_x, pdf_y, pdf_x + pdf_width, pdf_y + pdf_height)
-            page.draw_rect(rect, color=(0, 0, 0), fill=(0, 0, 0))
+        # coordinates live in the pixel space of the page rendered at RENDER_ZOOM
+        width, height = get_render_size(page)
+        boxes = prepare_boxes(select_page(coordinates, page_number), width, height)
+        for x1, y1, x2, y2 in scale_boxes(boxes, 1 / RENDER_ZOOM, 1 / RENDER_ZOOM):
+            # annotations are placed in the unrotated page space
+            rect = fitz.Rect(x1, y1, x2, y2) * page.derotation_matrix
+            page.add_redact_annot(rect, fill=(0, 0, 0))
+
+        # removes the text, vector graphics and image pixels under the boxes,
+        # instead of only drawing over them
+        page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_PIXELS)
+
+
+def mask_pdf(input_path, coordinates, output_path):
+    try:
+        doc = fitz.open(input_path)
+        redact_pdf(doc, coordinates, os.path.basename(input_path))
 
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        doc.save(output_path)
+        doc.save(output_path, garbage=4, deflate=True)
         doc.close()
         return True
 
@@ -61,10 +187,43 @@ def mask_pdf(input_path, coordinates, output_path):
         return False
 
 
-def mask_file(input_path, coordinates, output_path):
+def mask_receipt(receipt, coordinates, output_path, jpeg_dct=False):
+    # returns the masked receipt for output_path; it is only written by save_receipt
+    try:
+        if receipt["extension"] == ".pdf":
+            doc = open_pdf(receipt["data"])
+            redact_pdf(doc, coordinates, os.path.basename(receipt["path"]))
+            data = doc.tobytes(garbage=4, deflate=True)
+            doc.close()
+            return create_receipt(output_path, data)
+
+        if jpeg_dct and receipt["extension"] in JPEG_EXTENSIONS:
+            if can_mask_jpeg_dct(receipt["path"], output_path):
+                data = mask_jpeg_dct_data(receipt["data"], coordinates)
+                if data is not None:
+                    return create_receipt(output_path, data)
+            if jpeglib is None:
+                print("⚠️ jpeglib is not installed, masking decoded pixels instead")
+
+        image = mask_image_array(get_receipt_image(receipt).copy(), coordinates)
+        data = encode_image(image, os.path.splitext(output_path)[1])
+        return create_receipt(output_path, data, image)
+
+    except Exception as e:
+        print(f"error masking receipt: {e}")
+        return None
+
+
+def mask_file(input_path, coordinates, output_path, jpeg_dct=False):
     _, ext = os.path.splitext(input_path)
     ext_lower = ext.lower()
 
+    if jpeg_dct and ext_lower in JPEG_EXTENSIONS:
+        if can_mask_jpeg_dct(input_path, output_path):
+            return mask_jpeg_dct(input_path, coordinates, output_path)
+        if jpeglib is None:
+            print("⚠️ jpeglib is not installed, masking decoded pixels instead")
+
     if ext_lower in [".jpg", ".jpeg", ".png"]:
         return mask_image(input_path, coordinates, output_path)
     elif ext_lower == ".pdf":
@@ -83,6 +242,11 @@ if __name__ == "__main__":
     parser.add_argument(
         "-c", "--coordinates", required=True, help="Coordinates JSON file"
     )
+    parser.add_argument(
+        "--jpeg-dct",
+        action="store_true",
+        help="mask JPEGs in the DCT domain (requires jpeglib)",
+    )
     args = parser.parse_args()
 
     input_path = os.path.realpath(args.input)
@@ -92,7 +256,7 @@ if __name__ == "__main__":
     with open(coordinates_path, "r", encoding="utf-8") as f:
         coordinates = json.load(f)
 
-    success = mask_file(input_path, coordinates, output_path)
+    success = mask_file(input_path, coordinates, output_path, args.jpeg_dct)
 
     if success:
         print(f"masked file saved to: {output_path}")
@@ -0,0 +1,85 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.utils.hashing import sha256_bytes
+
+MATCH_CACHE_PATH = ".cache/match_cache.sqlite"
+MAX_CACHE_ENTRIES = 50000
+
+# path -> MatchCache, so every thread shares one connection per file
+open_caches = {}
+open_caches_lock = threading.Lock()
+
+
+def get_prompt_version(prompt):
+    return sha256_bytes(prompt.encode("utf-8"))[:16]
+
+
+def get_match_cache_key(input_sha256, template_sha256s, backend, model, prompt_version):
+    parts = [input_sha256, ",".join(template_sha256s), backend, model, prompt_version]
+    return sha256_bytes("|".join(parts).encode("utf-8"))
+
+
+class MatchCache:
+    def __init__(self, path=MATCH_CACHE_PATH, max_entries=MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS match_results (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS match_results_last_used ON match_results (last_used)"
+        )
+        self.connection.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT result FROM match_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE match_results SET last_used = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self.connection.commit()
+        return json.loads(row[0])
+
+    def put(self, key, result):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO match_results (key, result, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(result, ensure_ascii=False), time.time()),
+            )
+            # least recently used entries go first when the cache is full
+            self.connection.execute(
+                """
+                DELETE FROM match_results WHERE key IN (
+                    SELECT key FROM match_results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self.connection.commit()
+
+
+def get_match_cache(path=MATCH_CACHE_PATH):
+    with open_caches_lock:
+        if path not in open_caches:
+            open_caches[path] = MatchCache(path)
+        return open_caches[path]
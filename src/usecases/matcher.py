@@ -8,34 +8,92 @@ if __name__ == "__main__":
         0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
     )
 
-from src.clients.ollama import compare_templates_with_ollama
-from src.clients.gemini import compare_templates_with_gemini
-from src.usecases.load_templates import load_bank_templates
+from src.clients.ollama import (
+    OLLAMA_MODEL,
+    compare_multiple_templates_with_ollama,
+    compare_templates_with_ollama,
+)
+from src.clients.gemini import (
+    GEMINI_MODEL,
+    compare_multiple_templates_with_gemini,
+    compare_templates_with_gemini,
+)
+from src.config.prompts.compare_templates_prompt import (
+    get_compare_multiple_templates_prompt,
+    get_compare_templates_prompt,
+)
+from src.config.prompts.compare_templates_prompt_ollama import (
+    get_compare_multiple_templates_prompt_ollama,
+    get_compare_templates_prompt_ollama,
+)
+from src.usecases.fingerprint import OCR_ERRORS, match_template_by_fingerprint
+from src.usecases.template_bundle import load_bundle_templates
+from src.usecases.match_cache import (
+    MATCH_CACHE_PATH,
+    get_match_cache,
+    get_match_cache_key,
+    get_prompt_version,
+)
+from src.usecases.prerank import rank_templates
+from src.usecases.template_index import identify_bank_locally
+from src.usecases.template_stats import (
+    TEMPLATE_STATS_PATH,
+    order_by_hit_rate,
+    record_template_hit,
+)
+from src.utils.hashing import sha256_file
 
 
-def match_template(
-    input_path,
-    templates=None,
-    use_ollama=False,
-    bank_name=None,
-    file_extension=None,
-):
-    if not templates:
-        templates = load_bank_templates(bank_name, file_extension)
+def get_reference_sha256(template):
+    # template records live as long as the bundle they come from, which is
+    # recompiled when the reference files change, so the hash stays valid
+    if "reference_sha256" not in template:
+        template["reference_sha256"] = sha256_file(template["reference_path"])
+    return template["reference_sha256"]
 
-    if not templates:
-        print(
-            f"no templates found for bank '{bank_name}' with extension '{file_extension}'"
-        )
-        return None
 
-    compare_function = (
-        compare_templates_with_ollama if use_ollama else compare_templates_with_gemini
+def compare_with_cache(cache_context, prompt, templates, compare_function, *args):
+    if cache_context is None:
+        return compare_function(*args)
+
+    key = get_match_cache_key(
+        cache_context["input_sha256"],
+        [get_reference_sha256(template) for template in templates],
+        cache_context["backend"],
+        cache_context["model"],
+        get_prompt_version(prompt),
     )
+    cached = cache_context["cache"].get(key)
+    if cached is not None:
+        return cached
+
+    result = compare_function(*args)
+    # failed calls are reported as a non-match, they must not be remembered as one
+    if not str(result.get("reason", "")).startswith("Error:"):
+        cache_context["cache"].put(key, result)
+    return result
+
+
+def match_pairwise(
+    input_path, templates, use_ollama, early_exit_confidence=None, cache_context=None
+):
+    if use_ollama:
+        compare_function = compare_templates_with_ollama
+        prompt = get_compare_templates_prompt_ollama()
+    else:
+        compare_function = compare_templates_with_gemini
+        prompt = get_compare_templates_prompt()
 
     matchs_found = []
     for template in templates:
-        result = compare_function(template["reference_path"], input_path)
+        result = compare_with_cache(
+            cache_context,
+            prompt,
+            [template],
+            compare_function,
+            template["reference_path"],
+            input_path,
+        )
 
         confidence = result.get("confidence", 0.0)
         is_match = result.get("is_match", False)
@@ -49,23 +107,178 @@ def match_template(
             }
             matchs_found.append(match)
 
+            if (
+                early_exit_confidence is not None
+                and confidence >= early_exit_confidence
+            ):
+                break
+
     if not matchs_found:
         return None
 
     # TODO: Create a tie-breaking method between N templates
-    best_match = max(matchs_found, key=lambda x: x["confidence"])["template"]
+    return max(matchs_found, key=lambda x: x["confidence"])["template"]
+
+
+def match_single_request(input_path, templates, use_ollama, cache_context=None):
+    if use_ollama:
+        compare_function = compare_multiple_templates_with_ollama
+        prompt = get_compare_multiple_templates_prompt_ollama(len(templates))
+    else:
+        compare_function = compare_multiple_templates_with_gemini
+        prompt = get_compare_multiple_templates_prompt(len(templates))
+
+    result = compare_with_cache(
+        cache_context,
+        prompt,
+        templates,
+        compare_function,
+        [template["reference_path"] for template in templates],
+        input_path,
+    )
+
+    best_index = result.get("best_index", -1)
+    if not result.get("is_match", False):
+        return None
+    if not isinstance(best_index, int) or not 0 <= best_index < len(templates):
+        print(f"invalid template index in response: {best_index}")
+        return None
+
+    return templates[best_index]
+
+
+def match_template(
+    input_path,
+    templates=None,
+    use_ollama=False,
+    bank_name=None,
+    file_extension=None,
+    top_k=None,
+    skip_llm_score=None,
+    early_exit_confidence=None,
+    template_stats_path=TEMPLATE_STATS_PATH,
+    single_request=False,
+    match_cache_path=MATCH_CACHE_PATH,
+    use_fingerprints=False,
+    receipt=None,
+):
+    # every local step and the LLM clients take the in-memory receipt instead of
+    # reading the file again
+    source = receipt or input_path
+
+    if not templates:
+        if not bank_name:
+            bank_name = identify_bank_locally(source)
+            print(f"bank identified by the template index: {bank_name}")
+        templates = load_bundle_templates(bank_name, file_extension)
+
+    if not templates:
+        print(
+            f"no templates found for bank '{bank_name}' with extension '{file_extension}'"
+        )
+        return None
+
+    if use_fingerprints:
+        try:
+            best_match = match_template_by_fingerprint(source, templates)
+        except OCR_ERRORS as e:
+            # without OCR nothing can be matched locally
+            print(f"fingerprint ⚠️: local OCR unavailable: {e}")
+            best_match = None
+        if best_match:
+            if template_stats_path:
+                record_template_hit(best_match, template_stats_path)
+            return best_match
+        print("fingerprint: no confident match, falling back to LLM comparison")
+
+    if top_k or skip_llm_score is not None:
+        ranking = rank_templates(source, templates)
+        best = ranking[0]
+        if skip_llm_score is not None and best["score"] >= skip_llm_score:
+            print(
+                f"prerank: {best['template']['name']} scored {best['score']:.3f}, skipping LLM comparison"
+            )
+            if template_stats_path:
+                record_template_hit(best["template"], template_stats_path)
+            return best["template"]
+
+        if top_k:
+            ranking = ranking[:top_k]
+        templates = [item["template"] for item in ranking]
+
+    if template_stats_path:
+        templates = order_by_hit_rate(templates, template_stats_path)
+
+    cache_context = None
+    if match_cache_path:
+        cache_context = {
+            "cache": get_match_cache(match_cache_path),
+            "input_sha256": receipt["sha256"] if receipt else sha256_file(input_path),
+            "backend": "ollama" if use_ollama else "gemini",
+            "model": OLLAMA_MODEL if use_ollama else GEMINI_MODEL,
+        }
+
+    if single_request:
+        best_match = match_single_request(
+            source, templates, use_ollama, cache_context
+        )
+    else:
+        best_match = match_pairwise(
+            source, templates, use_ollama, early_exit_confidence, cache_context
+        )
+
+    if best_match and template_stats_path:
+        record_template_hit(best_match, template_stats_path)
     return best_match
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("-n", "--name", required=True, help="Bank name")
+    parser.add_argument(
+        "-n",
+        "--name",
+        required=False,
+        help="Bank name (detected with the local template index when omitted)",
+    )
     parser.add_argument("-i", "--input", required=True, help="Input file path")
     parser.add_argument(
         "--ollama",
         action="store_true",
         help="use local model via Ollama instead of Gemini (better privacy)",
     )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=None,
+        help="compare only the k templates most similar to the input (local pre-ranking)",
+    )
+    parser.add_argument(
+        "--skip-llm-score",
+        type=float,
+        default=None,
+        help="accept the best pre-ranked template without LLM calls when its score (0-1) reaches this value",
+    )
+    parser.add_argument(
+        "--early-exit",
+        type=float,
+        default=None,
+        help="stop comparing as soon as a template matches with at least this confidence",
+    )
+    parser.add_argument(
+        "--single-request",
+        action="store_true",
+        help="send the input and all candidate templates in one LLM request",
+    )
+    parser.add_argument(
+        "--no-match-cache",
+        action="store_true",
+        help=f"do not reuse or store comparison results in {MATCH_CACHE_PATH}",
+    )
+    parser.add_argument(
+        "--ocr-match",
+        action="store_true",
+        help="match with local OCR label fingerprints, using the LLM only when none is confident",
+    )
     args = parser.parse_args()
 
     extension = os.path.splitext(args.input)[1]
@@ -75,6 +288,12 @@ if __name__ == "__main__":
         use_ollama=args.ollama,
         bank_name=args.name,
         file_extension=extension,
+        top_k=args.top_k,
+        skip_llm_score=args.skip_llm_score,
+        early_exit_confidence=args.early_exit,
+        single_request=args.single_request,
+        match_cache_path=None if args.no_match_cache else MATCH_CACHE_PATH,
+        use_fingerprints=args.ocr_match,
     )
 
     if result:
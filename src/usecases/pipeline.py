@@ -0,0 +1,366 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.usecases.template_bundle import load_bundle_templates
+from src.usecases.match_cache import MATCH_CACHE_PATH
+from src.usecases.matcher import match_template
+from src.usecases.masking import JPEG_EXTENSIONS, mask_receipt
+from src.usecases.mask_verification import (
+    MASK_TIGHTNESS_PATH,
+    record_mask_tightness,
+    verify_mask,
+)
+from src.usecases.registration import align_coordinates
+from src.usecases.template_index import identify_bank_locally
+from src.usecases.guardrails import execute_guardrails
+from src.usecases.guardrail_policy import (
+    GUARDRAIL_AUDIT_PATH,
+    GUARDRAIL_POLICY_PATH,
+    SAMPLE_AFTER_PASSES,
+    SAMPLE_EVERY,
+    decide_guardrails,
+    record_guardrails_outcome,
+    record_local_failure,
+)
+from src.utils.receipt import load_receipt, save_receipt
+
+STATUS_PASSED = "passed"
+STATUS_NO_MATCH = "no_match"
+STATUS_MASK_ERROR = "mask_error"
+STATUS_MASK_UNVERIFIED = "mask_unverified"
+STATUS_GUARDRAILS_FAILED = "guardrails_failed"
+STATUS_ERROR = "error"
+STATUS_SKIPPED = "skipped"
+
+DEFAULT_STAGE_WORKERS = {"match": 4, "mask": 2, "verify": 2, "guardrails": 4}
+DEFAULT_QUEUE_SIZE = 8
+
+
+def create_job(input_path, bank_name, extension, output_path):
+    return {
+        "input_path": input_path,
+        "bank_name": bank_name,
+        "extension": extension,
+        "output_path": output_path,
+        # in-memory input and masked output, see src/utils/receipt.py
+        "receipt": None,
+        "masked_receipt": None,
+        "match": None,
+        "coordinates": None,
+        "mask_verification": None,
+        "guardrails": None,
+        "status": None,
+        "journal_key": None,
+    }
+
+
+def match_stage(job, options):
+    file_name = os.path.basename(job["input_path"])
+    job["receipt"] = load_receipt(job["input_path"])
+    if not job["bank_name"]:
+        job["bank_name"] = identify_bank_locally(job["receipt"])
+        print(f"{file_name}: bank identified by the template index: {job['bank_name']}")
+    templates = load_bundle_templates(job["bank_name"], job["extension"])
+    match = match_template(
+        job["input_path"],
+        templates=templates,
+        use_ollama=options["use_ollama"],
+        top_k=options.get("top_k"),
+        skip_llm_score=options.get("skip_llm_score"),
+        early_exit_confidence=options.get("early_exit_confidence"),
+        single_request=options.get("single_request", False),
+        match_cache_path=options.get("match_cache_path", MATCH_CACHE_PATH),
+        use_fingerprints=options.get("use_fingerprints", False),
+        receipt=job["receipt"],
+    )
+    if not match:
+        print(f"{file_name}: no matching template found")
+        job["status"] = STATUS_NO_MATCH
+        return
+
+    print(f"{file_name}: matched template: {match['name']}{match['file_extension']}")
+    job["match"] = match
+
+
+def mask_stage(job, options):
+    file_name = os.path.basename(job["input_path"])
+    coordinates = job["match"]["coordinates"]
+    if options.get("align"):
+        alignment = align_coordinates(job["match"], job["receipt"])
+        if alignment:
+            print(f"{file_name}: aligned with template ({alignment['inliers']} inliers)")
+            coordinates = alignment["coordinates"]
+        else:
+            print(f"{file_name}: could not align with template, using its coordinates")
+    job["coordinates"] = coordinates
+
+    masked_receipt = mask_receipt(
+        job["receipt"],
+        coordinates,
+        job["output_path"],
+        jpeg_dct=options.get("jpeg_dct", False),
+    )
+    job["receipt"] = None
+    if masked_receipt is None:
+        print(f"{file_name}: error masking file")
+        job["status"] = STATUS_MASK_ERROR
+        return
+    job["masked_receipt"] = masked_receipt
+
+
+def verify_stage(job, options):
+    if not options.get("verify_masks"):
+        return
+
+    file_name = os.path.basename(job["input_path"])
+    masked_receipt = job["masked_receipt"]
+    # DCT masking blacks out whole MCUs, past the box and into the text around it
+    dct_masked = options.get("jpeg_dct") and masked_receipt["extension"] in JPEG_EXTENSIONS
+    verification = verify_mask(
+        masked_receipt, job["coordinates"], check_margins=not dct_masked
+    )
+    job["mask_verification"] = verification
+    record_mask_tightness(
+        job["match"],
+        verification,
+        options.get("mask_tightness_path", MASK_TIGHTNESS_PATH),
+    )
+    if verification["passed"]:
+        return
+
+    for failure in verification["failures"]:
+        print(f"{file_name}: mask verification failed: {failure}")
+    if options.get("guardrail_sampling"):
+        record_local_failure(
+            job["match"],
+            masked_receipt["sha256"],
+            f"mask verification: {'; '.join(verification['failures'])}",
+            policy_path=options.get("guardrail_policy_path", GUARDRAIL_POLICY_PATH),
+            audit_path=options.get("guardrail_audit_path", GUARDRAIL_AUDIT_PATH),
+        )
+    # kept for inspection, like files that fail the guardrails
+    save_receipt(masked_receipt)
+    job["masked_receipt"] = None
+    job["status"] = STATUS_MASK_UNVERIFIED
+
+
+def guardrails_stage(job, options):
+    file_name = os.path.basename(job["input_path"])
+    receipt_sha256 = job["masked_receipt"]["sha256"]
+    decision = None
+    if options.get("guardrail_sampling"):
+        decision = decide_guardrails(
+            job["match"],
+            receipt_sha256,
+            job["mask_verification"],
+            sample_after=options.get("sample_after", SAMPLE_AFTER_PASSES),
+            sample_every=options.get("sample_every", SAMPLE_EVERY),
+            policy_path=options.get("guardrail_policy_path", GUARDRAIL_POLICY_PATH),
+        )
+
+    guardrails = execute_guardrails(
+        job["masked_receipt"],
+        options["use_ollama"],
+        local_precheck=options.get("local_guardrails", False),
+        coordinates=job["coordinates"] if options.get("guardrail_mosaic") else None,
+        sampled_out=decision is not None and not decision["check"],
+        batcher=options.get("guardrail_batcher"),
+    )
+    job["guardrails"] = guardrails
+    if decision is not None:
+        record_guardrails_outcome(
+            job["match"],
+            receipt_sha256,
+            decision,
+            guardrails,
+            policy_path=options.get("guardrail_policy_path", GUARDRAIL_POLICY_PATH),
+            audit_path=options.get("guardrail_audit_path", GUARDRAIL_AUDIT_PATH),
+        )
+        if guardrails.get("sampled_out"):
+            print(f"{file_name}: guardrails skipped, {decision['reason']}")
+    # the only write of the output file
+    save_receipt(job["masked_receipt"])
+    job["masked_receipt"] = None
+    if guardrails["has_sensitive_data"]:
+        print(f"{file_name}: guardrails check failed")
+        # TODO: decide if we want to keep or delete the output file by argument
+        # os.remove(output_path)
+        job["status"] = STATUS_GUARDRAILS_FAILED
+        return
+
+    print(f"{file_name}: guardrails check passed")
+    # TODO: decide if we want to keep or delete the output file by argument
+    # os.remove(input_path)
+    job["status"] = STATUS_PASSED
+
+
+STAGES = [
+    ("match", match_stage),
+    ("mask", mask_stage),
+    ("verify", verify_stage),
+    ("guardrails", guardrails_stage),
+]
+
+
+def run_stage(stage_function, job, options):
+    try:
+        stage_function(job, options)
+    except Exception as e:
+        print(f"❌ error processing {job['input_path']}: {e}")
+        job["status"] = STATUS_ERROR
+
+
+def finish_job(job, options):
+    # finished jobs are kept for the summary, their file contents are not
+    job["receipt"] = None
+    job["masked_receipt"] = None
+    journal = options.get("journal")
+    if journal is not None and job["journal_key"] is not None:
+        journal.append(job["journal_key"], job)
+
+
+def process_stage(stage_function, job, options):
+    run_stage(stage_function, job, options)
+    if job["status"] is None:
+        return
+    try:
+        finish_job(job, options)
+    except Exception as e:
+        # an error here would end the worker of the stage with jobs still queued
+        print(f"❌ error finishing {job['input_path']}: {e}")
+        job["status"] = STATUS_ERROR
+
+
+def run_stages(job, options):
+    for _, stage_function in STAGES:
+        process_stage(stage_function, job, options)
+        if job["status"] is not None:
+            break
+    return job
+
+
+def create_stage_stats(stage_name, workers):
+    return {
+        "stage": stage_name,
+        "workers": workers,
+        "processed": 0,
+        "busy_seconds": 0.0,
+        "queue_samples": 0,
+        "queue_total": 0,
+        "queue_max": 0,
+    }
+
+
+async def stage_worker(stage, options, loop, stats):
+    while True:
+        job = await stage["queue"].get()
+        occupancy = stage["queue"].qsize() + 1
+        stats["queue_samples"] += 1
+        stats["queue_total"] += occupancy
+        stats["queue_max"] = max(stats["queue_max"], occupancy)
+        try:
+            start = time.perf_counter()
+            await loop.run_in_executor(
+                stage["executor"], process_stage, stage["function"], job, options
+            )
+            stats["busy_seconds"] += time.perf_counter() - start
+            stats["processed"] += 1
+
+            if job["status"] is None and stage["next_queue"] is not None:
+                await stage["next_queue"].put(job)
+        finally:
+            stage["queue"].task_done()
+
+
+async def run_pipeline_async(jobs, options, stage_workers=None, queue_size=None):
+    stage_workers = {**DEFAULT_STAGE_WORKERS, **(stage_workers or {})}
+    queue_size = queue_size or DEFAULT_QUEUE_SIZE
+    loop = asyncio.get_running_loop()
+    started_at = time.perf_counter()
+
+    stages = []
+    for stage_name, stage_function in STAGES:
+        workers = max(1, stage_workers[stage_name])
+        stages.append(
+            {
+                "name": stage_name,
+                "function": stage_function,
+                "workers": workers,
+                "queue": asyncio.Queue(maxsize=queue_size),
+                "executor": ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix=f"{stage_name}-stage"
+                ),
+                "next_queue": None,
+            }
+        )
+    for stage, next_stage in zip(stages, stages[1:]):
+        stage["next_queue"] = next_stage["queue"]
+
+    all_stats = []
+    tasks = []
+    for stage in stages:
+        stats = create_stage_stats(stage["name"], stage["workers"])
+        all_stats.append(stats)
+        for _ in range(stage["workers"]):
+            tasks.append(
+                asyncio.create_task(stage_worker(stage, options, loop, stats))
+            )
+
+    try:
+        # the first queue is bounded, so producing blocks when matching falls behind
+        for job in jobs:
+            await stages[0]["queue"].put(job)
+
+        # upstream stages only feed downstream ones, so joining in order drains everything
+        for stage in stages:
+            await stage["queue"].join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for stage in stages:
+            stage["executor"].shutdown(wait=True)
+
+    elapsed = time.perf_counter() - started_at
+    for stats in all_stats:
+        stats["elapsed_seconds"] = elapsed
+    return all_stats
+
+
+def run_pipeline(jobs, options, stage_workers=None, queue_size=None):
+    return asyncio.run(run_pipeline_async(jobs, options, stage_workers, queue_size))
+
+
+def print_stage_report(all_stats):
+    print(f"\n{'=' * 60}")
+    print("⏱️  PIPELINE STAGES")
+    print(f"{'=' * 60}")
+    print(
+        f"{'stage':<12}{'workers':>8}{'files':>7}{'files/s':>9}{'busy %':>8}{'queue avg/max':>16}"
+    )
+    bottleneck = None
+    for stats in all_stats:
+        elapsed = stats["elapsed_seconds"] or 1e-9
+        throughput = stats["processed"] / elapsed
+        utilization = stats["busy_seconds"] / (stats["workers"] * elapsed)
+        queue_avg = (
+            stats["queue_total"] / stats["queue_samples"]
+            if stats["queue_samples"]
+            else 0.0
+        )
+        queue_label = f"{queue_avg:.1f}/{stats['queue_max']}"
+        print(
+            f"{stats['stage']:<12}{stats['workers']:>8}{stats['processed']:>7}"
+            f"{throughput:>9.2f}{utilization * 100:>7.0f}%{queue_label:>16}"
+        )
+        if stats["processed"] and (
+            bottleneck is None or utilization > bottleneck[1]
+        ):
+            bottleneck = (stats["stage"], utilization)
+
+    print(f"{'-' * 60}")
+    if bottleneck:
+        print(f"🐢 Bottleneck: {bottleneck[0]} ({bottleneck[1] * 100:.0f}% busy)")
+    print(f"{'=' * 60}\n")
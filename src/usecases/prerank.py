@@ -0,0 +1,166 @@
+# python src/usecases/prerank.py -n nu -i 1.jpeg
+import os
+import sys
+
+import cv2
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.usecases.load_templates import (
+    PDF_EXTENSION,
+    REDUCED_READ_FLAGS,
+    get_reference_image,
+)
+from src.utils.geometry import coordinates_to_boxes, scale_boxes, select_page
+from src.utils.pdf import RENDER_ZOOM, render_pdf_page
+from src.utils.receipt import get_file_extension
+
+# receipts are tall screenshots, so thumbnails keep a portrait shape
+THUMBNAIL_SIZE = (32, 64)
+HISTOGRAM_BINS = [8, 4]
+PRERANK_REDUCTION = 8
+
+LAYOUT_WEIGHT = 0.6
+COLOR_WEIGHT = 0.25
+ASPECT_WEIGHT = 0.15
+
+
+def load_image(source, reduction=PRERANK_REDUCTION):
+    # a file path, or an in-memory receipt, which is decoded without reading its file
+    if get_file_extension(source) == PDF_EXTENSION:
+        pdf = source["data"] if isinstance(source, dict) else source
+        return render_pdf_page(pdf, zoom=RENDER_ZOOM / reduction)
+
+    if isinstance(source, dict):
+        data = np.frombuffer(source["data"], dtype=np.uint8)
+        image = cv2.imdecode(data, REDUCED_READ_FLAGS[reduction])
+        source = source["path"]
+    else:
+        image = cv2.imread(source, REDUCED_READ_FLAGS[reduction])
+    if image is None:
+        raise ValueError(f"Could not load image: {source}")
+    return image
+
+
+def get_boxes(coordinates, reference_size, target_size):
+    # layouts are compared on the first page only
+    boxes = coordinates_to_boxes(select_page(coordinates, 0), *reference_size)
+    boxes = scale_boxes(
+        boxes, target_size[0] / reference_size[0], target_size[1] / reference_size[1]
+    )
+    for x1, y1, x2, y2 in boxes.tolist():
+        yield int(x1), int(y1), int(np.ceil(x2)), int(np.ceil(y2))
+
+
+def get_histogram(image, mask=None):
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    histogram = cv2.calcHist([hsv], [0, 1], mask, HISTOGRAM_BINS, [0, 180, 0, 256])
+    return cv2.normalize(histogram, None).flatten()
+
+
+def get_thumbnail(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return thumbnail.astype(np.float32)
+
+
+def get_masked_features(image, coordinates, reference_size):
+    # the reference images have black boxes over the values, so both sides get
+    # the template boxes blacked out/ignored before their layouts are compared
+    height, width = image.shape[:2]
+    mask = np.full((height, width), 255, dtype=np.uint8)
+    for x1, y1, x2, y2 in get_boxes(coordinates, reference_size, (width, height)):
+        mask[y1:y2, x1:x2] = 0
+
+    thumbnail = get_thumbnail(image)
+    for x1, y1, x2, y2 in get_boxes(coordinates, reference_size, THUMBNAIL_SIZE):
+        thumbnail[y1:y2, x1:x2] = 0
+
+    return {
+        "thumbnail": thumbnail,
+        "histogram": get_histogram(image, mask),
+        "aspect_ratio": height / width,
+    }
+
+
+def get_template_features(template):
+    features = template.get("prerank_features")
+    if features is None:
+        image = get_reference_image(template, reduction=PRERANK_REDUCTION)
+        height, width = image.shape[:2]
+        # size in the pixel space of the original file, where coordinates live
+        reference_size = (width * PRERANK_REDUCTION, height * PRERANK_REDUCTION)
+        features = {
+            **get_masked_features(image, template["coordinates"], reference_size),
+            "reference_size": reference_size,
+        }
+        template["prerank_features"] = features
+    return features
+
+
+def normalized_cross_correlation(a, b):
+    a = a - a.mean()
+    b = b - b.mean()
+    denominator = np.sqrt((a * a).sum() * (b * b).sum())
+    if denominator == 0:
+        return 0.0
+    return float((a * b).sum() / denominator)
+
+
+def score_template(input_image, template):
+    template_features = get_template_features(template)
+    input_features = get_masked_features(
+        input_image, template["coordinates"], template_features["reference_size"]
+    )
+
+    layout = max(
+        0.0,
+        normalized_cross_correlation(
+            input_features["thumbnail"], template_features["thumbnail"]
+        ),
+    )
+    color = max(
+        0.0,
+        cv2.compareHist(
+            input_features["histogram"],
+            template_features["histogram"],
+            cv2.HISTCMP_CORREL,
+        ),
+    )
+    aspect = min(
+        input_features["aspect_ratio"], template_features["aspect_ratio"]
+    ) / max(input_features["aspect_ratio"], template_features["aspect_ratio"])
+
+    return LAYOUT_WEIGHT * layout + COLOR_WEIGHT * color + ASPECT_WEIGHT * aspect
+
+
+def rank_templates(source, templates):
+    input_image = load_image(source)
+    ranking = [
+        {"template": template, "score": score_template(input_image, template)}
+        for template in templates
+    ]
+    ranking.sort(key=lambda item: item["score"], reverse=True)
+    return ranking
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--name", required=True, help="Bank name")
+    parser.add_argument("-i", "--input", required=True, help="Input file path")
+    args = parser.parse_args()
+
+    from src.usecases.template_bundle import load_bundle_templates
+
+    extension = os.path.splitext(args.input)[1]
+    templates = load_bundle_templates(args.name, extension)
+
+    for item in rank_templates(args.input, templates):
+        template = item["template"]
+        print(f"{item['score']:.3f}  {template['name']}{template['file_extension']}")
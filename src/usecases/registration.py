@@ -0,0 +1,180 @@
+# python src/usecases/registration.py -n nu -t coordinates_output_3 -i 1.jpeg
+import math
+import os
+import sys
+
+import cv2
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.usecases.load_templates import PDF_EXTENSION, get_reference_image
+from src.usecases.prerank import load_image
+from src.utils.geometry import (
+    boxes_to_coordinates,
+    coordinates_to_boxes,
+    get_rects,
+    is_normalized,
+    scale_boxes,
+    select_page,
+)
+from src.utils.pdf import get_render_size, open_pdf
+from src.utils.receipt import get_receipt_image, load_receipt
+
+REGISTRATION_REDUCTION = 2
+REGISTRATION_MAX_SIDE = 1000
+ORB_FEATURES = 3000
+RATIO_TEST = 0.75
+MIN_INLIERS = 20
+MIN_SCALE = 0.3
+MAX_SCALE = 3.0
+MAX_ROTATION_DEGREES = 3.0
+
+
+def prepare_image(image):
+    height, width = image.shape[:2]
+    scale = min(1.0, REGISTRATION_MAX_SIDE / max(height, width))
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def estimate_transform(reference_image, input_image):
+    reference_gray, reference_scale = prepare_image(reference_image)
+    input_gray, input_scale = prepare_image(input_image)
+
+    orb = cv2.ORB_create(nfeatures=ORB_FEATURES)
+    reference_keypoints, reference_descriptors = orb.detectAndCompute(
+        reference_gray, None
+    )
+    input_keypoints, input_descriptors = orb.detectAndCompute(input_gray, None)
+    if reference_descriptors is None or input_descriptors is None:
+        return None
+
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    good_matches = [
+        pair[0]
+        for pair in matcher.knnMatch(reference_descriptors, input_descriptors, k=2)
+        if len(pair) == 2 and pair[0].distance < RATIO_TEST * pair[1].distance
+    ]
+    if len(good_matches) < MIN_INLIERS:
+        return None
+
+    reference_points = np.float32(
+        [reference_keypoints[m.queryIdx].pt for m in good_matches]
+    )
+    input_points = np.float32([input_keypoints[m.trainIdx].pt for m in good_matches])
+
+    # rotation + uniform scale + translation: screenshots of the same layout only
+    # differ by device resolution and cropping
+    matrix, inliers = cv2.estimateAffinePartial2D(
+        reference_points, input_points, method=cv2.RANSAC, ransacReprojThreshold=4.0
+    )
+    if matrix is None or int(inliers.sum()) < MIN_INLIERS:
+        return None
+
+    scale = math.hypot(matrix[0, 0], matrix[1, 0])
+    rotation = abs(math.degrees(math.atan2(matrix[1, 0], matrix[0, 0])))
+    if not MIN_SCALE <= scale <= MAX_SCALE or rotation > MAX_ROTATION_DEGREES:
+        return None
+
+    # bring the transform from the downscaled images back to full resolution
+    matrix = matrix.astype(np.float64)
+    matrix[:, :2] *= reference_scale / input_scale
+    matrix[:, 2] /= input_scale
+    return {"matrix": matrix, "inliers": int(inliers.sum())}
+
+
+def warp_coordinates(coordinates, matrix, reference_size, input_size):
+    # the transform is estimated on the first page, rects of other pages are kept
+    # as they are; normalized coordinates stay normalized, to the size of the input
+    boxes = coordinates_to_boxes(select_page(coordinates, 0), *reference_size)
+    x1, y1, x2, y2 = boxes.T
+    corners = np.stack(
+        [
+            np.stack([x1, y1], axis=1),
+            np.stack([x2, y1], axis=1),
+            np.stack([x1, y2], axis=1),
+            np.stack([x2, y2], axis=1),
+        ],
+        axis=1,
+    )
+    points = corners @ matrix[:, :2].T + matrix[:, 2]
+
+    # rounding first keeps float noise from normalized coordinates from growing boxes
+    points = np.round(points, 6)
+    warped = np.hstack([np.floor(points.min(axis=1)), np.ceil(points.max(axis=1))])
+    if is_normalized(coordinates):
+        width, height = input_size
+        warped_rects = [
+            {"x": x1, "y": y1, "width": x2 - x1, "height": y2 - y1}
+            for x1, y1, x2, y2 in scale_boxes(warped, 1 / width, 1 / height).tolist()
+        ]
+    else:
+        warped_rects = boxes_to_coordinates(warped)
+
+    warped_rects = iter(warped_rects)
+    rects = [
+        {**rect, **next(warped_rects)} if rect.get("page", 0) == 0 else rect
+        for rect in get_rects(coordinates)
+    ]
+    if is_normalized(coordinates):
+        return {**coordinates, "rects": rects}
+    return rects
+
+
+def get_input_size(receipt):
+    # full resolution, the pixel space the masks of the first page are drawn in
+    if receipt["extension"] == PDF_EXTENSION:
+        with open_pdf(receipt["data"]) as doc:
+            return get_render_size(doc[0])
+    height, width = get_receipt_image(receipt).shape[:2]
+    return width, height
+
+
+def align_coordinates(template, receipt):
+    reference_image = get_reference_image(template, reduction=REGISTRATION_REDUCTION)
+    input_image = load_image(receipt, reduction=REGISTRATION_REDUCTION)
+
+    transform = estimate_transform(reference_image, input_image)
+    if transform is None:
+        return None
+
+    # both images were decoded at the same reduction: the linear part is the
+    # same at full resolution, only the translation has to be scaled back
+    matrix = transform["matrix"]
+    matrix[:, 2] *= REGISTRATION_REDUCTION
+    height, width = reference_image.shape[:2]
+    reference_size = (width * REGISTRATION_REDUCTION, height * REGISTRATION_REDUCTION)
+    coordinates = template["coordinates"]
+    input_size = get_input_size(receipt) if is_normalized(coordinates) else None
+    return {
+        "coordinates": warp_coordinates(coordinates, matrix, reference_size, input_size),
+        "matrix": matrix,
+        "inliers": transform["inliers"],
+    }
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--name", required=True, help="Bank name")
+    parser.add_argument("-t", "--template", required=True, help="Template name")
+    parser.add_argument("-i", "--input", required=True, help="Input file path")
+    args = parser.parse_args()
+
+    from src.usecases.template_bundle import load_bundle_templates
+
+    extension = os.path.splitext(args.input)[1]
+    templates = load_bundle_templates(args.name, extension)
+    template = next(t for t in templates if t["name"] == args.template)
+
+    result = align_coordinates(template, load_receipt(args.input))
+    if result:
+        print(f"aligned with {result['inliers']} inliers:\n{result['matrix']}")
+    else:
+        print("could not align input with the template")
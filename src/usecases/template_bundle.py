@@ -0,0 +1,390 @@
+# python src/usecases/template_bundle.py [--rebuild]
+import json
+import os
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.usecases.load_templates import (
+    FINGERPRINT_SUFFIX,
+    IMAGE_EXTENSIONS,
+    PDF_EXTENSION,
+    get_bank_signature,
+    get_reference_image,
+)
+from src.usecases.prerank import (
+    PRERANK_REDUCTION,
+    THUMBNAIL_SIZE,
+    get_boxes,
+    get_masked_features,
+)
+
+TEMPLATE_BUNDLE_DIR = ".cache/template_bundle"
+COORDINATES_DIR = "src/config/coordinates"
+BUNDLE_VERSION = 1
+BUNDLE_INDEX_FILE = "index.json"
+
+# one .npy file per field, row i belongs to the i-th template of index.json
+BUNDLE_ARRAYS = {
+    "thumbnails": np.float32,
+    "weights": np.float32,
+    "histograms": np.float32,
+    "histogram_vectors": np.float32,
+    "aspect_ratios": np.float64,
+    "reference_sizes": np.int64,
+}
+
+# bundle_dir -> {"bundle", "signatures": bank name -> bank signature at build time}
+loaded_bundles = {}
+loaded_bundles_lock = threading.Lock()
+
+# (bundle_dir, bank_name, file_extension) -> template records of the loaded bundle.
+# The records keep their decoded reference images, reference hash and OCR
+# fingerprint between receipts, so they live as long as the bundle they come from
+MAX_CACHED_TEMPLATE_SETS = 8
+loaded_templates = OrderedDict()
+
+
+def scan_sources(coordinates_dir=COORDINATES_DIR):
+    # one listing per bank: references are looked up in it instead of probed one
+    # by one, and the mtimes of the listing are the signatures of each template
+    banks = []
+    sources = []
+    for bank_entry in sorted(os.scandir(coordinates_dir), key=lambda e: e.name):
+        if not bank_entry.is_dir():
+            continue
+        banks.append(bank_entry.name)
+
+        files = {
+            entry.name: entry.stat().st_mtime_ns
+            for entry in os.scandir(bank_entry.path)
+            if entry.is_file()
+        }
+        for file_name in sorted(files):
+            if not file_name.endswith(".json") or file_name.endswith(
+                FINGERPRINT_SUFFIX
+            ):
+                continue
+
+            base_name = file_name[: -len(".json")]
+            image_references = [
+                f"{base_name}{ext}"
+                for ext in sorted(IMAGE_EXTENSIONS)
+                if f"{base_name}{ext}" in files
+            ]
+            pdf_reference = f"{base_name}{PDF_EXTENSION}"
+            references = image_references[:1]
+            if pdf_reference in files:
+                references.append(pdf_reference)
+
+            for reference in references:
+                sources.append(
+                    {
+                        "key": f"{bank_entry.name}/{reference}",
+                        "bank_name": bank_entry.name,
+                        "name": base_name,
+                        "json_path": os.path.join(bank_entry.path, file_name),
+                        "reference_path": os.path.join(bank_entry.path, reference),
+                        "is_pdf": reference.endswith(PDF_EXTENSION),
+                        "signature": f"{files[file_name]}:{files[reference]}",
+                    }
+                )
+    return banks, sources
+
+
+def compile_template(source):
+    with open(source["json_path"], "r", encoding="utf-8") as f:
+        coordinates = json.load(f)
+
+    if not source["is_pdf"] and not cv2.haveImageReader(source["reference_path"]):
+        return None
+
+    template = {
+        "name": source["name"],
+        "reference_path": source["reference_path"],
+        "coordinates": coordinates,
+        "reference_images": {},
+    }
+    image = get_reference_image(template, reduction=PRERANK_REDUCTION)
+    height, width = image.shape[:2]
+    # size in the pixel space of the original file, where coordinates live
+    reference_size = (width * PRERANK_REDUCTION, height * PRERANK_REDUCTION)
+    features = get_masked_features(image, coordinates, reference_size)
+
+    # weights are 0 inside the template boxes, so the masked reference pixels
+    # never count against an unmasked input in the template index
+    weights = np.ones((THUMBNAIL_SIZE[1], THUMBNAIL_SIZE[0]), dtype=np.float32)
+    for x1, y1, x2, y2 in get_boxes(coordinates, reference_size, THUMBNAIL_SIZE):
+        weights[y1:y2, x1:x2] = 0
+
+    entry = {
+        key: source[key]
+        for key in ("key", "bank_name", "name", "reference_path", "is_pdf", "signature")
+    }
+    entry["coordinates"] = coordinates
+    row = {
+        "thumbnails": features["thumbnail"],
+        "weights": weights,
+        "histograms": features["histogram"],
+        "histogram_vectors": get_histogram_vector(features["histogram"]),
+        "aspect_ratios": features["aspect_ratio"],
+        "reference_sizes": np.array(reference_size),
+    }
+    return {"entry": entry, "row": row}
+
+
+def get_histogram_vector(histogram):
+    # Hellinger-style vector: the dot product of two of them is their similarity
+    vector = np.sqrt(histogram / max(histogram.sum(), 1e-12))
+    return vector / max(np.linalg.norm(vector), 1e-12)
+
+
+def read_template_bundle(bundle_dir=TEMPLATE_BUNDLE_DIR):
+    index_path = os.path.join(bundle_dir, BUNDLE_INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None
+
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != BUNDLE_VERSION or not index["templates"]:
+            return None
+        # memory-mapped: pages are only read when a row is used, and shared
+        # between every process that loads the same bundle
+        arrays = {
+            field: np.load(os.path.join(bundle_dir, f"{field}.npy"), mmap_mode="r")
+            for field in BUNDLE_ARRAYS
+        }
+    except (OSError, ValueError, KeyError) as e:
+        print(f"template_bundle ⚠️: ignoring unreadable bundle in {bundle_dir}: {e}")
+        return None
+
+    if any(len(array) != len(index["templates"]) for array in arrays.values()):
+        return None
+    return {"index": index, "arrays": arrays}
+
+
+def is_bundle_fresh(bundle, coordinates_dir, banks, sources):
+    index = bundle["index"]
+    known = {entry["key"]: entry["signature"] for entry in index["templates"]}
+    known.update(index["skipped"])
+    return (
+        index["coordinates_dir"] == os.path.realpath(coordinates_dir)
+        and index["banks"] == banks
+        and known == {source["key"]: source["signature"] for source in sources}
+    )
+
+
+def write_template_bundle(bundle_dir, index, rows):
+    os.makedirs(bundle_dir, exist_ok=True)
+    for field, dtype in BUNDLE_ARRAYS.items():
+        array = np.stack([np.asarray(row[field], dtype=dtype) for row in rows])
+        temp_path = os.path.join(bundle_dir, f"{field}.npy.tmp")
+        with open(temp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(temp_path, os.path.join(bundle_dir, f"{field}.npy"))
+
+    # the index is replaced last, it is what makes the new arrays valid
+    temp_path = os.path.join(bundle_dir, f"{BUNDLE_INDEX_FILE}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(temp_path, os.path.join(bundle_dir, BUNDLE_INDEX_FILE))
+
+
+def build_template_bundle(
+    bundle_dir=TEMPLATE_BUNDLE_DIR, coordinates_dir=COORDINATES_DIR, verbose=False
+):
+    banks, sources = scan_sources(coordinates_dir)
+    bundle = read_template_bundle(bundle_dir)
+    if bundle and is_bundle_fresh(bundle, coordinates_dir, banks, sources):
+        return bundle
+
+    existing = {}
+    skipped = {}
+    if bundle:
+        existing = {
+            entry["key"]: (row, entry)
+            for row, entry in enumerate(bundle["index"]["templates"])
+        }
+        skipped = bundle["index"]["skipped"]
+
+    entries = []
+    rows = []
+    new_skipped = {}
+    for source in sources:
+        key = source["key"]
+        row, entry = existing.pop(key, (None, None))
+        if entry is not None and entry["signature"] == source["signature"]:
+            entries.append(entry)
+            rows.append({field: bundle["arrays"][field][row] for field in BUNDLE_ARRAYS})
+            continue
+        if skipped.get(key) == source["signature"]:
+            new_skipped[key] = source["signature"]
+            continue
+
+        if verbose:
+            print(f"template_bundle: {'updating' if entry else 'adding'} {key}")
+        try:
+            compiled = compile_template(source)
+        except Exception as e:
+            print(f"template_bundle ❌: error compiling template {key}: {e}")
+            compiled = None
+        if compiled is None:
+            new_skipped[key] = source["signature"]
+            continue
+        entries.append(compiled["entry"])
+        rows.append(compiled["row"])
+
+    if verbose:
+        for key in existing:
+            print(f"template_bundle: removing {key}")
+
+    index = {
+        "version": BUNDLE_VERSION,
+        "coordinates_dir": os.path.realpath(coordinates_dir),
+        "banks": banks,
+        "templates": entries,
+        "skipped": new_skipped,
+    }
+    if rows:
+        write_template_bundle(bundle_dir, index, rows)
+        # reopen memory-mapped, so the rows built in this process are not kept twice
+        bundle = read_template_bundle(bundle_dir)
+    else:
+        bundle = {
+            "index": index,
+            "arrays": {field: np.empty((0,)) for field in BUNDLE_ARRAYS},
+        }
+    return bundle
+
+
+def get_bank_signatures(coordinates_dir=COORDINATES_DIR):
+    return {
+        entry.name: get_bank_signature(entry.path)
+        for entry in os.scandir(coordinates_dir)
+        if entry.is_dir()
+    }
+
+
+def get_template_bundle(
+    bundle_dir=TEMPLATE_BUNDLE_DIR,
+    coordinates_dir=COORDINATES_DIR,
+    bank_name=None,
+    bank_signature=None,
+):
+    # built once per process, and again when the signature of bank_name differs
+    # from the one it was built with; only templates whose files changed are recompiled
+    with loaded_bundles_lock:
+        loaded = loaded_bundles.get(bundle_dir)
+        if loaded is not None and (
+            bank_name is None or loaded["signatures"].get(bank_name) == bank_signature
+        ):
+            return loaded["bundle"]
+
+        if loaded is not None:
+            print(f"template_bundle: templates of {bank_name} changed, updating the bundle")
+        # listed before the build: a file changed during it is caught at the next call
+        signatures = get_bank_signatures(coordinates_dir)
+        loaded_bundles[bundle_dir] = {
+            "bundle": build_template_bundle(bundle_dir, coordinates_dir),
+            "signatures": signatures,
+        }
+        clear_bundle_templates(bundle_dir)
+        return loaded_bundles[bundle_dir]["bundle"]
+
+
+def clear_bundle_templates(bundle_dir):
+    for key in list(loaded_templates):
+        if key[0] == bundle_dir:
+            del loaded_templates[key]
+
+
+def read_bundle_templates(bundle, bank_name, file_extension):
+    is_pdf = file_extension.lower() == PDF_EXTENSION
+    arrays = bundle["arrays"]
+    templates = []
+    for row, entry in enumerate(bundle["index"]["templates"]):
+        if entry["bank_name"] != bank_name or entry["is_pdf"] != is_pdf:
+            continue
+        templates.append(
+            {
+                "name": entry["name"],
+                "reference_path": entry["reference_path"],
+                "coordinates": entry["coordinates"],
+                "reference_images": {},
+                "bank_name": bank_name,
+                "file_extension": file_extension,
+                # precomputed, so pre-ranking never decodes the reference images
+                "prerank_features": {
+                    "thumbnail": arrays["thumbnails"][row],
+                    "histogram": arrays["histograms"][row],
+                    "aspect_ratio": float(arrays["aspect_ratios"][row]),
+                    "reference_size": tuple(int(v) for v in arrays["reference_sizes"][row]),
+                },
+            }
+        )
+    return templates
+
+
+def load_bundle_templates(
+    bank_name,
+    file_extension,
+    bundle_dir=TEMPLATE_BUNDLE_DIR,
+    coordinates_dir=COORDINATES_DIR,
+):
+    bank_dir = os.path.join(coordinates_dir, bank_name)
+    if not os.path.isdir(bank_dir):
+        raise FileNotFoundError(
+            f"sensitive_data_masker ⚠️: bank directory not found: {bank_name}"
+        )
+
+    # one listing of the bank per call, so coordinates or references edited
+    # while a run goes on are used from the next receipt
+    get_template_bundle(
+        bundle_dir, coordinates_dir, bank_name, get_bank_signature(bank_dir)
+    )
+
+    # the extension of the input is part of each record (template keys in the
+    # stats and the guardrail policy), so records are cached per extension
+    cache_key = (bundle_dir, bank_name, file_extension.lower())
+    with loaded_bundles_lock:
+        templates = loaded_templates.get(cache_key)
+        if templates is None:
+            # the bundle loaded now, another thread may have updated it since the check
+            bundle = loaded_bundles[bundle_dir]["bundle"]
+            templates = read_bundle_templates(bundle, bank_name, file_extension)
+            loaded_templates[cache_key] = templates
+        loaded_templates.move_to_end(cache_key)
+        while len(loaded_templates) > MAX_CACHED_TEMPLATE_SETS:
+            loaded_templates.popitem(last=False)
+        return list(templates)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rebuild", action="store_true", help="discard the bundle and compile again"
+    )
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.exists(TEMPLATE_BUNDLE_DIR):
+        shutil.rmtree(TEMPLATE_BUNDLE_DIR)
+
+    bundle = build_template_bundle(verbose=True)
+    index = bundle["index"]
+    print(
+        f"template_bundle: {len(index['templates'])} template(s) of {len(index['banks'])} bank(s) in {TEMPLATE_BUNDLE_DIR}"
+    )
+    for key in index["skipped"]:
+        print(f"template_bundle ⚠️: skipped {key}")
@@ -0,0 +1,162 @@
+# build: python src/usecases/template_index.py --build
+# search: python src/usecases/template_index.py -i 1.jpeg [-n nu] [-k 5]
+import os
+import sys
+import threading
+
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+    )
+
+from src.usecases.load_templates import PDF_EXTENSION
+from src.usecases.prerank import (
+    ASPECT_WEIGHT,
+    COLOR_WEIGHT,
+    LAYOUT_WEIGHT,
+    get_histogram,
+    get_thumbnail,
+    load_image,
+)
+from src.usecases.template_bundle import (
+    COORDINATES_DIR,
+    TEMPLATE_BUNDLE_DIR,
+    build_template_bundle,
+    get_histogram_vector,
+    get_template_bundle,
+)
+from src.utils.receipt import get_file_extension
+
+loaded_index = {}
+loaded_index_lock = threading.Lock()
+
+
+def create_template_index(bundle):
+    # the features are the ones compiled into the template bundle, so the index
+    # is only a view over its memory-mapped arrays
+    entries = bundle["index"]["templates"]
+    arrays = bundle["arrays"]
+    index = {
+        "keys": np.array([entry["key"] for entry in entries]),
+        "bank_names": np.array([entry["bank_name"] for entry in entries]),
+        "names": np.array([entry["name"] for entry in entries]),
+        "reference_paths": np.array([entry["reference_path"] for entry in entries]),
+        "is_pdf": np.array([entry["is_pdf"] for entry in entries], dtype=bool),
+        "weights": arrays["weights"].reshape(len(entries), -1),
+        "values": arrays["thumbnails"].reshape(len(entries), -1),
+        "histograms": arrays["histogram_vectors"],
+        "aspect_ratios": arrays["aspect_ratios"],
+    }
+    return prepare_index(index)
+
+
+def prepare_index(index):
+    if len(index["keys"]) == 0:
+        return index
+
+    # per-template sums used by the weighted correlation in search_templates
+    weights = np.asarray(index["weights"], dtype=np.float32)
+    values = np.asarray(index["values"], dtype=np.float32)
+    weighted_values = weights * values
+    return {
+        **index,
+        "weighted_values": weighted_values,
+        "weight_sums": weights.sum(axis=1),
+        "value_sums": weighted_values.sum(axis=1),
+        "value_square_sums": (weighted_values * values).sum(axis=1),
+    }
+
+
+def get_template_index(
+    bundle_dir=TEMPLATE_BUNDLE_DIR, coordinates_dir=COORDINATES_DIR
+):
+    with loaded_index_lock:
+        if bundle_dir not in loaded_index:
+            loaded_index[bundle_dir] = create_template_index(
+                get_template_bundle(bundle_dir, coordinates_dir)
+            )
+        return loaded_index[bundle_dir]
+
+
+def search_templates(source, index=None, k=5, bank_name=None):
+    index = index or get_template_index()
+    if len(index["keys"]) == 0:
+        return []
+
+    image = load_image(source)
+    height, width = image.shape[:2]
+    query = get_thumbnail(image).flatten()
+    query_histogram = get_histogram_vector(get_histogram(image))
+    query_aspect = height / width
+
+    # weighted Pearson correlation of the query against every template at once
+    weights = index["weights"]
+    n = index["weight_sums"]
+    query_sums = weights @ query
+    query_square_sums = weights @ (query * query)
+    cross_sums = index["weighted_values"] @ query
+    covariance = cross_sums - query_sums * index["value_sums"] / n
+    query_variance = query_square_sums - query_sums**2 / n
+    value_variance = index["value_square_sums"] - index["value_sums"] ** 2 / n
+    denominator = np.sqrt(np.maximum(query_variance * value_variance, 1e-12))
+    layout = np.clip(covariance / denominator, 0.0, 1.0)
+
+    color = np.clip(index["histograms"] @ query_histogram, 0.0, 1.0)
+    aspect = np.minimum(index["aspect_ratios"], query_aspect) / np.maximum(
+        index["aspect_ratios"], query_aspect
+    )
+    scores = LAYOUT_WEIGHT * layout + COLOR_WEIGHT * color + ASPECT_WEIGHT * aspect
+
+    is_pdf = get_file_extension(source) == PDF_EXTENSION
+    candidates = index["is_pdf"] == is_pdf
+    if bank_name:
+        candidates &= index["bank_names"] == bank_name
+    scores = np.where(candidates, scores, -np.inf)
+
+    k = min(k, int(candidates.sum()))
+    best_rows = np.argsort(-scores)[:k]
+    return [
+        {
+            "key": str(index["keys"][row]),
+            "bank_name": str(index["bank_names"][row]),
+            "name": str(index["names"][row]),
+            "reference_path": str(index["reference_paths"][row]),
+            "score": float(scores[row]),
+        }
+        for row in best_rows
+    ]
+
+
+def identify_bank_locally(source, index=None, k=5):
+    results = search_templates(source, index, k)
+    if not results:
+        return None
+
+    votes = {}
+    for result in results:
+        votes[result["bank_name"]] = votes.get(result["bank_name"], 0) + result["score"]
+    return max(votes, key=votes.get)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--build", action="store_true", help="update the template bundle"
+    )
+    parser.add_argument("-i", "--input", required=False, help="Input file path")
+    parser.add_argument("-n", "--name", required=False, help="restrict to bank name")
+    parser.add_argument("-k", type=int, default=5, help="number of results")
+    args = parser.parse_args()
+
+    index = create_template_index(build_template_bundle(verbose=args.build))
+    print(f"template_index: {len(index['keys'])} template(s) in {TEMPLATE_BUNDLE_DIR}")
+
+    if args.input:
+        for result in search_templates(args.input, index, args.k, args.name):
+            print(f"{result['score']:.3f}  {result['key']}")
+        if not args.name:
+            print(f"bank: {identify_bank_locally(args.input, index, args.k)}")
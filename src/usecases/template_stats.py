@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+
+TEMPLATE_STATS_PATH = ".cache/template_stats.json"
+
+# path -> {bank_name: {template_name: hits}}
+loaded_stats = {}
+stats_lock = threading.Lock()
+
+
+def read_stats(stats_path):
+    if stats_path not in loaded_stats:
+        stats = {}
+        if os.path.exists(stats_path):
+            try:
+                with open(stats_path, "r", encoding="utf-8") as f:
+                    stats = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"template_stats ⚠️: ignoring unreadable stats {stats_path}: {e}")
+        loaded_stats[stats_path] = stats
+    return loaded_stats[stats_path]
+
+
+def write_stats(stats_path, stats):
+    stats_dir = os.path.dirname(stats_path)
+    if stats_dir:
+        os.makedirs(stats_dir, exist_ok=True)
+    temp_path = f"{stats_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(temp_path, stats_path)
+
+
+def get_template_hits(bank_name, stats_path=TEMPLATE_STATS_PATH):
+    with stats_lock:
+        return dict(read_stats(stats_path).get(bank_name, {}))
+
+
+def order_by_hit_rate(templates, stats_path=TEMPLATE_STATS_PATH):
+    if not templates:
+        return templates
+    hits = get_template_hits(templates[0]["bank_name"], stats_path)
+    # sorted() is stable, so templates without history keep their current order
+    return sorted(templates, key=lambda template: -hits.get(template["name"], 0))
+
+
+def record_template_hit(template, stats_path=TEMPLATE_STATS_PATH):
+    with stats_lock:
+        stats = read_stats(stats_path)
+        bank_hits = stats.setdefault(template["bank_name"], {})
+        bank_hits[template["name"]] = bank_hits.get(template["name"], 0) + 1
+        write_stats(stats_path, stats)
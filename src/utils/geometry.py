@@ -0,0 +1,170 @@
+import numpy as np
+
+NORMALIZED_FORMAT = "normalized"
+
+# overlapping boxes are merged only when their union is a rectangle (a tolerance
+# > 0 allows a few extra pixels), so merging never blacks out anything new
+MERGE_TOLERANCE = 0.0
+
+
+def is_normalized(coordinates):
+    return isinstance(coordinates, dict) and coordinates.get("format") == NORMALIZED_FORMAT
+
+
+def get_rects(coordinates):
+    return coordinates["rects"] if is_normalized(coordinates) else coordinates
+
+
+def get_page_numbers(coordinates):
+    # rects without a "page" key belong to the first page
+    return sorted({rect.get("page", 0) for rect in get_rects(coordinates)})
+
+
+def select_page(coordinates, page_number):
+    rects = [
+        rect for rect in get_rects(coordinates) if rect.get("page", 0) == page_number
+    ]
+    if is_normalized(coordinates):
+        return {**coordinates, "rects": rects}
+    return rects
+
+
+def coordinates_to_boxes(coordinates, width, height):
+    # returns float x1, y1, x2, y2 rows in the pixel space of a width x height image;
+    # absolute coordinates already live in it, normalized ones are scaled to it
+    rects = get_rects(coordinates)
+    if not rects:
+        return np.zeros((0, 4), dtype=np.float64)
+
+    boxes = np.array(
+        [[r["x"], r["y"], r["width"], r["height"]] for r in rects], dtype=np.float64
+    )
+    boxes[:, 2:] += boxes[:, :2]
+    if is_normalized(coordinates):
+        boxes *= np.array([width, height, width, height], dtype=np.float64)
+    return boxes
+
+
+def scale_boxes(boxes, scale_x, scale_y):
+    return boxes * np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float64)
+
+
+def clip_boxes(boxes, width, height):
+    clipped = boxes.copy()
+    clipped[:, [0, 2]] = np.clip(clipped[:, [0, 2]], 0, width)
+    clipped[:, [1, 3]] = np.clip(clipped[:, [1, 3]], 0, height)
+    non_empty = (clipped[:, 2] > clipped[:, 0]) & (clipped[:, 3] > clipped[:, 1])
+    return clipped[non_empty]
+
+
+def get_box_areas(boxes):
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def get_mergeable_pairs(boxes, tolerance):
+    left = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    top = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    right = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    bottom = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+
+    union_width = np.maximum(boxes[:, None, 2], boxes[None, :, 2]) - np.minimum(
+        boxes[:, None, 0], boxes[None, :, 0]
+    )
+    union_height = np.maximum(boxes[:, None, 3], boxes[None, :, 3]) - np.minimum(
+        boxes[:, None, 1], boxes[None, :, 1]
+    )
+    bounding_area = union_width * union_height
+
+    areas = get_box_areas(boxes)
+    covered_area = areas[:, None] + areas[None, :] - intersection
+    mergeable = (intersection > 0) & (
+        bounding_area - covered_area <= tolerance * bounding_area
+    )
+    np.fill_diagonal(mergeable, False)
+    return mergeable
+
+
+def merge_boxes(boxes, tolerance=MERGE_TOLERANCE):
+    # mergeability is not transitive, so only disjoint pairs are merged per pass:
+    # each box proposes its first mergeable partner and mutual proposals are merged
+    while len(boxes) > 1:
+        mergeable = get_mergeable_pairs(boxes, tolerance)
+        has_partner = mergeable.any(axis=1)
+        if not has_partner.any():
+            break
+
+        indices = np.arange(len(boxes))
+        partners = np.where(has_partner, mergeable.argmax(axis=1), -1)
+        first = has_partner & (partners > indices)
+        first &= partners[np.where(first, partners, 0)] == indices
+        if not first.any():
+            first = indices == indices[has_partner][0]
+
+        pairs = np.flatnonzero(first)
+        second = partners[pairs]
+        merged = np.hstack(
+            [
+                np.minimum(boxes[pairs, :2], boxes[second, :2]),
+                np.maximum(boxes[pairs, 2:], boxes[second, 2:]),
+            ]
+        )
+        keep = np.ones(len(boxes), dtype=bool)
+        keep[pairs] = False
+        keep[second] = False
+        boxes = np.vstack([boxes[keep], merged])
+    return boxes
+
+
+def prepare_boxes(coordinates, width, height, merge=True):
+    # integer boxes, rounded outwards, clipped to the image and merged when possible
+    boxes = coordinates_to_boxes(coordinates, width, height)
+    boxes = np.hstack([np.floor(boxes[:, :2]), np.ceil(boxes[:, 2:])])
+    boxes = clip_boxes(boxes, width, height)
+    if merge:
+        boxes = merge_boxes(boxes)
+    return boxes.astype(np.int64)
+
+
+def boxes_to_coordinates(boxes):
+    return [
+        {
+            "x": int(x1),
+            "y": int(y1),
+            "width": int(x2 - x1),
+            "height": int(y2 - y1),
+        }
+        for x1, y1, x2, y2 in np.asarray(boxes).tolist()
+    ]
+
+
+def to_absolute_coordinates(coordinates, width, height):
+    if not is_normalized(coordinates):
+        return coordinates
+    boxes = coordinates_to_boxes(coordinates, width, height)
+    return [
+        {**rect, **absolute}
+        for rect, absolute in zip(
+            coordinates["rects"], boxes_to_coordinates(np.rint(boxes))
+        )
+    ]
+
+
+def to_normalized_coordinates(coordinates, width, height):
+    if is_normalized(coordinates):
+        return coordinates
+    boxes = scale_boxes(coordinates_to_boxes(coordinates, width, height), 1 / width, 1 / height)
+    return {
+        "format": NORMALIZED_FORMAT,
+        "reference_size": {"width": width, "height": height},
+        "rects": [
+            {
+                **rect,
+                "x": round(x1, 6),
+                "y": round(y1, 6),
+                "width": round(x2 - x1, 6),
+                "height": round(y2 - y1, 6),
+            }
+            for rect, (x1, y1, x2, y2) in zip(coordinates, boxes.tolist())
+        ],
+    }
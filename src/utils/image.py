@@ -0,0 +1,23 @@
+import cv2
+import numpy as np
+
+JPEG_QUALITY = 95
+
+
+def decode_image(data):
+    # unchanged: keeps alpha, grayscale and bit depth, and ignores EXIF rotation
+    # so the pixels are in the same space as the coordinates
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+
+def encode_image(image, extension):
+    params = []
+    if extension.lower() in (".jpg", ".jpeg"):
+        params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]
+    success, buffer = cv2.imencode(extension, image, params)
+    if not success:
+        raise ValueError(f"Could not encode image as {extension}")
+    return buffer.tobytes()
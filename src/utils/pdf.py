@@ -1,13 +1,37 @@
-import tempfile
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import fitz
 import cv2
 import numpy as np
 
+RENDER_ZOOM = 2
+# below this, starting worker processes costs more than rendering serially
+PARALLEL_RENDER_MIN_PAGES = 4
 
-def pdf_to_image(pdf_path):
-    doc = fitz.open(pdf_path)
-    page = doc[0]
-    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
+# one pool for the whole process, shared by every thread that renders a PDF
+render_pool = None
+render_pool_lock = threading.Lock()
+
+
+def get_render_size(page, zoom=RENDER_ZOOM):
+    # size of page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)) without rendering it
+    rect = (page.rect * fitz.Matrix(zoom, zoom)).irect
+    return rect.width, rect.height
+
+
+def open_pdf(source):
+    # a file path, or the bytes of an in-memory receipt
+    if isinstance(source, bytes):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def render_pdf_page(pdf_path, page_number=0, zoom=RENDER_ZOOM):
+    doc = open_pdf(pdf_path)
+    page = doc[page_number]
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
 
     img_data = np.frombuffer(pix.samples, dtype=np.uint8).reshape(
         pix.height, pix.width, pix.n
@@ -19,9 +43,40 @@ def pdf_to_image(pdf_path):
         img = cv2.cvtColor(img_data, cv2.COLOR_RGB2BGR)
 
     doc.close()
+    return img
+
 
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-    cv2.imwrite(temp_file.name, img)
-    temp_file.close()
+def get_page_count(pdf_path):
+    with open_pdf(pdf_path) as doc:
+        return doc.page_count
 
-    return temp_file.name
+
+def pdf_page_to_png(pdf_path, page_number=0):
+    _, buffer = cv2.imencode(".png", render_pdf_page(pdf_path, page_number))
+    return buffer.tobytes()
+
+
+def get_render_pool():
+    global render_pool
+    with render_pool_lock:
+        if render_pool is None:
+            # spawned, not forked: this runs inside worker threads, and a fork
+            # would copy the locks they hold (PyMuPDF, cv2, caches) into the child
+            render_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return render_pool
+
+
+def pdf_to_pngs(pdf_path):
+    # PNG bytes of every page, without temporary files; pages of longer PDFs are
+    # rendered in worker processes, since PyMuPDF documents cannot be shared
+    # between threads
+    page_count = get_page_count(pdf_path)
+    if (os.cpu_count() or 1) <= 1 or page_count < PARALLEL_RENDER_MIN_PAGES:
+        return [pdf_page_to_png(pdf_path, page_number) for page_number in range(page_count)]
+
+    return list(
+        get_render_pool().map(pdf_page_to_png, [pdf_path] * page_count, range(page_count))
+    )
@@ -0,0 +1,55 @@
+import os
+
+from src.utils.hashing import sha256_bytes
+from src.utils.image import decode_image
+from src.utils.mime_type import get_mime_type
+
+# a receipt is a file passed between the pipeline stages in memory: it is read
+# once, written once, and only decoded when a stage needs its pixels
+
+
+def create_receipt(path, data, image=None, stored=False):
+    return {
+        "path": path,
+        "extension": os.path.splitext(path)[1].lower(),
+        "mime_type": get_mime_type(path),
+        "data": data,
+        "sha256": sha256_bytes(data),
+        "image": image,
+        # True when the file at path already has exactly this data
+        "stored": stored,
+    }
+
+
+def load_receipt(path):
+    with open(path, "rb") as f:
+        return create_receipt(path, f.read(), stored=True)
+
+
+def save_receipt(receipt):
+    if receipt["stored"]:
+        return
+    os.makedirs(os.path.dirname(receipt["path"]), exist_ok=True)
+    with open(receipt["path"], "wb") as f:
+        f.write(receipt["data"])
+    receipt["stored"] = True
+
+
+def get_receipt_image(receipt):
+    if receipt["image"] is None:
+        receipt["image"] = decode_image(receipt["data"])
+    return receipt["image"]
+
+
+def read_file_data(source):
+    # clients accept either a file path or a receipt
+    if isinstance(source, dict):
+        return source["data"], source["mime_type"]
+    with open(source, "rb") as f:
+        return f.read(), get_mime_type(source)
+
+
+def get_file_extension(source):
+    if isinstance(source, dict):
+        return source["extension"]
+    return os.path.splitext(source)[1].lower()
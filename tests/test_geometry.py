@@ -0,0 +1,89 @@
+# python -m pytest tests
+import numpy as np
+
+from src.utils.geometry import merge_boxes, prepare_boxes
+
+
+def sorted_boxes(boxes):
+    return sorted(np.asarray(boxes).tolist())
+
+
+def test_overlapping_boxes_with_a_rectangular_union_are_merged():
+    # same rows, overlapping columns
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 20, 10]], dtype=np.float64)
+    assert sorted_boxes(merge_boxes(boxes)) == [[0, 0, 20, 10]]
+
+
+def test_l_shaped_unions_are_not_merged():
+    # merging would black out the corner neither box covers
+    boxes = np.array([[0, 0, 10, 10], [5, 5, 20, 20]], dtype=np.float64)
+    assert sorted_boxes(merge_boxes(boxes)) == sorted_boxes(boxes)
+
+
+def test_touching_boxes_are_not_merged():
+    boxes = np.array([[0, 0, 10, 10], [10, 0, 20, 10]], dtype=np.float64)
+    assert sorted_boxes(merge_boxes(boxes)) == sorted_boxes(boxes)
+
+
+def test_chains_of_boxes_merge_into_one():
+    boxes = np.array(
+        [[0, 0, 10, 10], [8, 0, 18, 10], [16, 0, 26, 10], [24, 0, 34, 10]],
+        dtype=np.float64,
+    )
+    assert sorted_boxes(merge_boxes(boxes)) == [[0, 0, 34, 10]]
+
+
+def test_contained_box_is_merged_into_its_container():
+    boxes = np.array([[0, 0, 20, 20], [5, 5, 10, 10]], dtype=np.float64)
+    assert sorted_boxes(merge_boxes(boxes)) == [[0, 0, 20, 20]]
+
+
+def test_tolerance_allows_small_uncovered_areas():
+    boxes = np.array([[0, 0, 10, 10], [5, 1, 20, 10]], dtype=np.float64)
+    assert len(merge_boxes(boxes)) == 2
+    assert sorted_boxes(merge_boxes(boxes, tolerance=0.05)) == [[0, 0, 20, 10]]
+
+
+def test_boxes_are_clipped_to_the_image():
+    coordinates = [
+        {"x": -5, "y": -5, "width": 20, "height": 20},
+        {"x": 90, "y": 40, "width": 30, "height": 30},
+    ]
+    boxes = prepare_boxes(coordinates, 100, 50)
+    assert boxes.dtype == np.int64
+    assert sorted_boxes(boxes) == [[0, 0, 15, 15], [90, 40, 100, 50]]
+
+
+def test_boxes_outside_the_image_or_empty_are_dropped():
+    coordinates = [
+        {"x": 200, "y": 10, "width": 20, "height": 20},
+        {"x": 10, "y": 10, "width": 0, "height": 20},
+        {"x": 10, "y": -30, "width": 10, "height": 10},
+    ]
+    assert prepare_boxes(coordinates, 100, 50).shape == (0, 4)
+
+
+def test_no_coordinates_give_no_boxes():
+    assert prepare_boxes([], 100, 50).shape == (0, 4)
+
+
+def test_fractional_boxes_are_rounded_outwards():
+    coordinates = [{"x": 10.4, "y": 5.6, "width": 9.2, "height": 4.0}]
+    assert sorted_boxes(prepare_boxes(coordinates, 100, 50)) == [[10, 5, 20, 10]]
+
+
+def test_normalized_coordinates_are_scaled_to_the_image():
+    coordinates = {
+        "format": "normalized",
+        "rects": [{"x": 0.1, "y": 0.5, "width": 0.25, "height": 0.1}],
+    }
+    assert sorted_boxes(prepare_boxes(coordinates, 200, 100)) == [[20, 50, 70, 60]]
+
+
+def test_merging_can_be_turned_off():
+    coordinates = [
+        {"x": 0, "y": 0, "width": 10, "height": 10},
+        {"x": 5, "y": 0, "width": 15, "height": 10},
+    ]
+    assert len(prepare_boxes(coordinates, 100, 50, merge=False)) == 2
+    assert len(prepare_boxes(coordinates, 100, 50)) == 1
@@ -0,0 +1,119 @@
+# python -m pytest tests
+import pytest
+
+from src.usecases import guardrail_batch
+from src.usecases.guardrail_batch import (
+    check_sensitive_data_in_batches,
+    parse_batch_results,
+)
+
+# answered by the single-file check and by a batch of 2 after the splits
+SENSITIVE_PATHS = {"output/2.png", "output/4.png"}
+
+
+def result(index, has_sensitive_data=False):
+    return {
+        "index": index,
+        "has_sensitive_data": has_sensitive_data,
+        "analysis": f"file {index}",
+        "leaked_fields": ["CPF"] if has_sensitive_data else [],
+    }
+
+
+def receipts(count):
+    return [{"path": f"output/{index}.png", "extension": ".png"} for index in range(count)]
+
+
+def test_results_are_returned_in_file_order():
+    response = {"results": [result(2, True), result(0), result(1)]}
+    parsed = parse_batch_results(response, 3)
+    assert [item["analysis"] for item in parsed] == ["file 0", "file 1", "file 2"]
+    assert [item["has_sensitive_data"] for item in parsed] == [False, False, True]
+
+
+def test_missing_analysis_and_fields_get_defaults():
+    response = {"results": [{"index": 0, "has_sensitive_data": False}]}
+    assert parse_batch_results(response, 1) == [
+        {
+            "has_sensitive_data": False,
+            "analysis": "No analysis provided",
+            "leaked_fields": [],
+        }
+    ]
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        None,
+        [],
+        {},
+        {"results": "all clear"},
+        # too few items
+        {"results": [result(0), result(1)]},
+        # too many items
+        {"results": [result(0), result(1), result(2), result(3)]},
+        # an index repeated, another one missing
+        {"results": [result(0), result(0), result(2)]},
+        # out of range
+        {"results": [result(0), result(1), result(3)]},
+        # not an int index
+        {"results": [result(0), result(1), {**result(2), "index": "2"}]},
+        # not a boolean verdict
+        {"results": [result(0), result(1), {**result(2), "has_sensitive_data": "no"}]},
+        {"results": [result(0), result(1), "file 2 is fine"]},
+    ],
+)
+def test_malformed_responses_are_rejected(response):
+    with pytest.raises(ValueError):
+        parse_batch_results(response, 3)
+
+
+def test_malformed_batches_are_split_down_to_single_files(monkeypatch):
+    sizes = []
+
+    def batch_check(batch, prompt=None):
+        sizes.append(len(batch))
+        # the model only answers batches of 2 correctly, and drops a file otherwise
+        count = len(batch) if len(batch) == 2 else len(batch) - 1
+        return {
+            "results": [
+                result(index, batch[index]["path"] in SENSITIVE_PATHS)
+                for index in range(count)
+            ]
+        }
+
+    def single_check(receipt, prompt=None):
+        sizes.append(1)
+        return {"has_sensitive_data": receipt["path"] in SENSITIVE_PATHS}
+
+    monkeypatch.setattr(
+        guardrail_batch, "check_sensitive_data_batch_with_gemini", batch_check
+    )
+    monkeypatch.setattr(guardrail_batch, "check_sensitive_data_with_gemini", single_check)
+
+    stats = {}
+    results = check_sensitive_data_in_batches(receipts(5), stats=stats)
+    # 5 -> 2 + 3, 3 -> 1 + 2
+    assert sizes == [5, 2, 3, 1, 2]
+    assert stats == {"requests": 5, "splits": 2}
+    assert len(results) == 5
+    assert [item["has_sensitive_data"] for item in results] == [
+        False,
+        False,
+        True,
+        False,
+        True,
+    ]
+
+
+def test_failed_requests_flag_every_file_of_the_batch(monkeypatch):
+    def batch_check(batch, prompt=None):
+        raise ConnectionError("timeout")
+
+    monkeypatch.setattr(
+        guardrail_batch, "check_sensitive_data_batch_with_gemini", batch_check
+    )
+    results = check_sensitive_data_in_batches(receipts(3))
+    assert [item["has_sensitive_data"] for item in results] == [True, True, True]
+    assert all("timeout" in item["analysis"] for item in results)
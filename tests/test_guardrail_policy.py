@@ -0,0 +1,76 @@
+# python -m pytest tests
+import json
+
+import numpy as np
+
+from src.usecases.guardrail_policy import (
+    MODE_FULL,
+    MODE_SAMPLING,
+    decide_guardrails,
+    read_policy,
+    record_guardrails_outcome,
+)
+from src.usecases.pipeline import STATUS_MASK_UNVERIFIED, verify_stage
+from src.utils.image import encode_image
+from src.utils.receipt import create_receipt
+
+TEMPLATE = {
+    "bank_name": "nu",
+    "name": "coordinates_output_1",
+    "file_extension": ".png",
+}
+
+
+def test_sampling_template_reverts_after_one_verify_failure(tmp_path):
+    policy_path = str(tmp_path / "guardrail_policy.json")
+    audit_path = str(tmp_path / "guardrail_policy.jsonl")
+    for index in range(2):
+        decision = decide_guardrails(
+            TEMPLATE, f"{index:064x}", sample_after=2, policy_path=policy_path
+        )
+        record_guardrails_outcome(
+            TEMPLATE,
+            f"{index:064x}",
+            decision,
+            {"has_sensitive_data": False},
+            policy_path=policy_path,
+            audit_path=audit_path,
+        )
+    assert read_policy(policy_path)["nu"]["coordinates_output_1.png"]["mode"] == MODE_SAMPLING
+
+    # the box was never blacked out: the mask verification rejects the receipt
+    image = np.full((100, 100, 3), 255, dtype=np.uint8)
+    masked_receipt = create_receipt(
+        str(tmp_path / "output" / "1.png"), encode_image(image, ".png"), image
+    )
+    job = {
+        "input_path": str(tmp_path / "1.png"),
+        "match": TEMPLATE,
+        "coordinates": [{"x": 10, "y": 10, "width": 50, "height": 20}],
+        "masked_receipt": masked_receipt,
+        "mask_verification": None,
+        "status": None,
+    }
+    verify_stage(
+        job,
+        {
+            "verify_masks": True,
+            "guardrail_sampling": True,
+            "mask_tightness_path": str(tmp_path / "mask_tightness.json"),
+            "guardrail_policy_path": policy_path,
+            "guardrail_audit_path": audit_path,
+        },
+    )
+
+    assert job["status"] == STATUS_MASK_UNVERIFIED
+    state = read_policy(policy_path)["nu"]["coordinates_output_1.png"]
+    assert state["mode"] == MODE_FULL
+    assert state["consecutive_passes"] == 0
+    with open(policy_path, "r", encoding="utf-8") as f:
+        assert json.load(f)["nu"]["coordinates_output_1.png"]["mode"] == MODE_FULL
+    with open(audit_path, "r", encoding="utf-8") as f:
+        last_entry = json.loads(f.readlines()[-1])
+    assert last_entry["receipt_sha256"] == masked_receipt["sha256"]
+    assert last_entry["outcome"] == "failed"
+    assert last_entry["mode"] == MODE_SAMPLING
+    assert last_entry["new_mode"] == MODE_FULL
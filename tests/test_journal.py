@@ -0,0 +1,84 @@
+# python -m pytest tests
+import os
+
+from main import prepare_resume
+from src.usecases.journal import JOURNAL_FILE_NAME, Journal, get_journal_key
+from src.usecases.load_templates import get_template_set_version
+from src.usecases.pipeline import STATUS_ERROR, STATUS_PASSED, STATUS_SKIPPED, create_job
+from src.utils.hashing import sha256_file
+
+
+def create_jobs(tmp_path, names):
+    jobs = []
+    for name in names:
+        input_path = tmp_path / "input" / name
+        input_path.parent.mkdir(exist_ok=True)
+        input_path.write_bytes(name.encode())
+        output_path = tmp_path / "output" / name
+        jobs.append(create_job(str(input_path), "nu", ".png", str(output_path)))
+    return jobs
+
+
+def finish(journal, job, status, write_output=True):
+    job["status"] = status
+    if write_output:
+        os.makedirs(os.path.dirname(job["output_path"]), exist_ok=True)
+        with open(job["output_path"], "wb") as f:
+            f.write(b"masked")
+    key = get_journal_key(sha256_file(job["input_path"]), get_template_set_version("nu"))
+    journal.append(key, job)
+    return key
+
+
+def test_only_passed_entries_with_their_output_are_skipped(tmp_path):
+    journal = Journal(str(tmp_path / "output"))
+    finished = create_jobs(tmp_path, ["passed.png", "deleted.png", "failed.png"])
+    finish(journal, finished[0], STATUS_PASSED)
+    finish(journal, finished[1], STATUS_PASSED, write_output=False)
+    finish(journal, finished[2], STATUS_ERROR)
+
+    # a new run over the same files, plus one never processed
+    jobs = create_jobs(tmp_path, ["passed.png", "deleted.png", "failed.png", "new.png"])
+    pending = prepare_resume(jobs, Journal(str(tmp_path / "output")))
+
+    assert [os.path.basename(job["input_path"]) for job in pending] == [
+        "deleted.png",
+        "failed.png",
+        "new.png",
+    ]
+    assert jobs[0]["status"] == STATUS_SKIPPED
+    assert all(job["status"] is None for job in pending)
+    assert all(job["journal_key"] for job in jobs)
+
+
+def test_changed_input_is_processed_again(tmp_path):
+    journal = Journal(str(tmp_path / "output"))
+    (job,) = create_jobs(tmp_path, ["receipt.png"])
+    finish(journal, job, STATUS_PASSED)
+
+    (job,) = create_jobs(tmp_path, ["receipt.png"])
+    with open(job["input_path"], "ab") as f:
+        f.write(b"edited")
+    assert prepare_resume([job], Journal(str(tmp_path / "output"))) == [job]
+
+
+def test_no_resume_processes_everything(tmp_path):
+    journal = Journal(str(tmp_path / "output"))
+    (job,) = create_jobs(tmp_path, ["receipt.png"])
+    finish(journal, job, STATUS_PASSED)
+
+    (job,) = create_jobs(tmp_path, ["receipt.png"])
+    assert prepare_resume([job], journal, resume=False) == [job]
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    journal = Journal(str(tmp_path / "output"))
+    (job,) = create_jobs(tmp_path, ["receipt.png"])
+    key = finish(journal, job, STATUS_PASSED)
+    # a run killed while appending
+    with open(tmp_path / "output" / JOURNAL_FILE_NAME, "a", encoding="utf-8") as f:
+        f.write('{"key": "abc", "sta')
+
+    reloaded = Journal(str(tmp_path / "output"))
+    assert len(reloaded.entries) == 1
+    assert reloaded.is_completed(key)
@@ -0,0 +1,69 @@
+# python -m pytest tests
+import pytest
+
+from src.usecases.local_guardrails import is_valid_cnpj, is_valid_cpf, scan_lines
+
+
+@pytest.mark.parametrize("digits", ["52998224725", "11144477735", "39053344705"])
+def test_valid_cpfs(digits):
+    assert is_valid_cpf(digits)
+
+
+@pytest.mark.parametrize(
+    "digits",
+    [
+        "52998224724",  # wrong second check digit
+        "52998224715",  # wrong first check digit
+        "11111111111",  # repeated digits pass the checksum but are not issued
+        "5299822472",  # too short
+        "529982247250",  # too long
+    ],
+)
+def test_invalid_cpfs(digits):
+    assert not is_valid_cpf(digits)
+
+
+@pytest.mark.parametrize("digits", ["11222333000181", "00000000000191", "18236120000158"])
+def test_valid_cnpjs(digits):
+    assert is_valid_cnpj(digits)
+
+
+@pytest.mark.parametrize(
+    "digits",
+    [
+        "11222333000182",  # wrong second check digit
+        "11222333000191",  # wrong first check digit
+        "00000000000000",  # repeated digits
+        "1122233300018",  # too short
+        "112223330001810",  # too long
+    ],
+)
+def test_invalid_cnpjs(digits):
+    assert not is_valid_cnpj(digits)
+
+
+def test_formatted_valid_cpf_is_a_leak():
+    leaks, _ = scan_lines(["CPF: 529.982.247-25"])
+    assert "CPF" in leaks
+
+
+def test_cpf_with_invalid_check_digits_is_not_a_leak():
+    # an ID or a value with the shape of a CPF
+    leaks, _ = scan_lines(["Autenticação 529.982.247-24"])
+    assert "CPF" not in leaks
+
+
+def test_partially_hidden_cpf_is_a_leak():
+    leaks, _ = scan_lines(["CPF ***.982.247-**"])
+    assert "CPF_PARCIAL" in leaks
+    assert "CPF" not in leaks
+
+
+def test_cnpj_of_the_institution_is_not_suspect():
+    _, suspects = scan_lines(["Nu Pagamentos S.A.", "CNPJ 18.236.120/0001-58"])
+    assert "CNPJ" not in suspects
+
+
+def test_cnpj_of_a_company_is_suspect():
+    _, suspects = scan_lines(["Destino", "CNPJ 11.222.333/0001-81"])
+    assert "CNPJ" in suspects
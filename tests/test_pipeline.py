@@ -0,0 +1,66 @@
+# python -m pytest tests
+import threading
+
+from src.usecases import pipeline
+from src.usecases.pipeline import (
+    STATUS_ERROR,
+    STATUS_PASSED,
+    create_job,
+    run_pipeline,
+)
+
+ONE_WORKER = {"match": 1, "mask": 1, "verify": 1, "guardrails": 1}
+
+
+def passing_stage(job, options):
+    job["status"] = STATUS_PASSED
+
+
+def failing_stage(job, options):
+    if job["input_path"].startswith("bad"):
+        raise ValueError("stage failed")
+
+
+class BrokenJournal:
+    def append(self, key, job):
+        raise OSError("disk full")
+
+
+def run_in_thread(jobs, options):
+    # a pipeline that lost its workers never returns, the test must not hang
+    thread = threading.Thread(
+        target=run_pipeline, args=(jobs, options, ONE_WORKER, 1), daemon=True
+    )
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "pipeline stopped moving"
+
+
+def create_jobs(names):
+    return [create_job(name, "nu", ".png", f"output/{name}") for name in names]
+
+
+def test_stage_errors_mark_only_their_jobs(monkeypatch):
+    monkeypatch.setattr(
+        pipeline,
+        "STAGES",
+        [("match", failing_stage), ("mask", passing_stage)],
+    )
+    jobs = create_jobs(["bad-1.png", "good-1.png", "bad-2.png", "good-2.png"])
+    run_in_thread(jobs, {})
+    assert [job["status"] for job in jobs] == [
+        STATUS_ERROR,
+        STATUS_PASSED,
+        STATUS_ERROR,
+        STATUS_PASSED,
+    ]
+
+
+def test_journal_errors_do_not_stop_the_workers(monkeypatch):
+    monkeypatch.setattr(pipeline, "STAGES", [("match", passing_stage)])
+    jobs = create_jobs([f"{index}.png" for index in range(6)])
+    for job in jobs:
+        job["journal_key"] = job["input_path"]
+    run_in_thread(jobs, {"journal": BrokenJournal()})
+    assert [job["status"] for job in jobs] == [STATUS_ERROR] * 6
+    assert all(job["receipt"] is None for job in jobs)
@@ -0,0 +1,40 @@
+# python -m pytest tests
+import numpy as np
+
+from src.usecases.registration import warp_coordinates
+
+# reference shifted 5px right and 7px down in the input
+SHIFT = np.array([[1.0, 0.0, 5.0], [0.0, 1.0, 7.0]])
+
+
+def test_only_first_page_rects_are_warped():
+    coordinates = [
+        {"x": 10, "y": 20, "width": 30, "height": 10},
+        {"x": 10, "y": 20, "width": 30, "height": 10, "page": 1},
+        {"x": 50, "y": 60, "width": 5, "height": 5, "page": 0, "label": "valor"},
+    ]
+    warped = warp_coordinates(coordinates, SHIFT, (200, 100), None)
+    assert warped == [
+        {"x": 15, "y": 27, "width": 30, "height": 10},
+        {"x": 10, "y": 20, "width": 30, "height": 10, "page": 1},
+        {"x": 55, "y": 67, "width": 5, "height": 5, "page": 0, "label": "valor"},
+    ]
+
+
+def test_normalized_coordinates_stay_normalized_to_the_input():
+    coordinates = {
+        "format": "normalized",
+        "rects": [
+            {"x": 0.1, "y": 0.2, "width": 0.3, "height": 0.1},
+            {"x": 0.5, "y": 0.5, "width": 0.1, "height": 0.1, "page": 2},
+        ],
+    }
+    # reference 200x100, input twice as large
+    scale = np.array([[2.0, 0.0, 0.0], [0.0, 2.0, 0.0]])
+    warped = warp_coordinates(coordinates, scale, (200, 100), (400, 200))
+    assert warped["format"] == "normalized"
+    assert np.allclose(
+        [warped["rects"][0][key] for key in ("x", "y", "width", "height")],
+        [0.1, 0.2, 0.3, 0.1],
+    )
+    assert warped["rects"][1] == coordinates["rects"][1]
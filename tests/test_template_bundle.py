@@ -0,0 +1,38 @@
+# python -m pytest tests
+import json
+import os
+
+import cv2
+import numpy as np
+
+from src.usecases.template_bundle import load_bundle_templates
+
+
+def write_template(bank_dir, coordinates, mtime_ns):
+    json_path = os.path.join(bank_dir, "coordinates_output_1.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(coordinates, f)
+    os.utime(json_path, ns=(mtime_ns, mtime_ns))
+
+
+def test_edited_coordinates_are_used_by_the_next_load(tmp_path):
+    coordinates_dir = str(tmp_path / "coordinates")
+    bundle_dir = str(tmp_path / "template_bundle")
+    bank_dir = os.path.join(coordinates_dir, "nu")
+    os.makedirs(bank_dir)
+    image = np.random.default_rng(0).integers(0, 256, (120, 80, 3), dtype=np.uint8)
+    cv2.imwrite(os.path.join(bank_dir, "coordinates_output_1.png"), image)
+    first = [{"x": 10, "y": 10, "width": 20, "height": 10}]
+    write_template(bank_dir, first, 1_000_000_000_000_000_000)
+
+    templates = load_bundle_templates("nu", ".png", bundle_dir, coordinates_dir)
+    assert templates[0]["coordinates"] == first
+    # unchanged files: the same records, with everything memoized on them
+    again = load_bundle_templates("nu", ".png", bundle_dir, coordinates_dir)
+    assert again[0] is templates[0]
+
+    second = [{"x": 30, "y": 40, "width": 20, "height": 10}]
+    write_template(bank_dir, second, 1_000_000_000_000_000_001)
+    templates = load_bundle_templates("nu", ".png", bundle_dir, coordinates_dir)
+    assert templates[0]["coordinates"] == second
+    assert templates[0] is not again[0]